@@ -0,0 +1,212 @@
+# app/analytics.py
+# Acumulados de ventas por día: unidades e ingresos por paleta (`sales_daily`) y pedidos
+# creados/atendidos (`orders_daily`). Se mantienen de forma incremental en la misma
+# transacción que crea o atiende los pedidos, así /analytics/sales lee solo filas
+# (día x paleta) y su costo no crece con el historial de `order_items`.
+#
+# Uso:
+#   python -m app.analytics backfill    # recalcula los acumulados desde orders/order_items
+import collections
+import datetime
+import sys
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Date, and_, case, delete, false, func, insert, literal, literal_column, select, true, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .cart import dialect_insert, dialect_name
+
+sales_table = models.SalesDaily.__table__
+orders_daily_table = models.OrdersDaily.__table__
+orders_table = models.Order.__table__
+order_items_table = models.OrderItem.__table__
+
+# Sin rango en la consulta, el reporte cubre los últimos días
+ANALYTICS_DEFAULT_DAYS = 30
+SALES_COLUMNS = ["day", "paleta_id", "nombre", "units", "revenue"]
+# Días por UPDATE de orders_daily al atender (3 parámetros por día; SQLite antiguo admite 999)
+ROLLUP_DAYS_PER_STATEMENT = 200
+
+
+def _order_day():
+    # type_=Date: en SQLite date() devuelve texto y así se lee como `datetime.date`
+    return func.date(orders_table.c.created_at, type_=Date)
+
+
+def _sales_source():
+    day = _order_day()
+    # literal_column: el mismo texto en SELECT y GROUP BY (con un parámetro, PostgreSQL no los empareja)
+    paleta_id = func.coalesce(order_items_table.c.paleta_id, literal_column("0"))
+    return select(
+        day,
+        paleta_id,
+        func.max(order_items_table.c.nombre),
+        func.sum(order_items_table.c.quantity),
+        func.sum(order_items_table.c.quantity * order_items_table.c.precio),
+    ).select_from(
+        order_items_table.join(orders_table, order_items_table.c.order_id == orders_table.c.id)
+    ).group_by(day, paleta_id)
+
+
+def _accumulate(db: AsyncSession, table, columns: List[str], source, keys: List[str], add: List[str], replace=()):
+    # INSERT ... SELECT que suma `add` (y reemplaza `replace`) si la fila del día ya existe
+    stmt = dialect_insert(db)(table).from_select(columns, source)
+    if dialect_name(db) == "mysql":
+        return stmt.on_duplicate_key_update(
+            **{c: table.c[c] + stmt.inserted[c] for c in add},
+            **{c: stmt.inserted[c] for c in replace},
+        )
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c[k] for k in keys],
+        set_={**{c: table.c[c] + stmt.excluded[c] for c in add}, **{c: stmt.excluded[c] for c in replace}},
+    )
+
+
+async def record_order(db: AsyncSession, order_id: int):
+    """
+    Suma un pedido recién creado (con sus ítems ya insertados) a los acumulados de su día.
+    Dos sentencias, sin importar cuántos ítems tenga. No hace commit.
+    """
+    source = _sales_source().where(order_items_table.c.order_id == order_id)
+    await db.execute(_accumulate(
+        db, sales_table, SALES_COLUMNS, source, keys=["day", "paleta_id"], add=["units", "revenue"], replace=["nombre"],
+    ))
+    source = select(_order_day(), literal(1), literal(0)).where(orders_table.c.id == order_id)
+    await db.execute(_accumulate(
+        db, orders_daily_table, ["day", "orders", "attended"], source, keys=["day"], add=["orders", "attended"],
+    ))
+
+
+async def attend_orders(db: AsyncSession, condition) -> List[Tuple[int, int]]:
+    """
+    Marca como atendidos los pedidos pendientes que cumplen `condition` y los suma a
+    `orders_daily.attended`. Devuelve (id, user_id) de los pedidos afectados, por id.
+    Trabaja con columnas, sin cargar objetos ORM. No hace commit.
+
+    Los que ya estaban atendidos no cuentan dos veces: el pedido se reclama con un solo
+    UPDATE condicional (`attended = false`) con RETURNING, así de dos atenciones
+    simultáneas solo una lo recibe, también en SQLite, que ignora FOR UPDATE. Sin
+    UPDATE ... RETURNING (MySQL) las filas se bloquean con SELECT ... FOR UPDATE antes.
+    En ningún caso se mandan los ids de vuelta: el UPDATE usa la misma condición, así un
+    `before` con miles de pendientes no choca con el límite de parámetros.
+    """
+    day = _order_day()
+    pending = and_(condition, orders_table.c.attended == false())
+    if db.get_bind().dialect.update_returning:
+        rows = (await db.execute(
+            update(orders_table).where(pending).values(attended=True)
+            .returning(orders_table.c.id, orders_table.c.user_id, day)
+        )).all()
+        rows.sort()
+    else:
+        rows = (await db.execute(
+            select(orders_table.c.id, orders_table.c.user_id, day)
+            .where(pending)
+            .order_by(orders_table.c.id)
+            .with_for_update()
+        )).all()
+        if rows:
+            # Las filas ya están bloqueadas: la condición vuelve a encontrar exactamente esas
+            await db.execute(update(orders_table).where(pending).values(attended=True))
+    if not rows:
+        return []
+
+    per_day = list(collections.Counter(order_day for _, _, order_day in rows).items())
+    for start in range(0, len(per_day), ROLLUP_DAYS_PER_STATEMENT):
+        chunk = per_day[start:start + ROLLUP_DAYS_PER_STATEMENT]
+        await db.execute(
+            update(orders_daily_table)
+            .where(orders_daily_table.c.day.in_([d for d, _ in chunk]))
+            .values(attended=orders_daily_table.c.attended + case(
+                *[(orders_daily_table.c.day == d, n) for d, n in chunk], else_=0
+            ))
+        )
+    return [(order_id, user_id) for order_id, user_id, _ in rows]
+
+
+async def sales_report(
+    db: AsyncSession,
+    since: Optional[datetime.date] = None,
+    until: Optional[datetime.date] = None,
+    top: int = 10,
+) -> dict:
+    """Ventas por día y paleta, más vendidas y pedidos pendientes/atendidos en [since, until]."""
+    if since is None and until is None:
+        until = datetime.datetime.now(datetime.timezone.utc).date()
+        since = until - datetime.timedelta(days=ANALYTICS_DEFAULT_DAYS - 1)
+
+    def in_range(column):
+        conditions = []
+        if since is not None:
+            conditions.append(column >= since)
+        if until is not None:
+            conditions.append(column <= until)
+        return conditions
+
+    s = sales_table
+    daily = (await db.execute(
+        select(*[s.c[name] for name in SALES_COLUMNS]).where(*in_range(s.c.day)).order_by(s.c.day, s.c.paleta_id)
+    )).all()
+
+    units = func.sum(s.c.units)
+    top_sellers = (await db.execute(
+        select(s.c.paleta_id, func.max(s.c.nombre), units, func.sum(s.c.revenue))
+        .where(*in_range(s.c.day))
+        .group_by(s.c.paleta_id)
+        .order_by(units.desc(), s.c.paleta_id)
+        .limit(top)
+    )).all()
+
+    o = orders_daily_table
+    orders, attended = (await db.execute(
+        select(func.coalesce(func.sum(o.c.orders), 0), func.coalesce(func.sum(o.c.attended), 0))
+        .where(*in_range(o.c.day))
+    )).one()
+
+    return {
+        "since": since,
+        "until": until,
+        "daily": [
+            {"day": r.day, "paleta_id": r.paleta_id or None, "nombre": r.nombre, "units": r.units, "revenue": float(r.revenue)}
+            for r in daily
+        ],
+        "top_sellers": [
+            {"paleta_id": paleta_id or None, "nombre": nombre, "units": int(u), "revenue": float(revenue)}
+            for paleta_id, nombre, u, revenue in top_sellers
+        ],
+        "orders": {"orders": int(orders), "attended": int(attended), "pending": int(orders) - int(attended)},
+        "revenue": round(sum(float(r.revenue) for r in daily), 2),
+        "units": sum(r.units for r in daily),
+    }
+
+
+def backfill(conn: Connection):
+    """Recalcula los acumulados completos desde `orders` y `order_items` (en la transacción de `conn`)."""
+    conn.execute(delete(sales_table))
+    conn.execute(delete(orders_daily_table))
+    conn.execute(insert(sales_table).from_select(SALES_COLUMNS, _sales_source()))
+    day = _order_day()
+    conn.execute(insert(orders_daily_table).from_select(
+        ["day", "orders", "attended"],
+        select(day, func.count(), func.sum(case((orders_table.c.attended == true(), 1), else_=0))).group_by(day),
+    ))
+
+
+def main(argv: List[str]) -> int:
+    from .database import get_engine
+
+    command = argv[0] if argv else "backfill"
+    if command != "backfill":
+        print(f"Comando desconocido: {command}. Usa backfill.")
+        return 2
+    with get_engine().begin() as conn:
+        backfill(conn)
+        days = conn.scalar(select(func.count()).select_from(orders_daily_table))
+    print(f"Acumulados recalculados: {days} días con pedidos.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
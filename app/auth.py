@@ -1,14 +1,17 @@
+import os
 from datetime import datetime, timedelta, timezone
-from typing import Union
+from typing import Optional, Union
 from typing_extensions import Annotated
 import jwt
 from fastapi import Depends, HTTPException, status, APIRouter
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jwt.exceptions import InvalidTokenError
-from passlib.context import CryptContext
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from .database import engine, get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_async_db
+from .cache import TTLCache
+from . import hashing
 from . import models, schemas
 
 # Configuración de JWT
@@ -17,8 +20,16 @@ SECRET_KEY = "906e6aeacebaaeba14354a24cd4859e128e923af411b78679c09aaafe497d268"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# Configuración de Passlib (bcrypt)
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Caché de usuarios ya resueltos (por id) y de tokens ya decodificados.
+# El TTL acota cuánto tarda en verse un cambio hecho desde otro worker.
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAXSIZE = int(os.getenv("USER_CACHE_MAXSIZE", "10000"))
+
+principal_cache = TTLCache(USER_CACHE_MAXSIZE, USER_CACHE_TTL_SECONDS)
+token_cache = TTLCache(USER_CACHE_MAXSIZE, USER_CACHE_TTL_SECONDS)
+
+# Configuración de Passlib (bcrypt); el trabajo pesado corre en `hashing.hash_pool`
+pwd_context = hashing.pwd_context
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
@@ -31,26 +42,51 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     username: Union[str, None] = None
+    user_id: Union[int, None] = None
+    is_admin: bool = False
 
 
-# Funciones de hashing
+# Funciones de hashing (se ejecutan en el pool de bcrypt; 503 si está saturado)
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return hashing.verify_password(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return hashing.hash_password(password)
 
-def get_user(email: str, db: Session):
-    user = db.query(models.User).filter(models.User.email == email).first()
+async def get_user(email: str, db: AsyncSession):
+    user = await db.scalar(select(models.User).where(models.User.email == email).limit(1))
     if not user:
         return []
     return user
 
-def authenticate_user(email: str, password: str, db: Session):
-    user = get_user(email, db)
+def principal_from_user(user: models.User) -> schemas.UserResponse:
+    # Copia desconectada de la sesión, segura para guardar en caché entre peticiones
+    return schemas.UserResponse.model_construct(
+        id=user.id,
+        email=user.email,
+        username=user.username,
+        password=user.password,
+        is_admin=bool(user.is_admin),
+    )
+
+def invalidate_user(user_id: int):
+    # Llamar tras modificar o eliminar un usuario
+    principal_cache.pop(user_id)
+
+def decode_token(token: str) -> dict:
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        # Nunca se guarda más allá de la expiración del propio token
+        remaining = payload.get("exp", 0) - datetime.now(timezone.utc).timestamp()
+        token_cache.set(token, payload, ttl=remaining)
+    return payload
+
+async def authenticate_user(email: str, password: str, db: AsyncSession):
+    user = await get_user(email, db)
     if not user:
         return False
-    if not verify_password(password, user.password):
+    if not await hashing.verify_password_async(password, user.password):
         return False
     return user
 
@@ -65,25 +101,53 @@ def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-# Obtener el usuario actual desde el token
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+async def principal_for_token(token: str, db: AsyncSession) -> Optional[schemas.UserResponse]:
+    """
+    Usuario del token, desde `principal_cache` o la BD. None si el token no es válido
+    (firma, expiración) o el usuario ya no existe.
+    """
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
+        payload = decode_token(token)
     except InvalidTokenError:
-        raise credentials_exception
-    user = get_user(email=token_data.username, db=db)
-    if user is None:
-        raise credentials_exception
-    return user
+        return None
+    username = payload.get("sub")
+    if username is None:
+        return None
+    user_id = payload.get("uid")
+
+    # Camino rápido: el token trae el id del usuario y su registro ya está en caché
+    if user_id is not None:
+        principal = principal_cache.get(user_id)
+        if principal is not None:
+            return principal
+        user = await db.get(models.User, user_id)
+    else:
+        # Tokens emitidos antes de incluir `uid`
+        user = await get_user(email=username, db=db)
+    if not user:
+        return None
+    principal = principal_from_user(user)
+    principal_cache.set(user.id, principal)
+    return principal
+
+async def admin_for_token(token: Optional[str], db: AsyncSession) -> Optional[schemas.UserResponse]:
+    # Para lo que no pasa por OAuth2PasswordBearer (WebSocket, encabezado de perfilado).
+    # Se mira el usuario, no el claim `is_admin`: quien deja de ser admin pierde el acceso
+    if not token:
+        return None
+    principal = await principal_for_token(token, db)
+    return principal if principal is not None and principal.is_admin else None
+
+# Obtener el usuario actual desde el token
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: AsyncSession = Depends(get_async_db)):
+    principal = await principal_for_token(token, db)
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return principal
 
 # Verificar si el usuario está activo
 async def get_current_active_user(current_user: Annotated[schemas.UserResponse, Depends(get_current_user)],):
@@ -94,9 +158,9 @@ async def get_current_active_user(current_user: Annotated[schemas.UserResponse,
 # Endpoint para el login
 @auth.post("/token")
 async def login_for_access_token(
-    form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: Session = Depends(get_db)
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: AsyncSession = Depends(get_async_db)
 ) -> Token:
-    user = authenticate_user(form_data.username, form_data.password, db)
+    user = await authenticate_user(form_data.username, form_data.password, db)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -105,8 +169,10 @@ async def login_for_access_token(
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data={"sub": user.email, "uid": user.id, "is_admin": bool(user.is_admin)},
+        expires_delta=access_token_expires
     )
+    principal_cache.set(user.id, principal_from_user(user))
     return Token(access_token=access_token, token_type="bearer")
 
 
@@ -0,0 +1,206 @@
+# app/broadcast.py
+# Difusión de los cambios de pedidos al panel de cocina (/orders/stream): los endpoints
+# publican un mensaje tras el commit y cada conexión abierta lo recibe de una cola propia,
+# sin volver a consultar la BD.
+#
+# Con varios workers (uvicorn --workers N) cada proceso tiene su propio hub: ORDER_EVENTS_PATH
+# apunta a un archivo SQLite local compartido donde cada worker anota lo que publica y del
+# que lee (cada ORDER_EVENTS_POLL_SECONDS, solo mientras tenga conexiones abiertas) lo que
+# publicaron los demás. Ese archivo no es la BD de la app.
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import List, Optional, Set, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from .serialization import dumps
+
+# Mensajes pendientes por conexión; una conexión que se atrasa más se cierra y el
+# cliente se reconecta (con una foto nueva)
+ORDER_STREAM_QUEUE_SIZE = int(os.getenv("ORDER_STREAM_QUEUE_SIZE", "256"))
+# Cada cuánto una conexión abierta vuelve a comprobar que su usuario sigue siendo admin
+ORDER_STREAM_REAUTH_SECONDS = float(os.getenv("ORDER_STREAM_REAUTH_SECONDS", "60"))
+# Archivo SQLite compartido entre los workers de una máquina; vacío = un solo worker
+ORDER_EVENTS_PATH = os.getenv("ORDER_EVENTS_PATH", "")
+ORDER_EVENTS_POLL_SECONDS = float(os.getenv("ORDER_EVENTS_POLL_SECONDS", "0.25"))
+# Los mensajes más antiguos se borran del archivo
+ORDER_EVENTS_RETENTION_SECONDS = float(os.getenv("ORDER_EVENTS_RETENTION_SECONDS", "60"))
+
+
+def message(event_type: str, **fields) -> str:
+    """
+    Mensaje JSON del stream: {"type": event_type, **fields}. Los valores `bytes` se
+    insertan tal cual (JSON ya codificado, p. ej. el cuerpo de la respuesta del endpoint).
+    """
+    parts = [b'"type":' + dumps(event_type)]
+    for name, value in fields.items():
+        parts.append(dumps(name) + b":" + (value if isinstance(value, bytes) else dumps(value)))
+    return (b"{" + b",".join(parts) + b"}").decode()
+
+
+class Subscription:
+    """Cola de mensajes de una conexión. `get()` devuelve None si la conexión se atrasó."""
+
+    def __init__(self, maxsize: int):
+        self.loop = asyncio.get_running_loop()
+        self.queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue(maxsize)
+        self.lagged = False
+
+    def _put(self, text: str):
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            # Se descarta lo pendiente y se avisa con None: el cliente debe reconectarse
+            self.lagged = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    def deliver(self, text: str):
+        # Las colas de asyncio no son seguras entre hilos/loops
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self._put(text)
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._put, text)
+
+    async def get(self) -> Optional[str]:
+        return await self.queue.get()
+
+
+class SQLiteRelay:
+    """Registro compartido entre workers: (id, origen, mensaje, hora) en un archivo SQLite."""
+
+    # Cada cuántas escrituras se borran los mensajes vencidos
+    PRUNE_EVERY = 100
+
+    def __init__(self, path: str, retention_seconds: float = ORDER_EVENTS_RETENTION_SECONDS):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            # WAL: los workers leen mientras otro escribe
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS order_events ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT NOT NULL, "
+                "message TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def append(self, origin: str, text: str):
+        with self._lock:
+            conn = self._connection()
+            now = time.time()
+            conn.execute(
+                "INSERT INTO order_events (origin, message, created_at) VALUES (?, ?, ?)", (origin, text, now)
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM order_events WHERE created_at < ?", (now - self.retention_seconds,))
+
+    def last_id(self) -> int:
+        with self._lock:
+            return self._connection().execute("SELECT COALESCE(MAX(id), 0) FROM order_events").fetchone()[0]
+
+    def read_since(self, last_id: int) -> List[Tuple[int, str, str]]:
+        # (id, origen, mensaje) posteriores a `last_id`, en orden
+        with self._lock:
+            return self._connection().execute(
+                "SELECT id, origin, message FROM order_events WHERE id > ? ORDER BY id", (last_id,)
+            ).fetchall()
+
+    def close(self):
+        with self._lock:
+            conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
+
+
+class BroadcastHub:
+    """
+    Reparte cada mensaje publicado a todas las suscripciones del proceso y, con `relay`,
+    a las de los demás workers. Publicar codifica el mensaje una sola vez.
+    """
+
+    def __init__(self, relay: Optional[SQLiteRelay] = None, queue_size: int = ORDER_STREAM_QUEUE_SIZE,
+                 poll_seconds: float = ORDER_EVENTS_POLL_SECONDS):
+        self.relay = relay
+        self.queue_size = queue_size
+        self.poll_seconds = poll_seconds
+        self.origin = uuid.uuid4().hex
+        self._subscriptions: Set[Subscription] = set()
+        self._last_id = 0
+        self._poller: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(self) -> Subscription:
+        """
+        Registra una conexión. Con relay, el cursor del archivo se fija antes de volver: lo
+        que se lea de la BD después (la foto inicial) no deja huecos con lo que llegue.
+        """
+        subscription = Subscription(self.queue_size)
+        self._subscriptions.add(subscription)
+        if self.relay is not None and not self._polling():
+            # Sin await entre la comprobación y el arranque: un solo lector por proceso.
+            # MAX(id) sobre la clave primaria de un archivo local no bloquea el loop
+            self._last_id = self.relay.last_id()
+            self._poller = asyncio.create_task(self._poll())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+
+    def deliver(self, text: str):
+        for subscription in list(self._subscriptions):
+            subscription.deliver(text)
+
+    async def publish(self, text: str):
+        """Entrega `text` (ver `message`) en este proceso y lo anota para los demás workers."""
+        self.deliver(text)
+        if self.relay is not None:
+            await run_in_threadpool(self.relay.append, self.origin, text)
+
+    def _polling(self) -> bool:
+        poller = self._poller
+        return poller is not None and not poller.done() and poller.get_loop() is asyncio.get_running_loop()
+
+    async def _poll(self):
+        # Termina cuando el proceso se queda sin conexiones; la próxima lo vuelve a arrancar
+        while self._subscriptions:
+            await asyncio.sleep(self.poll_seconds)
+            for row_id, origin, text in await run_in_threadpool(self.relay.read_since, self._last_id):
+                self._last_id = row_id
+                # Lo publicado por este worker ya se entregó al publicarlo
+                if origin != self.origin:
+                    self.deliver(text)
+
+    async def close(self):
+        poller, self._poller = self._poller, None
+        if poller is not None and poller.get_loop() is asyncio.get_running_loop():
+            poller.cancel()
+        if self.relay is not None:
+            self.relay.close()
+
+
+order_events = BroadcastHub(SQLiteRelay(ORDER_EVENTS_PATH) if ORDER_EVENTS_PATH else None)
@@ -0,0 +1,223 @@
+# app/cache.py
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from fastapi import Request
+from pydantic import TypeAdapter
+
+from . import models, schemas
+from .serialization import join_json_array
+
+_paletas_adapter = TypeAdapter(List[schemas.PaletaInDB])
+
+# Cuerpo JSON ya serializado junto con su ETag fuerte
+CachedBody = Tuple[bytes, str]
+
+# Cada cuánto un worker compara su catálogo en memoria con la BD, para ver las escrituras
+# hechas por otros workers (0 = en cada lectura)
+CATALOG_CHECK_SECONDS = float(os.getenv("CATALOG_CHECK_SECONDS", "5"))
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Indica si el encabezado If-None-Match de la petición coincide con `etag`.
+    Para If-None-Match se usa comparación débil (se ignora el prefijo W/).
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class CatalogCache:
+    """
+    Caché en memoria (por proceso) del catálogo de paletas ya serializado a JSON.
+
+    Guarda la lista completa validada (ordenada por `id`), su JSON y cada paleta
+    por ID como bytes listos para enviar, junto con su ETag (hash del contenido,
+    así coincide entre workers).
+    Las escrituras del catálogo llaman a `bump()`, que incrementa la versión y
+    descarta todo; una carga que empezó con una versión anterior no se guarda.
+    `bump()` solo alcanza al worker que hizo la escritura: `check_fresh()` compara la
+    versión del catálogo en la BD (`catalog_version`, como mucho cada `check_seconds`) con
+    la última vista y descarta la caché si cambió, así los demás workers la ven con ese
+    retraso máximo. El que escribe pasa a `bump()` la versión que dejó su transacción.
+    """
+
+    def __init__(self, check_seconds: float = CATALOG_CHECK_SECONDS):
+        self._lock = threading.Lock()
+        self.check_seconds = check_seconds
+        self._db_version: Optional[int] = None
+        self._next_check = 0.0
+        self.version = 0
+        self._modelos: Optional[List[schemas.PaletaInDB]] = None
+        self._lista: Optional[CachedBody] = None
+        self._codificadas: Optional[Dict[int, bytes]] = None
+        self._por_id: Dict[int, CachedBody] = {}
+
+    def bump(self, db_version: Optional[int] = None) -> int:
+        with self._lock:
+            if db_version is not None:
+                # Ya incluye la escritura propia: la próxima comprobación no recarga de más
+                self._db_version = db_version
+            self.version += 1
+            self._modelos = None
+            self._lista = None
+            self._codificadas = None
+            self._por_id.clear()
+            return self.version
+
+    def recheck(self):
+        # La próxima lectura compara con la BD sin esperar el intervalo
+        with self._lock:
+            self._next_check = 0.0
+
+    async def check_fresh(self, probe: Callable[[], Awaitable[int]]):
+        """
+        Llamar antes de leer de la caché. `probe` devuelve la versión actual del catálogo en la BD.
+        Se toma antes de cargar: un cambio posterior siempre se ve en la siguiente comprobación.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_check:
+                return
+            self._next_check = now + self.check_seconds
+
+        db_version = await probe()
+
+        with self._lock:
+            changed = db_version != self._db_version
+            self._db_version = db_version
+        if changed:
+            self.bump()
+
+    async def get_modelos(self, loader: Callable[[], Awaitable[List[models.Paleta]]]) -> List[schemas.PaletaInDB]:
+        # `loader` debe devolver las paletas ordenadas por id
+        with self._lock:
+            if self._modelos is not None:
+                return self._modelos
+            version = self.version
+
+        paletas = _paletas_adapter.validate_python(await loader(), from_attributes=True)
+
+        with self._lock:
+            if self.version == version:
+                self._modelos = paletas
+        return paletas
+
+    async def get_codificadas(self, loader: Callable[[], Awaitable[List[schemas.PaletaInDB]]]) -> Dict[int, bytes]:
+        # JSON de cada paleta ({id: bytes}, en orden de id); se serializa una vez por versión
+        with self._lock:
+            if self._codificadas is not None:
+                return self._codificadas
+            version = self.version
+
+        codificadas = {p.id: p.model_dump_json().encode() for p in await loader()}
+
+        with self._lock:
+            if self.version == version:
+                self._codificadas = codificadas
+        return codificadas
+
+    async def get_lista(self, loader: Callable[[], Awaitable[List[schemas.PaletaInDB]]]) -> CachedBody:
+        # `loader` devuelve la lista ya validada (normalmente vía `get_modelos`)
+        with self._lock:
+            if self._lista is not None:
+                return self._lista
+            version = self.version
+
+        body = join_json_array((await self.get_codificadas(loader)).values())
+        entry = (body, make_etag(body))
+
+        with self._lock:
+            if self.version == version:
+                self._lista = entry
+        return entry
+
+    async def get_paleta(self, paleta_id: int, loader: Callable[[], Awaitable[Optional[models.Paleta]]]) -> Optional[CachedBody]:
+        with self._lock:
+            entry = self._por_id.get(paleta_id)
+            if entry is not None:
+                return entry
+            version = self.version
+            # Con el catálogo ya serializado no hace falta ir a la BD
+            body = (self._codificadas or {}).get(paleta_id)
+            if body is not None:
+                entry = self._por_id[paleta_id] = (body, make_etag(body))
+                return entry
+
+        paleta = await loader()
+        if paleta is None:
+            return None
+        body = schemas.PaletaInDB.model_validate(paleta, from_attributes=True).model_dump_json().encode()
+        entry = (body, make_etag(body))
+
+        with self._lock:
+            if self.version == version:
+                self._por_id[paleta_id] = entry
+        return entry
+
+
+class TTLCache:
+    """
+    Caché LRU acotada con expiración por entrada. `get` devuelve None si la clave
+    no existe o ya expiró; al superar `maxsize` se descarta la menos usada.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+catalog_cache = CatalogCache()
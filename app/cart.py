@@ -0,0 +1,169 @@
+# app/cart.py
+# Operaciones del carrito como sentencias SQL únicas (sin leer-modificar-escribir en Python)
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import Integer, case, delete, func, insert, literal, or_, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, schemas
+
+# Datos de la paleta que se copian al carrito
+COPIED_COLUMNS = ("nombre", "descripcion", "ingredientes", "precio", "imagen_url", "tiene_oferta", "texto_oferta")
+
+cart_table = models.CartItem.__table__
+paletas_table = models.Paleta.__table__
+order_items_table = models.OrderItem.__table__
+
+# Columnas que pasan tal cual de `cart_items` a `order_items` al confirmar el pedido
+ORDER_ITEM_COLUMNS = ("paleta_id", "quantity", "nombre", "descripcion", "ingredientes", "precio", "imagen_url")
+
+RETURNED_COLUMNS = [cart_table.c[name] for name in ("id", "user_id", "paleta_id", "quantity", *COPIED_COLUMNS)]
+
+_DIALECT_INSERTS = {"mysql": mysql.insert, "sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def dialect_name(db: AsyncSession) -> str:
+    return db.get_bind().dialect.name
+
+
+def dialect_insert(db: AsyncSession):
+    # INSERT con soporte de upsert propio de cada motor
+    name = dialect_name(db)
+    if name not in _DIALECT_INSERTS:
+        raise NotImplementedError(f"Upsert no soportado para el motor '{name}'")
+    return _DIALECT_INSERTS[name]
+
+
+def _upsert_statement(db: AsyncSession, user_id: int, quantities: Dict[int, int], replace: bool):
+    """
+    INSERT ... SELECT desde `paletas` para todas las paletas de `quantities` ({paleta_id: cantidad}).
+    Si la fila (user_id, paleta_id) ya existe, suma la cantidad (o la reemplaza con `replace`)
+    y refresca los datos copiados. Las paletas que no existen simplemente no se insertan.
+    """
+    source = select(
+        literal(user_id, Integer),
+        paletas_table.c.id,
+        case(quantities, value=paletas_table.c.id, else_=0),
+        *[paletas_table.c[name] for name in COPIED_COLUMNS],
+    ).where(paletas_table.c.id.in_(list(quantities)))
+    stmt = dialect_insert(db)(cart_table).from_select(["user_id", "paleta_id", "quantity", *COPIED_COLUMNS], source)
+
+    if dialect_name(db) == "mysql":
+        # MySQL no tiene RETURNING: LAST_INSERT_ID(id) deja el id de la fila existente en lastrowid
+        new_quantity = stmt.inserted.quantity if replace else cart_table.c.quantity + stmt.inserted.quantity
+        return stmt.on_duplicate_key_update(
+            id=func.last_insert_id(cart_table.c.id),
+            quantity=new_quantity,
+            **{name: stmt.inserted[name] for name in COPIED_COLUMNS},
+        )
+
+    new_quantity = stmt.excluded.quantity if replace else cart_table.c.quantity + stmt.excluded.quantity
+    return stmt.on_conflict_do_update(
+        index_elements=[cart_table.c.user_id, cart_table.c.paleta_id],
+        set_={"quantity": new_quantity, **{name: stmt.excluded[name] for name in COPIED_COLUMNS}},
+    )
+
+
+async def upsert_cart_item(db: AsyncSession, user_id: int, paleta_id: int, quantity: int) -> Optional[dict]:
+    """
+    Agrega `quantity` unidades de una paleta del catálogo al carrito en una sola sentencia.
+    Devuelve la fila resultante, o None si la paleta no existe.
+    """
+    stmt = _upsert_statement(db, user_id, {paleta_id: quantity}, replace=False)
+
+    if dialect_name(db) == "mysql":
+        result = await db.execute(stmt)
+        if result.rowcount:
+            row_filter = cart_table.c.id == result.lastrowid
+        else:
+            # 0 filas no significa que falte la paleta: ON DUPLICATE KEY UPDATE también da 0
+            # cuando la fila existente queda igual (p. ej. quantity=0)
+            if await db.scalar(select(paletas_table.c.id).where(paletas_table.c.id == paleta_id)) is None:
+                return None
+            row_filter = (cart_table.c.user_id == user_id) & (cart_table.c.paleta_id == paleta_id)
+        row = (await db.execute(select(*RETURNED_COLUMNS).where(row_filter))).one()
+        return row._asdict()
+
+    row = (await db.execute(stmt.returning(*RETURNED_COLUMNS))).one_or_none()
+    return row._asdict() if row is not None else None
+
+
+async def insert_custom_item(db: AsyncSession, values: dict) -> dict:
+    # Paleta personalizada (paleta_id NULL): cada una es una línea nueva del carrito
+    result = await db.execute(insert(cart_table).values(**values))
+    return {**values, "id": result.inserted_primary_key[0]}
+
+
+def reduce_operations(operations: Iterable[schemas.CartOperation]) -> Tuple[Dict[int, int], Dict[int, int]]:
+    """
+    Reduce la lista de operaciones, en orden, a un cambio final por paleta:
+    `absolutes` ({paleta_id: cantidad final}, 0 = quitar) para las que terminan en `set`/`remove`
+    y `deltas` ({paleta_id: +/- unidades}) para las que solo suman o restan.
+    """
+    absolutes: Dict[int, int] = {}
+    deltas: Dict[int, int] = {}
+    for operation in operations:
+        paleta_id, quantity = operation.paleta_id, operation.quantity
+        if operation.op in ("set", "remove"):
+            absolutes[paleta_id] = quantity if operation.op == "set" else 0
+            deltas.pop(paleta_id, None)
+            continue
+        step = quantity if operation.op == "add" else -quantity
+        if paleta_id in absolutes:
+            absolutes[paleta_id] = max(absolutes[paleta_id] + step, 0)
+        else:
+            deltas[paleta_id] = deltas.get(paleta_id, 0) + step
+    return absolutes, {pid: d for pid, d in deltas.items() if d}
+
+
+async def apply_cart_operations(db: AsyncSession, user_id: int, operations: Iterable[schemas.CartOperation]):
+    """
+    Aplica las operaciones con SQL por conjuntos: como máximo un upsert de reemplazo,
+    un upsert de suma, un UPDATE de resta y un DELETE, sin importar cuántas líneas haya.
+    No hace commit.
+    """
+    absolutes, deltas = reduce_operations(operations)
+    to_set = {pid: q for pid, q in absolutes.items() if q > 0}
+    to_remove = [pid for pid, q in absolutes.items() if q == 0]
+    to_add = {pid: d for pid, d in deltas.items() if d > 0}
+    to_decrease = {pid: d for pid, d in deltas.items() if d < 0}
+
+    if to_set:
+        await db.execute(_upsert_statement(db, user_id, to_set, replace=True))
+    if to_add:
+        await db.execute(_upsert_statement(db, user_id, to_add, replace=False))
+    if to_decrease:
+        await db.execute(
+            update(cart_table)
+            .where(cart_table.c.user_id == user_id, cart_table.c.paleta_id.in_(list(to_decrease)))
+            .values(quantity=cart_table.c.quantity + case(to_decrease, value=cart_table.c.paleta_id, else_=0))
+        )
+    if to_remove or to_decrease:
+        await db.execute(
+            delete(cart_table).where(
+                cart_table.c.user_id == user_id,
+                or_(cart_table.c.paleta_id.in_(to_remove), cart_table.c.quantity <= 0),
+            )
+        )
+
+
+async def move_cart_to_order(db: AsyncSession, user_id: int, order_id: int) -> int:
+    """
+    Copia todo el carrito del usuario a `order_items` con un INSERT ... SELECT y lo vacía
+    con un único DELETE. Devuelve cuántas líneas se copiaron. No hace commit.
+
+    En MySQL/InnoDB el INSERT ... SELECT bloquea las filas leídas de `cart_items` hasta el
+    commit, así que un /cart/add concurrente espera y no se pierde con el DELETE.
+    """
+    source = select(
+        literal(order_id, Integer),
+        *[cart_table.c[name] for name in ORDER_ITEM_COLUMNS],
+    ).where(cart_table.c.user_id == user_id)
+    result = await db.execute(
+        insert(order_items_table).from_select(["order_id", *ORDER_ITEM_COLUMNS], source)
+    )
+    if not result.rowcount:
+        return 0
+    await db.execute(delete(cart_table).where(cart_table.c.user_id == user_id))
+    return result.rowcount
@@ -0,0 +1,268 @@
+# app/compression.py
+# Compresión de respuestas (zstd, Brotli o gzip según Accept-Encoding).
+#
+# - Solo tipos de texto (JSON, NDJSON, CSV, HTML, JS, CSS, SVG) y a partir de un tamaño mínimo.
+# - Las respuestas con ETag fuerte (catálogo, paletas, archivos estáticos) tienen el mismo
+#   contenido mientras no cambie el ETag: su forma comprimida se guarda y se reutiliza.
+# - Los cuerpos grandes sin ETag se comprimen en el threadpool, fuera del event loop.
+# - Las respuestas en streaming (exportación) se comprimen por partes, sin juntarlas.
+#
+# Brotli y zstd son opcionales (paquetes `brotli` y `zstandard`); gzip siempre está disponible.
+import gzip
+import os
+import zlib
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .cache import TTLCache
+
+try:
+    import brotli
+except ImportError:  # Brotli es opcional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstd es opcional
+    zstandard = None
+
+# Cuerpos más chicos no se comprimen (los encabezados y el CPU cuestan más que lo que se ahorra)
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# A partir de este tamaño la compresión corre en el threadpool
+COMPRESSION_THREAD_MIN_SIZE = int(os.getenv("COMPRESSION_THREAD_MIN_SIZE", str(64 * 1024)))
+# Respuestas en varias partes con Content-Length hasta este tamaño (p. ej. archivos estáticos)
+# se juntan para comprimirlas una vez y cachearlas; las más grandes se comprimen por partes
+COMPRESSION_BUFFER_MAX = int(os.getenv("COMPRESSION_BUFFER_MAX", str(1024 * 1024)))
+# Codificaciones en orden de preferencia del servidor
+COMPRESSION_ENCODINGS = [e.strip() for e in os.getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",") if e.strip()]
+COMPRESSION_CACHE_ENTRIES = int(os.getenv("COMPRESSION_CACHE_ENTRIES", "256"))
+COMPRESSION_CACHE_TTL = float(os.getenv("COMPRESSION_CACHE_TTL", "3600"))
+
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "3"))
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+}
+# Los eventos deben llegar en cuanto se emiten: comprimirlos los retendría en el buffer
+UNCOMPRESSIBLE_TYPES = {"text/event-stream"}
+
+
+class Codec(NamedTuple):
+    compress: Callable[[bytes], bytes]
+    # Compresor incremental con compress(bytes) -> bytes y flush() -> bytes
+    stream: Callable[[], object]
+
+
+class _BrotliStream:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+def _codecs() -> Dict[str, Codec]:
+    codecs = {
+        # mtime=0: la misma entrada produce los mismos bytes en todos los workers
+        "gzip": Codec(
+            lambda data: gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0),
+            lambda: zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS),
+        ),
+    }
+    if brotli is not None:
+        codecs["br"] = Codec(lambda data: brotli.compress(data, quality=BROTLI_QUALITY), _BrotliStream)
+    if zstandard is not None:
+        codecs["zstd"] = Codec(
+            lambda data: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data),
+            lambda: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj(),
+        )
+    return codecs
+
+
+CODECS = _codecs()
+
+# (ruta, query, ETag, codificación) -> cuerpo comprimido
+compressed_bodies = TTLCache(maxsize=COMPRESSION_CACHE_ENTRIES, ttl=COMPRESSION_CACHE_TTL)
+
+
+def negotiate(accept_encoding: str, available: List[str]) -> Optional[str]:
+    """
+    Elige la codificación para `Accept-Encoding`: la de mayor q que el servidor soporte y,
+    a igual q, la primera de `available`. None si no hay ninguna aceptable.
+    """
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+
+    best, best_q = None, 0.0
+    for coding in available:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def is_compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in UNCOMPRESSIBLE_TYPES:
+        return False
+    return content_type.startswith("text/") or content_type in COMPRESSIBLE_TYPES
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI de compresión. Solo toca respuestas 200 de tipos de texto; los 304,
+    rangos (206), imágenes y respuestas ya codificadas pasan sin cambios.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_SIZE, encodings: Optional[List[str]] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = [e for e in (encodings or COMPRESSION_ENCODINGS) if e in CODECS]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        resource = (scope["path"], scope.get("query_string", b""))
+        await self.app(scope, receive, _CompressingSend(send, encoding, self.minimum_size, resource))
+
+
+class _CompressingSend:
+    # Decide con el primer mensaje del cuerpo: pasar sin cambios, juntar el cuerpo completo
+    # (y comprimirlo una vez) o comprimir parte por parte
+
+    def __init__(self, send: Send, encoding: str, minimum_size: int, resource: Tuple[str, bytes] = ("", b"")):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.resource = resource
+        self.start: Optional[Message] = None
+        self.mode: Optional[str] = None  # "pass", "buffer" o "stream"
+        self.chunks: List[bytes] = []
+        self.compressor = None
+
+    async def __call__(self, message: Message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            if message["status"] != 200 or not is_compressible(Headers(raw=message["headers"])):
+                self.mode = "pass"
+                await self.send(message)
+            return
+
+        if self.mode == "pass":
+            await self.send(message)
+            return
+        if message["type"] != "http.response.body":
+            # Otras extensiones (p. ej. pathsend): se envían tal cual
+            await self._send_start(compressed=False)
+            self.mode = "pass"
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.mode is None:
+            if not more_body:
+                await self._send_whole(body)
+                return
+            length = Headers(raw=self.start["headers"]).get("content-length")
+            if length is not None and int(length) <= COMPRESSION_BUFFER_MAX:
+                self.mode = "buffer"
+            else:
+                self.mode = "stream"
+                self.compressor = CODECS[self.encoding].stream()
+                await self._send_start(compressed=True, length=None)
+
+        if self.mode == "buffer":
+            self.chunks.append(body)
+            if not more_body:
+                await self._send_whole(b"".join(self.chunks))
+            return
+
+        data = self.compressor.compress(body)
+        if not more_body:
+            data += self.compressor.flush()
+        if data or not more_body:
+            await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    async def _send_whole(self, body: bytes):
+        if len(body) < self.minimum_size:
+            await self._send_start(compressed=False)
+            await self.send({"type": "http.response.body", "body": body})
+            return
+        compressed = await self._compress(body)
+        if len(compressed) >= len(body):
+            await self._send_start(compressed=False)
+            await self.send({"type": "http.response.body", "body": body})
+            return
+        await self._send_start(compressed=True, length=len(compressed))
+        await self.send({"type": "http.response.body", "body": compressed})
+
+    async def _compress(self, body: bytes) -> bytes:
+        # Con ETag fuerte el contenido se identifica por el ETag de su ruta: se comprime una
+        # sola vez. El ETag solo no basta: el de StaticFiles es md5(mtime-tamaño) y dos
+        # archivos distintos con la misma fecha y tamaño lo comparten
+        etag = Headers(raw=self.start["headers"]).get("etag")
+        key = (*self.resource, etag, self.encoding) if etag and not etag.startswith("W/") else None
+        if key is not None:
+            cached = compressed_bodies.get(key)
+            if cached is not None:
+                return cached
+        compress = CODECS[self.encoding].compress
+        if len(body) >= COMPRESSION_THREAD_MIN_SIZE:
+            compressed = await run_in_threadpool(compress, body)
+        else:
+            compressed = compress(body)
+        if key is not None:
+            compressed_bodies.set(key, compressed)
+        return compressed
+
+    async def _send_start(self, compressed: bool, length: Optional[int] = None):
+        message = self.start
+        headers = MutableHeaders(raw=list(message["headers"]))
+        # La respuesta depende de Accept-Encoding aunque esta vez no se haya comprimido
+        headers.add_vary_header("Accept-Encoding")
+        if compressed:
+            headers["Content-Encoding"] = self.encoding
+            if length is None:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(length)
+            # Otra representación, mismo contenido: ETag débil. If-None-Match lo sigue
+            # aceptando (comparación débil) y el 304 funciona igual
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = "W/" + etag
+        await self.send({**message, "headers": headers.raw})
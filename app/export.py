@@ -0,0 +1,113 @@
+# app/export.py
+# Exportación del historial de pedidos en streaming (NDJSON o CSV) para contabilidad.
+# Las filas se leen con un cursor del lado del servidor y se escriben conforme llegan:
+# la memoria no crece con el número de pedidos.
+import csv
+import datetime
+import io
+import json
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from . import models
+
+# Filas que trae el driver en cada vuelta del cursor
+EXPORT_BATCH_SIZE = 1000
+# Tamaño aproximado de cada trozo de CSV enviado al cliente
+CSV_CHUNK_BYTES = 64 * 1024
+
+ORDER_COLUMNS = ("id", "user_id", "created_at", "attended")
+ITEM_COLUMNS = ("id", "paleta_id", "quantity", "nombre", "descripcion", "ingredientes", "precio", "imagen_url")
+
+# Encabezado del CSV: una fila por ítem, con los datos del pedido repetidos
+CSV_HEADER = [f"order_{name}" for name in ORDER_COLUMNS] + [f"item_{name}" for name in ITEM_COLUMNS]
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def export_statement(since: Optional[datetime.datetime] = None, until: Optional[datetime.datetime] = None):
+    # Pedidos con sus ítems (LEFT JOIN: también salen los pedidos sin ítems), en orden de pedido
+    order_table, item_table = models.Order.__table__, models.OrderItem.__table__
+    stmt = (
+        select(
+            *[order_table.c[name].label(f"order_{name}") for name in ORDER_COLUMNS],
+            *[item_table.c[name].label(f"item_{name}") for name in ITEM_COLUMNS],
+        )
+        .select_from(order_table.outerjoin(item_table, item_table.c.order_id == order_table.c.id))
+        .order_by(order_table.c.id, item_table.c.id)
+    )
+    if since is not None:
+        stmt = stmt.where(order_table.c.created_at >= since)
+    if until is not None:
+        stmt = stmt.where(order_table.c.created_at < until)
+    return stmt
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def _order_line(order: dict) -> bytes:
+    return (json.dumps(order, default=_json_default, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+async def _stream_rows(engine: AsyncEngine, stmt) -> AsyncIterator:
+    # Conexión propia: el generador sigue corriendo después de que termina el endpoint
+    async with engine.connect() as conn:
+        result = await conn.stream(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for row in result:
+            yield row
+
+
+async def stream_ndjson(engine: AsyncEngine, stmt) -> AsyncIterator[bytes]:
+    """
+    Una línea JSON por pedido con la misma forma que `OrderInDB` (incluye `items`).
+    Las filas llegan ordenadas por pedido, así que solo se agrupa el pedido actual.
+    """
+    current = None
+    async for row in _stream_rows(engine, stmt):
+        data = row._mapping
+        if current is None or current["id"] != data["order_id"]:
+            if current is not None:
+                yield _order_line(current)
+            current = {name: data[f"order_{name}"] for name in ORDER_COLUMNS}
+            current["items"] = []
+        if data["item_id"] is not None:
+            item = {name: data[f"item_{name}"] for name in ITEM_COLUMNS}
+            item["order_id"] = current["id"]
+            current["items"].append(item)
+    if current is not None:
+        yield _order_line(current)
+
+
+async def stream_csv(engine: AsyncEngine, stmt) -> AsyncIterator[bytes]:
+    # El encabezado sale antes de la consulta: el cliente recibe el primer byte de inmediato
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> bytes:
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow(CSV_HEADER)
+    yield flush()
+    async for row in _stream_rows(engine, stmt):
+        writer.writerow(["" if value is None else _csv_value(value) for value in row])
+        if buffer.tell() >= CSV_CHUNK_BYTES:
+            yield flush()
+    yield flush()
+
+
+def _csv_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+STREAMERS = {"ndjson": stream_ndjson, "csv": stream_csv}
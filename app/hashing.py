@@ -0,0 +1,150 @@
+# app/hashing.py
+# Hash y verificación de contraseñas (bcrypt) en un pool de trabajadores dedicado,
+# para no bloquear el event loop ni los hilos que atienden peticiones.
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+# Este módulo no importa nada más de `app`: los procesos hijos lo cargan por separado.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# "process" (por defecto) o "thread"
+HASH_POOL_KIND = os.getenv("HASH_POOL", "process")
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Máximo de operaciones en curso + en cola; por encima se responde 503
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(HASH_WORKERS * 8)))
+HASH_RETRY_AFTER_SECONDS = 1
+
+
+def _timed(func: Callable, *args) -> Tuple[object, float]:
+    # Se ejecuta en el trabajador; devuelve también cuándo empezó (para medir la espera en cola)
+    started_at = time.time()
+    return func(*args), started_at
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class HashPool:
+    """
+    Pool acotado para bcrypt. `pending` es la profundidad de la cola (en curso + en espera);
+    cuando llega a `max_pending` las nuevas peticiones se rechazan al instante con 503.
+    """
+
+    def __init__(self, kind: str = HASH_POOL_KIND, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING):
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_wait_seconds = 0.0
+
+    def _get_executor(self) -> Executor:
+        # Se crea al primer uso: importar la app no arranca procesos
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == "thread":
+                        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+                    else:
+                        self._executor = ProcessPoolExecutor(
+                            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                        )
+        return self._executor
+
+    def _submit(self, func: Callable, *args) -> Future:
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Servicio saturado, intenta de nuevo en unos segundos.",
+                    headers={"Retry-After": str(HASH_RETRY_AFTER_SECONDS)},
+                )
+            self.pending += 1
+        submitted_at = time.time()
+        try:
+            future = self._get_executor().submit(_timed, func, *args)
+        except Exception:
+            with self._lock:
+                self.pending -= 1
+            raise
+
+        def _on_done(f: Future):
+            wait = 0.0
+            if not f.cancelled() and f.exception() is None:
+                wait = max(0.0, f.result()[1] - submitted_at)
+            self._done(wait)
+
+        future.add_done_callback(_on_done)
+        return future
+
+    def _done(self, wait: float):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+            self.queue_wait_seconds += wait
+
+    def run(self, func: Callable, *args):
+        # Para endpoints síncronos (ya corren en el threadpool de Starlette)
+        return self._submit(func, *args).result()[0]
+
+    async def run_async(self, func: Callable, *args):
+        result, _ = await asyncio.wrap_future(self._submit(func, *args))
+        return result
+
+    def warm_up(self):
+        # Arranca los trabajadores y carga bcrypt en cada uno
+        for future in [self._get_executor().submit(_hash, "warm-up") for _ in range(self.workers)]:
+            future.result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "queue_wait_seconds": self.queue_wait_seconds,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+hash_pool = HashPool()
+
+
+def hash_password(password: str) -> str:
+    return hash_pool.run(_hash, password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return hash_pool.run(_verify, plain_password, hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    return await hash_pool.run_async(_hash, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await hash_pool.run_async(_verify, plain_password, hashed_password)
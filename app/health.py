@@ -0,0 +1,60 @@
+# app/health.py
+# Estado de arranque del worker y endpoints de salud para el balanceador/orquestador:
+# /healthz (el proceso responde) y /readyz (terminó de calentar y puede recibir tráfico).
+import inspect
+import time
+from typing import Awaitable, Callable, Dict, Optional, Union
+
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+
+
+class Readiness:
+    """Pasos de arranque completados (con su duración en segundos) y si el worker está listo."""
+
+    def __init__(self):
+        self.ready = False
+        self.steps: Dict[str, float] = {}
+        self.error: Optional[str] = None
+
+    def reset(self):
+        self.ready = False
+        self.steps = {}
+        self.error = None
+
+    async def step(self, name: str, func: Callable[[], Union[None, Awaitable[None]]]):
+        started_at = time.perf_counter()
+        try:
+            result = func()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as exc:
+            self.error = f"{name}: {exc}"
+            raise
+        self.steps[name] = round(time.perf_counter() - started_at, 4)
+
+    def snapshot(self) -> dict:
+        data = {"status": "ready" if self.ready else "starting", "steps": dict(self.steps)}
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+readiness = Readiness()
+
+health = APIRouter()
+
+
+@health.get("/healthz", summary="Liveness", description="Responde mientras el proceso esté vivo; no toca la BD.")
+async def healthz():
+    return {"status": "ok"}
+
+
+@health.get(
+    "/readyz",
+    summary="Readiness",
+    description="200 cuando el worker terminó el arranque (BD, pool y cachés calientes); 503 mientras tanto.",
+)
+async def readyz():
+    code = status.HTTP_200_OK if readiness.ready else status.HTTP_503_SERVICE_UNAVAILABLE
+    return JSONResponse(status_code=code, content=readiness.snapshot())
@@ -0,0 +1,201 @@
+# app/images.py
+# Entrega optimizada de las imágenes de static/images: nombres con hash del contenido
+# (se pueden cachear para siempre), miniaturas por ancho y variantes WebP.
+#
+# Las variantes se generan con Pillow al pedirse por primera vez y se guardan en disco;
+# `python -m app.images` las genera todas de antemano (p. ej. en el despliegue).
+# Sin Pillow instalado se sirve siempre el original, con los mismos nombres y cabeceras.
+import hashlib
+import os
+import re
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow es opcional
+    Image = None
+    ImageOps = None
+
+IMAGES_DIR = Path(os.getenv("IMAGES_DIR", "static/images"))
+IMAGE_CACHE_DIR = Path(os.getenv("IMAGE_CACHE_DIR", str(IMAGES_DIR / ".variants")))
+# Anchos disponibles; un `?w=` se redondea hacia arriba al siguiente de la lista
+IMAGE_WIDTHS = tuple(sorted(int(w) for w in os.getenv("IMAGE_WIDTHS", "160,320,640,1280").split(",")))
+
+IMAGE_URL_PREFIX = "/images/"
+STATIC_URL_PREFIX = "/static/images/"
+# El nombre lleva el hash: la URL nunca cambia de contenido
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+SOURCE_FORMATS = {".jpg": "jpeg", ".jpeg": "jpeg", ".png": "png", ".webp": "webp"}
+FORMAT_EXTENSIONS = {"jpeg": ".jpg", "png": ".png", "webp": ".webp"}
+MEDIA_TYPES = {"jpeg": "image/jpeg", "png": "image/png", "webp": "image/webp"}
+SAVE_OPTIONS = {
+    "jpeg": {"quality": 82, "optimize": True, "progressive": True},
+    "png": {"optimize": True},
+    "webp": {"quality": 80, "method": 6},
+}
+
+_HASHED_NAME = re.compile(r"^(?P<stem>.+)\.(?P<digest>[0-9a-f]{12})(?P<suffix>\.[A-Za-z0-9]+)$")
+
+
+class SourceImage(NamedTuple):
+    name: str
+    path: Path
+    digest: str
+    format: str
+    width: Optional[int]
+
+    @property
+    def hashed_name(self) -> str:
+        stem, suffix = os.path.splitext(self.name)
+        return f"{stem}.{self.digest}{suffix}"
+
+
+def _digest(path: Path) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+
+def _image_width(path: Path) -> Optional[int]:
+    if Image is None:
+        return None
+    with Image.open(path) as img:
+        return ImageOps.exif_transpose(img).width
+
+
+class ImagePipeline:
+    """
+    Índice de las imágenes originales (nombre -> hash, formato, ancho) y generación
+    de variantes. El índice se arma una vez por proceso; `refresh()` lo vuelve a leer.
+    """
+
+    def __init__(self, images_dir: Path = IMAGES_DIR, cache_dir: Path = IMAGE_CACHE_DIR, widths: Tuple[int, ...] = IMAGE_WIDTHS):
+        self.images_dir = Path(images_dir)
+        self.cache_dir = Path(cache_dir)
+        self.widths = widths
+        self._lock = threading.Lock()
+        self._manifest: Optional[Dict[str, SourceImage]] = None
+
+    @property
+    def can_transform(self) -> bool:
+        return Image is not None
+
+    def manifest(self) -> Dict[str, SourceImage]:
+        if self._manifest is None:
+            with self._lock:
+                if self._manifest is None:
+                    self._manifest = self._scan()
+        return self._manifest
+
+    def refresh(self):
+        with self._lock:
+            self._manifest = None
+
+    def _scan(self) -> Dict[str, SourceImage]:
+        manifest = {}
+        if not self.images_dir.is_dir():
+            return manifest
+        for path in sorted(self.images_dir.iterdir()):
+            fmt = SOURCE_FORMATS.get(path.suffix.lower())
+            if fmt is None or not path.is_file():
+                continue
+            manifest[path.name] = SourceImage(path.name, path, _digest(path), fmt, _image_width(path))
+        return manifest
+
+    def resolve(self, hashed_name: str) -> Optional[SourceImage]:
+        # Solo el hash vigente: un nombre viejo (contenido reemplazado) ya no existe
+        match = _HASHED_NAME.match(hashed_name)
+        if match is None:
+            return None
+        source = self.manifest().get(match["stem"] + match["suffix"])
+        if source is None or source.digest != match["digest"]:
+            return None
+        return source
+
+    def source_for_url(self, imagen_url: Optional[str]) -> Optional[SourceImage]:
+        if not imagen_url or not imagen_url.startswith(STATIC_URL_PREFIX):
+            return None
+        return self.manifest().get(imagen_url[len(STATIC_URL_PREFIX):])
+
+    def public_url(self, source: SourceImage) -> str:
+        return IMAGE_URL_PREFIX + source.hashed_name
+
+    def srcset(self, source: SourceImage) -> Optional[str]:
+        # Solo con Pillow (se necesita el ancho original para saber qué miniaturas existen)
+        if not self.can_transform or source.width is None:
+            return None
+        url = self.public_url(source)
+        widths = [w for w in self.widths if w < source.width] + [source.width]
+        return ", ".join(
+            f"{url}?w={w} {w}w" if w != source.width else f"{url} {w}w" for w in widths
+        )
+
+    def choose(self, source: SourceImage, width: Optional[int], accept: str) -> Tuple[Optional[int], str]:
+        """
+        Variante a servir: (ancho, formato). Ancho None = tamaño original.
+        El ancho pedido se redondea hacia arriba a `widths` para no generar una imagen por cada valor.
+        """
+        if not self.can_transform:
+            return None, source.format
+        if width is not None:
+            width = next((w for w in self.widths if w >= width), self.widths[-1])
+            if source.width is not None and width >= source.width:
+                width = None
+        fmt = "webp" if "image/webp" in accept.lower() else source.format
+        return width, fmt
+
+    def variant_path(self, source: SourceImage, width: Optional[int], fmt: str) -> Path:
+        if width is None and fmt == source.format:
+            return source.path
+        stem = os.path.splitext(source.name)[0]
+        path = self.cache_dir / f"{stem}.{source.digest}.{width or 'full'}{FORMAT_EXTENSIONS[fmt]}"
+        if not path.exists():
+            self._render(source, width, fmt, path)
+        return path
+
+    def _render(self, source: SourceImage, width: Optional[int], fmt: str, dest: Path):
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        with Image.open(source.path) as img:
+            img = ImageOps.exif_transpose(img)
+            if width is not None and width < img.width:
+                height = max(1, round(img.height * width / img.width))
+                img = img.resize((width, height), Image.LANCZOS)
+            if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            # Se escribe a un temporal y se renombra: nadie ve un archivo a medias. El temporal
+            # es único por llamada: dos hilos pueden generar la misma variante a la vez
+            fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix=f".{dest.name}.", suffix=".tmp")
+            os.close(fd)
+            try:
+                img.save(tmp, format=fmt.upper(), **SAVE_OPTIONS[fmt])
+                os.replace(tmp, dest)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+
+    def build_all(self) -> List[Path]:
+        # Todas las variantes (cada ancho en formato original y WebP)
+        paths = []
+        for source in self.manifest().values():
+            for width in [w for w in self.widths if source.width is None or w < source.width] + [None]:
+                for fmt in {source.format, "webp"}:
+                    paths.append(self.variant_path(source, width, fmt))
+        return paths
+
+
+image_pipeline = ImagePipeline()
+
+
+if __name__ == "__main__":
+    if not image_pipeline.can_transform:
+        print("Pillow no está instalado: no se generan variantes.")
+        sys.exit(1)
+    generated = image_pipeline.build_all()
+    print(f"{len(generated)} variantes en {image_pipeline.cache_dir}")
@@ -1,331 +1,858 @@
 # app/main.py (Actualizado para el carrito preliminar)
-from fastapi import FastAPI, Depends, HTTPException, status, Query
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, FastAPI, Depends, Header, HTTPException, status, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session, joinedload
-from typing import List, Optional
+from contextlib import asynccontextmanager
+from sqlalchemy import and_, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from starlette.concurrency import run_in_threadpool
+from typing import Awaitable, Callable, List, Optional
+import asyncio
+import datetime
 import os
 
-from .auth import get_current_active_user
+from .auth import admin_for_token, get_current_active_user
 from . import models, schemas
-from .database import engine, get_db
+from .database import (
+    AsyncSessionLocal, dispose_engines, get_async_db, get_async_engine, get_catalog_read_db, get_engine,
+    get_read_db, read_router,
+)
+from .analytics import attend_orders, record_order, sales_report
+from .broadcast import ORDER_STREAM_REAUTH_SECONDS, Subscription, message, order_events
+from .cache import catalog_cache, etag_matches, make_etag
+from .compression import CompressionMiddleware
+from .cart import apply_cart_operations, dialect_insert, dialect_name, insert_custom_item, move_cart_to_order, upsert_cart_item
+from .migrations import MIGRATIONS, current_version, upgrade
+from .export import MEDIA_TYPES, STREAMERS, export_statement
+from .hashing import hash_pool
+from .images import IMMUTABLE_CACHE_CONTROL, MEDIA_TYPES as IMAGE_MEDIA_TYPES, image_pipeline
+from .health import health, readiness
+from .metrics import MetricsMiddleware, instrument_queries, metrics
+from .profiling import ProfilingMiddleware, instrument_slow_queries, slow_log
+from .search import ensure_index, search_index
+from .serialization import FastJSONResponse, encode, join_json_array, model_response, raw_json_response
+from .pagination import MAX_PAGE_SIZE, PAGINATION_DOC, PageParams, cursor_headers, keyset_page, parse_fields, sparse_response
 from .users import users
 from .auth import auth
-# Crea las tablas en la base de datos si no existen
-# Esto creará la tabla 'cart_items_preliminar' también
-if os.getenv("TESTING_ENV") != "True": # <--- AÑADE ESTA CONDICIÓN
-    models.Base.metadata.create_all(bind=engine)
-
-app = FastAPI(
-    title="API de Paletas Ternurin",
-    description="API para gestionar el catálogo de paletas personalizadas y un carrito básico."
-)
 
-app.include_router(users, tags=["users"])
-app.include_router(auth, tags=["auth"])
+# Qué hacer con el esquema al arrancar: "upgrade" (aplica migraciones pendientes),
+# "verify" (falla si faltan migraciones, para cuando las aplica el despliegue) u "off"
+STARTUP_SCHEMA = os.getenv("STARTUP_SCHEMA", "upgrade")
+# Conexiones que se abren al arrancar para no pagar el primer connect en una petición
+POOL_WARM_CONNECTIONS = int(os.getenv("POOL_WARM_CONNECTIONS", "2"))
+# Arranca los trabajadores de bcrypt antes del primer login
+WARM_UP_HASHING = os.getenv("WARM_UP_HASHING", "true").lower() == "true"
+# Fila única de `catalog_version`
+CATALOG_VERSION_ID = 1
 
 # --- Configuración CORS (mantener igual) ---
 origins = [
     "http://localhost:3000",
     "http://localhost:5173",
 ]
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
-
-# --- Montar Directorio de Archivos Estáticos (mantener igual) ---
-app.mount("/static", StaticFiles(directory="static"), name="static")
+router = APIRouter()
 
 # --- Endpoint para obtener todas las paletas (mantener igual) ---
 
-def verify_admin(user: models.User = Depends(get_current_active_user)):
+async def verify_admin(user: schemas.UserResponse = Depends(get_current_active_user)):
     if not user.is_admin:
         raise HTTPException(status_code=403, detail="No autorizado")
     return user
 
 
-@app.get(
+def etag_headers(etag: str) -> dict:
+    # no-cache: el cliente puede guardar la respuesta pero debe revalidarla con If-None-Match
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def conditional_response(request: Request, body: bytes, etag: str) -> Response:
+    # Responde 304 sin cuerpo si el cliente ya tiene esta versión
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=etag_headers(etag))
+    return Response(content=body, media_type="application/json", headers=etag_headers(etag))
+
+
+def catalog_changed(db_version: int) -> int:
+    # Nueva versión del catálogo; las lecturas del catálogo van un rato al primario
+    read_router.mark_write("catalog")
+    return catalog_cache.bump(db_version)
+
+
+def cart_changed(user_id: int):
+    # Las lecturas de ese usuario van un rato al primario (el ETag sale de las filas del carrito)
+    read_router.mark_write(user_id)
+
+
+def catalog_version_bump(db):
+    # UPSERT que suma 1 a la versión del catálogo (la primera escritura crea la fila)
+    table = models.CatalogVersion.__table__
+    stmt = dialect_insert(db)(table).values(id=CATALOG_VERSION_ID, version=1)
+    if dialect_name(db) == "mysql":
+        return stmt.on_duplicate_key_update(version=table.c.version + 1)
+    return stmt.on_conflict_do_update(index_elements=[table.c.id], set_={"version": table.c.version + 1})
+
+
+async def bump_catalog_version(db: AsyncSession) -> int:
+    # Llamar en la misma transacción que la escritura de `paletas`, justo antes del commit:
+    # la fila queda bloqueada hasta el commit y la versión leída es la de esta escritura
+    await db.execute(catalog_version_bump(db))
+    return await db.scalar(
+        select(models.CatalogVersion.version).where(models.CatalogVersion.id == CATALOG_VERSION_ID)
+    )
+
+
+async def refresh_catalog(db: AsyncSession):
+    # Escrituras de otros workers: la versión del catálogo que dejó la última
+    async def db_version():
+        version = await db.scalar(
+            select(models.CatalogVersion.version).where(models.CatalogVersion.id == CATALOG_VERSION_ID)
+        )
+        return version or 0
+
+    await catalog_cache.check_fresh(db_version)
+
+
+async def get_fresh_catalog_db(db: AsyncSession = Depends(get_catalog_read_db)):
+    # Sesión de lectura del catálogo con la caché ya comprobada contra la BD
+    await refresh_catalog(db)
+    return db
+
+
+async def load_catalog(db: AsyncSession) -> List[schemas.PaletaInDB]:
+    # Catálogo validado desde la caché; la consulta solo corre si cambió la versión
+    async def query_paletas():
+        return (await db.scalars(select(models.Paleta).order_by(models.Paleta.id))).all()
+
+    return await catalog_cache.get_modelos(query_paletas)
+
+
+@router.get(
     "/paletas/",
     response_model=List[schemas.PaletaInDB],
     summary="Obtener todas las paletas",
-    description="Devuelve una lista de todas las paletas disponibles en el catálogo."
+    description=(
+        "Devuelve una lista de todas las paletas disponibles en el catálogo. "
+        "Acepta filtros, paginación por cursor (`after`, `limit`) y `fields`; "
+        "si hay más resultados, el siguiente cursor llega en `X-Next-Cursor`."
+    )
 )
-def read_paletas(db: Session = Depends(get_db)):
-    paletas = db.query(models.Paleta).all()
-    if not paletas:
-        return []
-    return paletas
+async def read_paletas(
+    request: Request,
+    tiene_oferta: Optional[bool] = Query(None),
+    precio_min: Optional[float] = Query(None, ge=0),
+    precio_max: Optional[float] = Query(None, ge=0),
+    after: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_fresh_catalog_db),
+):
+    if all(p is None for p in (tiene_oferta, precio_min, precio_max, after, limit, fields)):
+        # Se sirve desde la caché del catálogo; solo se consulta la BD si cambió la versión
+        body, etag = await catalog_cache.get_lista(lambda: load_catalog(db))
+        return conditional_response(request, body, etag)
+
+    # Con filtros se recorre la lista ya validada en memoria, sin ir a la BD
+    selected = parse_fields(fields, schemas.PaletaInDB.model_fields)
+    paletas = [
+        p for p in await load_catalog(db)
+        if (after is None or p.id > after)
+        and (tiene_oferta is None or p.tiene_oferta == tiene_oferta)
+        and (precio_min is None or p.precio >= precio_min)
+        and (precio_max is None or p.precio <= precio_max)
+    ]
+    next_cursor = None
+    if limit is not None and len(paletas) > limit:
+        paletas = paletas[:limit]
+        next_cursor = paletas[-1].id
+    headers = cursor_headers(request, next_cursor)
+    if selected:
+        include = set(selected)
+        return FastJSONResponse(content=[p.model_dump(mode="json", include=include) for p in paletas], headers=headers)
+    # Sin `fields` se reutiliza el JSON ya serializado de cada paleta
+    codificadas = await catalog_cache.get_codificadas(lambda: load_catalog(db))
+    # Si el catálogo cambió después de filtrar, las paletas que ya no existen se omiten
+    return raw_json_response(join_json_array(codificadas[p.id] for p in paletas if p.id in codificadas), headers=headers)
+
+# --- Búsqueda en el catálogo (declaradas antes de /paletas/{paleta_id}) ---
+@router.get(
+    "/paletas/search",
+    response_model=List[schemas.PaletaInDB],
+    summary="Buscar paletas",
+    description="Busca por nombre, descripción e ingredientes, sin distinguir mayúsculas ni acentos. "
+                "Cada palabra puede ser un prefijo; los resultados se ordenan por relevancia."
+)
+async def search_paletas(q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=100), db: AsyncSession = Depends(get_fresh_catalog_db)):
+    index = await ensure_index(catalog_cache.version, lambda: load_catalog(db))
+    codificadas = await catalog_cache.get_codificadas(lambda: load_catalog(db))
+    # Una escritura entre las dos lecturas deja el índice una versión atrás: lo que ya no
+    # está en el catálogo se omite (la próxima búsqueda reconstruye el índice)
+    return raw_json_response(join_json_array(
+        codificadas[p.id] for p in index.search(q, limit) if p.id in codificadas
+    ))
+
+
+@router.get(
+    "/paletas/autocomplete",
+    response_model=List[str],
+    summary="Autocompletar búsqueda de paletas",
+    description="Sugiere palabras del catálogo que empiezan con el texto escrito."
+)
+async def autocomplete_paletas(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=50), db: AsyncSession = Depends(get_fresh_catalog_db)):
+    index = await ensure_index(catalog_cache.version, lambda: load_catalog(db))
+    return index.suggest(q, limit)
+
 
 # --- Endpoint para obtener una paleta por ID (mantener igual) ---
-@app.get(
+@router.get(
     "/paletas/{paleta_id}",
     response_model=schemas.PaletaInDB,
     summary="Obtener una paleta por ID",
     description="Devuelve la información detallada de una paleta específica."
 )
-def read_paleta(paleta_id: int, db: Session = Depends(get_db)):
-    paleta = db.query(models.Paleta).filter(models.Paleta.id == paleta_id).first()
-    if paleta is None:
+async def read_paleta(paleta_id: int, request: Request, db: AsyncSession = Depends(get_fresh_catalog_db)):
+    cached = await catalog_cache.get_paleta(paleta_id, lambda: db.get(models.Paleta, paleta_id))
+    if cached is None:
         raise HTTPException(status_code=404, detail="Paleta no encontrada")
-    return paleta
+    body, etag = cached
+    return conditional_response(request, body, etag)
+
+
+# --- Imágenes optimizadas (nombre con hash, miniaturas y WebP) ---
+@router.get(
+    "/images/{filename}",
+    response_class=FileResponse,
+    summary="Obtener una imagen optimizada",
+    description=(
+        "Sirve la imagen `nombre.<hash>.ext` (ver `imagen_url` de las paletas). `w` pide un ancho máximo "
+        "y, si el cliente acepta `image/webp`, se entrega en WebP. Admite ETag y Range."
+    ),
+)
+async def get_image(filename: str, request: Request, w: Optional[int] = Query(None, ge=1, le=4096)):
+    source = image_pipeline.resolve(filename)
+    if source is None:
+        raise HTTPException(status_code=404, detail="Imagen no encontrada")
+    width, fmt = image_pipeline.choose(source, w, request.headers.get("accept", ""))
+    etag = f'"{source.digest}-{width or "full"}-{fmt}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL, "Vary": "Accept"}
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    # Generar una variante por primera vez usa CPU: fuera del event loop
+    path = await run_in_threadpool(image_pipeline.variant_path, source, width, fmt)
+    return FileResponse(path, media_type=IMAGE_MEDIA_TYPES[fmt], headers=headers)
 
 
 # --- Endpoint para crear una nueva paleta (mantener igual) ---
-@app.post("/paletas/", response_model=schemas.PaletaInDB, status_code=status.HTTP_201_CREATED)
-def create_paleta(paleta_data: schemas.PaletaCreate, db: Session = Depends(get_db), admin: models.User = Depends(verify_admin)):
+@router.post("/paletas/", response_model=schemas.PaletaInDB, status_code=status.HTTP_201_CREATED)
+async def create_paleta(paleta_data: schemas.PaletaCreate, db: AsyncSession = Depends(get_async_db), admin: models.User = Depends(verify_admin)):
     # Verificar si ya existe una paleta con el mismo nombre
-    existing_paleta = db.query(models.Paleta).filter(models.Paleta.nombre == paleta_data.nombre).first()
+    existing_paleta = await db.scalar(select(models.Paleta).where(models.Paleta.nombre == paleta_data.nombre).limit(1))
     if existing_paleta:
         raise HTTPException(status_code=400, detail="Ya existe una paleta con este nombre.")
 
     # Crear la nueva paleta
     new_paleta = models.Paleta(**paleta_data.model_dump())
     db.add(new_paleta)
-    db.commit()
-    db.refresh(new_paleta)
+    db_version = await bump_catalog_version(db)
+    await db.commit()
+    await db.refresh(new_paleta)
+    search_index.upsert(schemas.PaletaInDB.model_validate(new_paleta, from_attributes=True), catalog_changed(db_version))
     return new_paleta
 
 # *--- Endpoint para actualizar una paleta (mantener igual) ---
-@app.put("/paletas/{paleta_id}", response_model=schemas.PaletaResponse)
-def update_paleta(paleta_id: int, paleta_data: schemas.PaletaCreate, db: Session = Depends(get_db), admin: models.User = Depends(verify_admin)):
+@router.put("/paletas/{paleta_id}", response_model=schemas.PaletaResponse)
+async def update_paleta(paleta_id: int, paleta_data: schemas.PaletaCreate, db: AsyncSession = Depends(get_async_db), admin: models.User = Depends(verify_admin)):
     # Buscar la paleta por ID
-    paleta = db.query(models.Paleta).filter(models.Paleta.id == paleta_id).first()
+    paleta = await db.get(models.Paleta, paleta_id)
     if not paleta:
         raise HTTPException(status_code=404, detail="Paleta no encontrada")
 
+    # El nombre es único (uq_paletas_nombre): renombrar a uno existente es un 400, como al crear
+    existing_paleta = await db.scalar(
+        select(models.Paleta.id).where(models.Paleta.nombre == paleta_data.nombre, models.Paleta.id != paleta_id).limit(1)
+    )
+    if existing_paleta:
+        raise HTTPException(status_code=400, detail="Ya existe una paleta con este nombre.")
+
     # Actualizar los campos de la paleta
     for key, value in paleta_data.model_dump().items():
         setattr(paleta, key, value)
 
-    db.commit()
-    db.refresh(paleta)
+    try:
+        db_version = await bump_catalog_version(db)
+        await db.commit()
+    except IntegrityError:
+        # Otra petición tomó el nombre entre la comprobación y el commit
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Ya existe una paleta con este nombre.")
+    await db.refresh(paleta)
+    search_index.upsert(schemas.PaletaInDB.model_validate(paleta, from_attributes=True), catalog_changed(db_version))
     return paleta
 
 # *--- Endpoint para eliminar una paleta (mantener igual) ---
-@app.delete("/paletas/{paleta_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_paleta(paleta_id: int, db: Session = Depends(get_db), admin: models.User = Depends(verify_admin)):
+@router.delete("/paletas/{paleta_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_paleta(paleta_id: int, db: AsyncSession = Depends(get_async_db), admin: models.User = Depends(verify_admin)):
     # Buscar la paleta por ID
-    paleta = db.query(models.Paleta).filter(models.Paleta.id == paleta_id).first()
+    paleta = await db.get(models.Paleta, paleta_id)
     if not paleta:
         raise HTTPException(status_code=404, detail="Paleta no encontrada")
 
     # Eliminar la paleta
-    db.delete(paleta)
-    db.commit()
+    await db.delete(paleta)
+    db_version = await bump_catalog_version(db)
+    await db.commit()
+    search_index.remove(paleta_id, catalog_changed(db_version))
     return JSONResponse(status_code=204, content={"message": "Paleta eliminada exitosamente."})
 
 # * --- NUEVOS ENDPOINTS PARA EL CARRITO PRELIMINAR ---
 
-@app.post("/cart/add", response_model=schemas.CartItemInDB)
-def add_to_cart(item_data: schemas.CartItemCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_active_user)):
+@router.post("/cart/add", response_model=schemas.CartItemInDB)
+async def add_to_cart(item_data: schemas.CartItemCreate, db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(get_current_active_user)):
     if item_data.paleta_id:
-        # Paleta fija, obtener datos desde DB
-        paleta = db.query(models.Paleta).filter(models.Paleta.id == item_data.paleta_id).first()
-        if not paleta:
+        # Paleta fija: una sola sentencia copia sus datos desde `paletas` y suma la cantidad
+        cart_item = await upsert_cart_item(db, item_data.user_id, item_data.paleta_id, item_data.quantity)
+        if cart_item is None:
             raise HTTPException(status_code=404, detail="Paleta no encontrada.")
-        
-        nombre = paleta.nombre
-        descripcion = paleta.descripcion
-        ingredientes = paleta.ingredientes
-        precio = float(paleta.precio)
-        imagen_url = paleta.imagen_url
-        tiene_oferta = paleta.tiene_oferta
-        texto_oferta = paleta.texto_oferta
     else:
         # Paleta personalizada, datos vienen en item_data
-        nombre = item_data.nombre
-        descripcion = item_data.descripcion
-        ingredientes = item_data.ingredientes
-        precio = float(item_data.precio)
-        imagen_url = item_data.imagen_url
-        tiene_oferta = item_data.tiene_oferta or False
-        texto_oferta = item_data.texto_oferta
-
-    # Buscar si el ítem ya está en el carrito para este usuario y paleta (o personalizado)
-    cart_item = db.query(models.CartItem).filter(
-        models.CartItem.user_id == item_data.user_id,
-        models.CartItem.paleta_id == item_data.paleta_id
-    ).first()
-
-    if cart_item:
-        # Actualiza la cantidad y datos por si cambian
-        cart_item.quantity += item_data.quantity
-        cart_item.nombre = nombre
-        cart_item.descripcion = descripcion
-        cart_item.ingredientes = ingredientes
-        cart_item.precio = precio
-        cart_item.imagen_url = imagen_url
-        cart_item.tiene_oferta = tiene_oferta
-        cart_item.texto_oferta = texto_oferta
-        db.add(cart_item)
-        db.commit()
-        db.refresh(cart_item)
-    else:
-        # Crear nuevo item carrito
-        cart_item = models.CartItem(
-            user_id=item_data.user_id,
-            paleta_id=item_data.paleta_id,
-            quantity=item_data.quantity,
-            nombre=nombre,
-            descripcion=descripcion,
-            ingredientes=ingredientes,
-            precio=precio,
-            imagen_url=imagen_url,
-            tiene_oferta=tiene_oferta,
-            texto_oferta=texto_oferta
-        )
-        db.add(cart_item)
-        db.commit()
-        db.refresh(cart_item)
+        cart_item = await insert_custom_item(db, {
+            "user_id": item_data.user_id,
+            "paleta_id": None,
+            "quantity": item_data.quantity,
+            "nombre": item_data.nombre,
+            "descripcion": item_data.descripcion,
+            "ingredientes": item_data.ingredientes,
+            "precio": float(item_data.precio),
+            "imagen_url": item_data.imagen_url,
+            "tiene_oferta": item_data.tiene_oferta or False,
+            "texto_oferta": item_data.texto_oferta,
+        })
+    await db.commit()
+    cart_changed(item_data.user_id)
 
     # Calcular subtotal para la respuesta
-    result = cart_item.__dict__.copy()
-    result["subtotal"] = cart_item.quantity * cart_item.precio
+    cart_item["subtotal"] = cart_item["quantity"] * float(cart_item["precio"])
 
-    return result
+    return cart_item
 
 
-@app.get(
+@router.post(
+    "/cart/{user_id}/batch",
+    response_model=schemas.CartBatchResponse,
+    summary="Aplicar varias operaciones al carrito",
+    description="Aplica en orden una lista de operaciones (add, set, decrease, remove) en una sola "
+                "transacción y devuelve el carrito resultante con sus totales."
+)
+async def batch_update_cart(user_id: int, batch: schemas.CartBatchRequest, db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(get_current_active_user)):
+    # Las paletas a agregar o fijar se validan contra el catálogo en memoria, antes de escribir
+    await refresh_catalog(db)
+    catalog_ids = {p.id for p in await load_catalog(db)}
+    missing = sorted({
+        operation.paleta_id for operation in batch.operations
+        if operation.op in ("add", "set") and operation.paleta_id not in catalog_ids
+    })
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Paletas no encontradas: {', '.join(map(str, missing))}.")
+
+    await apply_cart_operations(db, user_id, batch.operations)
+    await db.commit()
+    cart_changed(user_id)
+
+    items = (await db.scalars(
+        select(models.CartItem).where(models.CartItem.user_id == user_id).order_by(models.CartItem.id)
+    )).all()
+    return {
+        "items": items,
+        "total_items": sum(item.quantity for item in items),
+        "total": sum(item.subtotal for item in items),
+    }
+
+
+@router.get(
     "/cart/{user_id}",
     response_model=List[schemas.CartItemInDB],
     summary="Obtener ítems del carrito de un usuario",
     description="Devuelve todos los ítems en el carrito de un usuario específico."
 )
-def get_user_cart(user_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_active_user)):
-    cart_items = db.query(models.CartItem).filter(models.CartItem.user_id == user_id).all()
-    return cart_items
-
-@app.delete(
+async def get_user_cart(user_id: int, request: Request, db: AsyncSession = Depends(get_read_db), current_user: models.User = Depends(get_current_active_user)):
+    # El ETag es el hash del cuerpo: cambia con cualquier dato de cualquier línea (cantidad,
+    # precio, textos copiados), la haya escrito este worker u otro
+    cart_items = (await db.scalars(
+        select(models.CartItem).where(models.CartItem.user_id == user_id).order_by(models.CartItem.id)
+    )).all()
+    body = encode(List[schemas.CartItemInDB], cart_items)
+    return conditional_response(request, body, make_etag(body))
+
+@router.delete(
     "/cart/remove/{cart_item_id}",
     status_code=status.HTTP_204_NO_CONTENT,
     summary="Eliminar un ítem del carrito",
     description="Elimina un ítem específico del carrito por su ID."
 )
-def remove_from_cart(cart_item_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_active_user)):
-    cart_item = db.query(models.CartItem).filter(models.CartItem.id == cart_item_id).first()
+async def remove_from_cart(cart_item_id: int, db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(get_current_active_user)):
+    cart_item = await db.get(models.CartItem, cart_item_id)
     if not cart_item:
         raise HTTPException(status_code=404, detail="Ítem del carrito no encontrado.")
-    db.delete(cart_item)
-    db.commit()
+    await db.delete(cart_item)
+    await db.commit()
+    cart_changed(cart_item.user_id)
     return JSONResponse(status_code=204, content={"message": "Ítem eliminado del carrito exitosamente."})
 
-@app.patch("/cart/decrease", summary="Disminuir una unidad de una paleta del carrito")
-def decrease_from_cart(user_id: int, paleta_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_active_user)):
-    cart_item = db.query(models.CartItem).filter(
+@router.patch("/cart/decrease", summary="Disminuir una unidad de una paleta del carrito")
+async def decrease_from_cart(user_id: int, paleta_id: int, db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(get_current_active_user)):
+    cart_item = await db.scalar(select(models.CartItem).where(
         models.CartItem.user_id == user_id,
         models.CartItem.paleta_id == paleta_id
-    ).first()
+    ).limit(1))
 
     if not cart_item:
         raise HTTPException(status_code=404, detail="Ítem no encontrado en el carrito.")
 
     if cart_item.quantity > 1:
         cart_item.quantity -= 1
-        db.commit()
-        db.refresh(cart_item)
+        await db.commit()
+        await db.refresh(cart_item)
+        cart_changed(user_id)
         return {"message": "Cantidad actualizada", "item": cart_item}
     else:
-        db.delete(cart_item)
-        db.commit()
+        await db.delete(cart_item)
+        await db.commit()
+        cart_changed(user_id)
         return {"message": "Ítem eliminado porque la cantidad llegó a cero."}
 
-@app.delete("/cart/clear/{user_id}", summary="Limpiar el carrito de un usuario")
-def clear_cart(user_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_active_user)):
-    cart_items = db.query(models.CartItem).filter(models.CartItem.user_id == user_id).all()
+@router.delete("/cart/clear/{user_id}", summary="Limpiar el carrito de un usuario")
+async def clear_cart(user_id: int, db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(get_current_active_user)):
+    cart_items = (await db.scalars(select(models.CartItem).where(models.CartItem.user_id == user_id))).all()
     if not cart_items:
         raise HTTPException(status_code=404, detail="Carrito vacío o no encontrado.")
     
     for item in cart_items:
-        db.delete(item)
+        await db.delete(item)
     
-    db.commit()
+    await db.commit()
+    cart_changed(user_id)
     return JSONResponse(status_code=204, content={"message": "Carrito limpiado exitosamente."})
 
 # * --- ENDPOINTS PARA PEDIDOS ---
+# Los ítems de los pedidos se cargan en lote: una consulta extra (IN sobre los ids de la
+# página) en lugar de una por pedido al serializar `OrderInDB.items`.
+WITH_ITEMS = selectinload(models.Order.items)
+
 # Lista pedidos (opcional filtro)
-@app.get("/orders/all", response_model=List[schemas.OrderInDB])
-def list_orders(attended: Optional[bool] = Query(None), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_active_user)):
-    query = db.query(models.Order)
+def filter_orders(stmt, attended: Optional[bool], since: Optional[datetime.datetime], until: Optional[datetime.datetime]):
     if attended is not None:
-        query = query.filter(models.Order.attended == attended)
-    orders = query.all()
-    return orders
+        stmt = stmt.where(models.Order.attended == attended)
+    if since is not None:
+        stmt = stmt.where(models.Order.created_at >= since)
+    if until is not None:
+        stmt = stmt.where(models.Order.created_at < until)
+    return stmt
+
+
+async def page_orders(request: Request, db: AsyncSession, stmt, page: PageParams):
+    # Con `fields` sin `items` solo se leen las columnas pedidas de `orders`
+    selected = parse_fields(page.fields, schemas.OrderInDB.model_fields)
+    if selected and "items" not in selected:
+        stmt = stmt.with_only_columns(*[getattr(models.Order, f) for f in selected])
+        rows, next_cursor = await keyset_page(db, stmt, models.Order.id, page.after, page.limit, scalars=False)
+        return sparse_response(rows, cursor_headers(request, next_cursor))
+
+    stmt = stmt.options(WITH_ITEMS)
+    orders, next_cursor = await keyset_page(db, stmt, models.Order.id, page.after, page.limit)
+    headers = cursor_headers(request, next_cursor)
+    if selected:
+        content = [
+            schemas.OrderInDB.model_validate(o).model_dump(mode="json", include=set(selected))
+            for o in orders
+        ]
+        return FastJSONResponse(content=content, headers=headers)
+    # Validación y serialización en un paso, sin el segundo pase de `response_model`
+    return model_response(List[schemas.OrderInDB], orders, headers=headers)
+
+
+@router.get(
+    "/orders/all",
+    response_model=List[schemas.OrderInDB],
+    summary="Listar pedidos",
+    description=(
+        "Pedidos de todos los usuarios, filtrables por `attended`, `since` y `until`. " + PAGINATION_DOC
+    ),
+)
+async def list_orders(
+    request: Request,
+    attended: Optional[bool] = Query(None),
+    since: Optional[datetime.datetime] = Query(None),
+    until: Optional[datetime.datetime] = Query(None),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_active_user),
+):
+    stmt = filter_orders(select(models.Order), attended, since, until)
+    return await page_orders(request, db, stmt, page)
+
+
+@router.get(
+    "/orders/export",
+    summary="Exportar pedidos",
+    description=(
+        "Exporta el historial de pedidos en streaming. `ndjson`: una línea por pedido con sus ítems; "
+        "`csv`: una fila por ítem con los datos del pedido. Solo administradores."
+    ),
+    response_class=StreamingResponse,
+)
+async def export_orders(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    since: Optional[datetime.datetime] = Query(None),
+    until: Optional[datetime.datetime] = Query(None),
+    db: AsyncSession = Depends(get_read_db),
+    admin: models.User = Depends(verify_admin),
+):
+    # Se usa el motor de la sesión, no la sesión: la respuesta se sigue enviando
+    # cuando la dependencia ya la cerró
+    stream = STREAMERS[format](db.bind, export_statement(since, until))
+    filename = f"pedidos.{format}"
+    return StreamingResponse(
+        stream,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 # Opcionalmente (para el usuario). Detalle de un pedido.
-@app.get("/orders/oder/{order_id}", response_model=schemas.OrderInDB)
-def get_order(order_id: int, db: Session = Depends(get_db), current_user=Depends(get_current_active_user)):
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
+@router.get("/orders/oder/{order_id}", response_model=schemas.OrderInDB)
+async def get_order(order_id: int, db: AsyncSession = Depends(get_async_db), current_user=Depends(get_current_active_user)):
+    order = await db.get(models.Order, order_id, options=[WITH_ITEMS])
     if not order:
         raise HTTPException(status_code=404, detail="Pedido no encontrado")
-    return order
+    return model_response(schemas.OrderInDB, order)
 
 # 3. Pedidos de un usuario
-@app.get("/orders/user/{user_id}", response_model=List[schemas.OrderInDB])
-def get_orders_by_user(
+@router.get(
+    "/orders/user/{user_id}",
+    response_model=List[schemas.OrderInDB],
+    summary="Pedidos de un usuario",
+    description=(
+        "Pedidos del usuario, con los mismos filtros que /orders/all. " + PAGINATION_DOC
+    ),
+)
+async def get_orders_by_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    attended: Optional[bool] = Query(None),
+    since: Optional[datetime.datetime] = Query(None),
+    until: Optional[datetime.datetime] = Query(None),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_read_db),
     current_user=Depends(get_current_active_user),
 ):
-    orders = db.query(models.Order).filter(models.Order.user_id == user_id).all()
-    return orders
+    stmt = select(models.Order).where(models.Order.user_id == user_id)
+    stmt = filter_orders(stmt, attended, since, until)
+    return await page_orders(request, db, stmt, page)
+
+
+# 4. Panel de cocina en vivo: en lugar de sondear /orders/all?attended=false, una foto de
+# los pedidos pendientes y después los cambios que publican los endpoints
+async def forward_events(
+    websocket: WebSocket, subscription: Subscription, still_admin: Callable[[], Awaitable[bool]]
+):
+    async def forward():
+        while True:
+            text = await subscription.get()
+            if text is None:
+                # Se atrasó: el cliente se reconecta y recibe una foto nueva
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                return
+            await websocket.send_text(text)
+
+    async def until_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    async def reauthorize():
+        # La conexión puede durar horas: se cierra si el usuario deja de ser admin o expira el token
+        while True:
+            await asyncio.sleep(ORDER_STREAM_REAUTH_SECONDS)
+            if not await still_admin():
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                return
+
+    tasks = [asyncio.create_task(f()) for f in (forward, until_disconnect, reauthorize)]
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    for task in done:
+        error = task.exception()
+        if error is not None and not isinstance(error, WebSocketDisconnect):
+            raise error
+
+
+@router.websocket("/orders/stream")
+async def orders_stream(
+    websocket: WebSocket,
+    token: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Mensajes JSON: `snapshot` (`orders`: pedidos pendientes), `order_created` (`order`) y
+    `orders_attended` (`ids`). Un cambio puede llegar también incluido en la foto: el
+    cliente aplica los mensajes por id. Solo administradores; como un navegador no puede
+    mandar Authorization en un WebSocket, el token va en `?token=`.
+    """
+    scheme, _, bearer = websocket.headers.get("authorization", "").partition(" ")
+    token = token or (bearer if scheme.lower() == "bearer" else None)
+    # El usuario se resuelve como en verify_admin (caché de principales o BD), no solo el claim
+    if await admin_for_token(token, db) is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    # Suscrito antes de leer la foto: lo que se confirme mientras tanto llega por la cola
+    subscription = order_events.subscribe()
+    try:
+        stmt = filter_orders(select(models.Order), False, None, None).options(WITH_ITEMS).order_by(models.Order.id)
+        orders = (await db.scalars(stmt)).all()
+        snapshot = message("snapshot", orders=encode(List[schemas.OrderInDB], orders))
+        # La conexión vuelve al pool: el stream puede quedar abierto horas
+        await db.close()
+        await websocket.send_text(snapshot)
+
+        async def still_admin() -> bool:
+            try:
+                return await admin_for_token(token, db) is not None
+            finally:
+                await db.close()
+
+        await forward_events(websocket, subscription, still_admin)
+    finally:
+        order_events.unsubscribe(subscription)
+
+
+# Atender en bloque (hora pico): un UPDATE ... WHERE id IN (...) sin cargar pedidos ni ítems
+@router.patch(
+    "/orders/attend",
+    response_model=schemas.OrderAttendResult,
+    summary="Marcar varios pedidos como atendidos",
+    description=(
+        "Atiende los pedidos pendientes de `ids`, los creados antes de `before` o, con ambos, los "
+        "que cumplen los dos. Devuelve solo los que cambiaron. Solo administradores."
+    ),
+)
+async def attend_orders_bulk(
+    request_data: schemas.OrderAttendRequest,
+    db: AsyncSession = Depends(get_async_db),
+    admin: models.User = Depends(verify_admin),
+):
+    conditions = []
+    if request_data.ids is not None:
+        conditions.append(models.Order.id.in_(request_data.ids))
+    if request_data.before is not None:
+        conditions.append(models.Order.created_at < request_data.before)
+    attended = await attend_orders(db, and_(*conditions))
+    await db.commit()
+
+    ids = [order_id for order_id, _ in attended]
+    for user_id in {user_id for _, user_id in attended}:
+        read_router.mark_write(user_id)
+    if ids:
+        await order_events.publish(message("orders_attended", ids=ids))
+    return {"ids": ids, "count": len(ids)}
 
 
 """
 función o endpoint que permite al administrador (o quien tenga permiso) marcar un pedido como “atendido”, 
 es decir, que ya fue procesado, entregado o cerrado.
 """
-@app.patch("/orders/{order_id}/attend", response_model=schemas.OrderInDB)
-def mark_order_attended(order_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_active_user)):
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
+@router.patch("/orders/{order_id}/attend", response_model=schemas.OrderInDB)
+async def mark_order_attended(order_id: int, db: AsyncSession = Depends(get_async_db), current_user: models.User = Depends(get_current_active_user)):
+    order = await db.get(models.Order, order_id, options=[WITH_ITEMS])
     if not order:
         raise HTTPException(status_code=404, detail="Pedido no encontrado.")
-    order.attended = True
-    db.commit()
-    db.refresh(order)
+    # UPDATE condicional + acumulados: marcarlo otra vez no lo cuenta dos veces
+    attended = await attend_orders(db, models.Order.id == order_id)
+    set_committed_value(order, "attended", True)
+    await db.commit()
+    read_router.mark_write(order.user_id)
+    if attended:
+        await order_events.publish(message("orders_attended", ids=[order_id]))
     return order
 
 
 # Crear pedido (opcional: llamar cuando el usuario confirma compra)
-@app.post("/orders", response_model=schemas.OrderInDB)
-def create_order(user_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_active_user)):
-    # Crear pedido
-    new_order = models.Order(user_id=user_id)
-    db.add(new_order)
-    db.commit()
-    db.refresh(new_order)
-
-    # Obtener ítems del carrito para ese usuario
-    cart_items = db.query(models.CartItem).filter(models.CartItem.user_id == user_id).all()
+async def load_order(db: AsyncSession, order_id: int) -> Optional[models.Order]:
+    return await db.get(models.Order, order_id, options=[WITH_ITEMS], populate_existing=True)
 
-    if not cart_items:
-        raise HTTPException(status_code=400, detail="El carrito está vacío.")
 
-    # Copiar ítems del carrito al pedido
-    for c_item in cart_items:
-        order_item = models.OrderItem(
-            order_id=new_order.id,
-            paleta_id=c_item.paleta_id,
-            quantity=c_item.quantity,
-            nombre=c_item.nombre,
-            descripcion=c_item.descripcion,
-            ingredientes=c_item.ingredientes,
-            precio=c_item.precio,
-            imagen_url=c_item.imagen_url
-        )
-        db.add(order_item)
+async def find_order_by_key(db: AsyncSession, user_id: int, idempotency_key: str) -> Optional[models.Order]:
+    return await db.scalar(
+        select(models.Order)
+        .where(models.Order.user_id == user_id, models.Order.idempotency_key == idempotency_key)
+        .options(WITH_ITEMS)
+    )
 
-    # Limpiar carrito
-    for c_item in cart_items:
-        db.delete(c_item)
 
-    db.commit()
-    db.refresh(new_order)
+@router.post("/orders", response_model=schemas.OrderInDB)
+async def create_order(
+    user_id: int,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=64),
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_active_user),
+):
+    # Un reintento con la misma clave devuelve el pedido ya creado
+    if idempotency_key:
+        existing = await find_order_by_key(db, user_id, idempotency_key)
+        if existing:
+            return existing
+
+    # Todo en una transacción: pedido, copia del carrito y vaciado del carrito
+    new_order = models.Order(user_id=user_id, attended=False, idempotency_key=idempotency_key)
+    db.add(new_order)
+    try:
+        await db.flush()
+    except IntegrityError:
+        # Otro reintento con la misma clave ganó la carrera
+        await db.rollback()
+        existing = await find_order_by_key(db, user_id, idempotency_key) if idempotency_key else None
+        if existing is None:
+            raise
+        return existing
+
+    copied = await move_cart_to_order(db, user_id, new_order.id)
+    if not copied:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="El carrito está vacío.")
+    await record_order(db, new_order.id)
+
+    await db.commit()
+    cart_changed(user_id)
+
+    # El mismo JSON va en la respuesta y en el mensaje del panel
+    body = encode(schemas.OrderInDB, await load_order(db, new_order.id))
+    await order_events.publish(message("order_created", order=body))
+    return raw_json_response(body)
+
+
+# * --- ANALÍTICA ---
+@router.get(
+    "/analytics/sales",
+    response_model=schemas.SalesReport,
+    summary="Ventas por día y paleta",
+    description=(
+        "Ingresos y unidades por día y paleta, las más vendidas y los pedidos pendientes/atendidos "
+        "entre `since` y `until` (inclusive; por defecto los últimos 30 días). Lee solo los "
+        "acumulados diarios. Solo administradores."
+    ),
+)
+async def sales_analytics(
+    since: Optional[datetime.date] = Query(None),
+    until: Optional[datetime.date] = Query(None),
+    top: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db),
+    admin: models.User = Depends(verify_admin),
+):
+    return await sales_report(db, since, until, top)
+
+
+# * --- ARRANQUE DE LA APLICACIÓN ---
+def create_engines():
+    get_engine()
+    get_async_engine()
+
+
+def check_schema():
+    engine = get_engine()
+    if STARTUP_SCHEMA == "upgrade":
+        upgrade(engine)
+        return
+    latest = MIGRATIONS[-1][0]
+    with engine.connect() as conn:
+        version = current_version(conn)
+    if version < latest:
+        raise RuntimeError(
+            f"El esquema está en la versión {version} y la última es {latest}: ejecuta `python -m app.migrations`."
+        )
 
-    return new_order
 
+async def warm_pool():
+    # Conexiones abiertas a la vez para que queden todas en el pool
+    engine = get_async_engine()
+
+    async def ping():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*[ping() for _ in range(POOL_WARM_CONNECTIONS)])
+
+
+async def warm_catalog():
+    async with AsyncSessionLocal() as db:
+        await refresh_catalog(db)
+        await catalog_cache.get_lista(lambda: load_catalog(db))
+        await ensure_index(catalog_cache.version, lambda: load_catalog(db))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Arranque en orden, una vez por worker: motores, esquema, pool, imágenes, catálogo y bcrypt.
+    /readyz responde 200 solo cuando terminan todos los pasos.
+    """
+    readiness.reset()
+    await readiness.step("engine", create_engines)
+    if STARTUP_SCHEMA != "off":
+        await readiness.step("schema", lambda: run_in_threadpool(check_schema))
+    if POOL_WARM_CONNECTIONS > 0:
+        await readiness.step("pool", warm_pool)
+    await readiness.step("images", lambda: run_in_threadpool(image_pipeline.manifest))
+    await readiness.step("catalog", warm_catalog)
+    if WARM_UP_HASHING:
+        await readiness.step("hashing", lambda: run_in_threadpool(hash_pool.warm_up))
+    readiness.ready = True
+    try:
+        yield
+    finally:
+        readiness.ready = False
+        hash_pool.shutdown()
+        await order_events.close()
+        await dispose_engines()
+        slow_log.stop()
+
+
+def create_app() -> FastAPI:
+    # Construir la app no conecta a la BD ni ejecuta DDL: eso ocurre en `lifespan`
+    app = FastAPI(
+        title="API de Paletas Ternurin",
+        description="API para gestionar el catálogo de paletas personalizadas y un carrito básico.",
+        lifespan=lifespan,
+        default_response_class=FastJSONResponse,
+    )
+
+    app.include_router(health, tags=["health"])
+    app.include_router(metrics, tags=["health"])
+    app.include_router(users, tags=["users"])
+    app.include_router(auth, tags=["auth"])
+    app.include_router(router)
+
+    # Dentro de CORS: los encabezados CORS se agregan a la respuesta ya comprimida
+    app.add_middleware(CompressionMiddleware)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(ProfilingMiddleware)
+    # El más externo: la latencia incluye CORS y compresión
+    app.add_middleware(MetricsMiddleware)
+    instrument_queries()
+    instrument_slow_queries()
+
+    # --- Montar Directorio de Archivos Estáticos (mantener igual) ---
+    app.mount("/static", StaticFiles(directory="static"), name="static")
+    return app
+
+
+app = create_app()
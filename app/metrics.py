@@ -0,0 +1,271 @@
+# app/metrics.py
+# Métricas del servicio en formato de texto de Prometheus (GET /metrics):
+#
+# - Peticiones y latencia por ruta. La etiqueta es la plantilla de la ruta
+#   (`/cart/{user_id}`), no la URL: la cantidad de series no crece con los ids.
+# - Consultas SQL y tiempo en la BD por petición, medidos con los eventos
+#   before/after_cursor_execute de SQLAlchemy.
+# - Estado de los pools de conexiones y del pool de bcrypt.
+#
+# Todo se acumula en memoria del worker con un lock por observación; cada worker
+# expone sus propios números (Prometheus los suma por instancia).
+import bisect
+import contextvars
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .database import pool_status
+from .hashing import hash_pool
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+UNMATCHED_ROUTE = "<unmatched>"
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Histograma acumulado con cubetas fijas (como los de Prometheus)."""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # la última es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total, result = 0, []
+        for bound, count in zip(list(self.buckets) + [float("inf")], self.counts):
+            total += count
+            result.append(("+Inf" if bound == float("inf") else _number(bound), total))
+        return result
+
+
+class RequestStats:
+    # Lo que se acumula durante una petición (consultas SQL y tiempo en la BD)
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# Estadísticas de la petición en curso; None fuera de una petición (arranque, scripts)
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("current_request", default=None)
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.request_queries: Dict[Tuple[str, str], Histogram] = {}
+        self.request_db_seconds: Dict[Tuple[str, str], Histogram] = {}
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        key = (method, route)
+        with self._lock:
+            self.requests[(method, route, status)] = self.requests.get((method, route, status), 0) + 1
+            for histograms, buckets, value in (
+                (self.latency, LATENCY_BUCKETS, seconds),
+                (self.request_queries, QUERY_COUNT_BUCKETS, stats.queries),
+                (self.request_db_seconds, LATENCY_BUCKETS, stats.db_seconds),
+            ):
+                histogram = histograms.get(key)
+                if histogram is None:
+                    histogram = histograms[key] = Histogram(buckets)
+                histogram.observe(value)
+
+    def observe_query(self, seconds: float):
+        with self._lock:
+            self.queries += 1
+            self.query_seconds += seconds
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self.latency.clear()
+            self.request_queries.clear()
+            self.request_db_seconds.clear()
+            self.queries = 0
+            self.query_seconds = 0.0
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            _counter(lines, "http_requests_total", "Peticiones atendidas por ruta y código de estado.", (
+                ({"method": m, "route": r, "status": str(s)}, n) for (m, r, s), n in sorted(self.requests.items())
+            ))
+            _histograms(lines, "http_request_duration_seconds", "Latencia de las peticiones por ruta.", self.latency)
+            _histograms(lines, "http_request_db_queries", "Consultas SQL por petición.", self.request_queries)
+            _histograms(lines, "http_request_db_seconds", "Tiempo en la BD por petición.", self.request_db_seconds)
+            _counter(lines, "db_queries_total", "Consultas SQL ejecutadas.", [({}, self.queries)])
+            _counter(lines, "db_query_seconds_total", "Tiempo total de las consultas SQL.", [({}, self.query_seconds)])
+
+        pools = pool_status()
+        for field, kind, help_text in (
+            ("in_use", "gauge", "Conexiones prestadas en este momento."),
+            ("size", "gauge", "Tamaño configurado del pool."),
+            ("overflow", "gauge", "Conexiones por encima de pool_size (negativo: sin abrir aún)."),
+            ("checked_in", "gauge", "Conexiones libres en el pool."),
+            ("checkouts", "counter", "Conexiones sacadas del pool."),
+            ("connects", "counter", "Conexiones nuevas abiertas."),
+            ("invalidated", "counter", "Conexiones descartadas por error."),
+            ("timeouts", "counter", "Esperas de conexión que agotaron pool_timeout."),
+            ("wait_seconds", "counter", "Tiempo total esperando una conexión libre."),
+            ("max_wait_seconds", "gauge", "Espera más larga por una conexión libre."),
+        ):
+            name = f"db_pool_{field}" + ("_total" if kind == "counter" else "")
+            samples = [({"pool": pool}, data[field]) for pool, data in sorted(pools.items()) if field in data]
+            _metric(lines, name, kind, help_text, samples)
+
+        hashing = hash_pool.stats()
+        _metric(lines, "bcrypt_pending", "gauge", "Operaciones de bcrypt en curso o en cola.", [({}, hashing["pending"])])
+        _metric(lines, "bcrypt_max_pending", "gauge", "Límite de la cola de bcrypt (por encima, 503).", [({}, hashing["max_pending"])])
+        _metric(lines, "bcrypt_workers", "gauge", "Trabajadores del pool de bcrypt.", [({}, hashing["workers"])])
+        _counter(lines, "bcrypt_completed_total", "Operaciones de bcrypt terminadas.", [({}, hashing["completed"])])
+        _counter(lines, "bcrypt_rejected_total", "Operaciones de bcrypt rechazadas con 503.", [({}, hashing["rejected"])])
+        _counter(lines, "bcrypt_queue_wait_seconds_total", "Tiempo total en la cola de bcrypt.", [({}, hashing["queue_wait_seconds"])])
+        return "\n".join(lines) + "\n"
+
+
+# --- Formato de texto ---
+
+def _number(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _metric(lines: List[str], name: str, kind: str, help_text: str, samples: Iterable[Tuple[Dict[str, str], float]]):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+
+def _counter(lines, name, help_text, samples):
+    _metric(lines, name, "counter", help_text, samples)
+
+
+def _histograms(lines: List[str], name: str, help_text: str, histograms: Dict[Tuple[str, str], Histogram]):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for (method, route), histogram in sorted(histograms.items()):
+        labels = {"method": method, "route": route}
+        for bound, count in histogram.cumulative():
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {count}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(histogram.sum)}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+
+metrics_registry = Metrics()
+
+
+# --- Consultas SQL ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = getattr(context, "_metrics_started_at", None)
+    if started_at is None:
+        return
+    elapsed = time.perf_counter() - started_at
+    metrics_registry.observe_query(elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+def instrument_queries():
+    # En la clase Engine: cubre el motor síncrono, el asíncrono y las réplicas
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# --- Peticiones ---
+
+def route_template(scope: Scope, root_path: str = "") -> str:
+    # El router de Starlette anota en el scope la ruta que coincidió
+    route = scope.get("route")
+    if route is not None:
+        return route.path_format
+    # Montajes (p. ej. /static): el prefijo que coincidió se agrega a root_path
+    mount_path = scope.get("root_path", "")
+    if mount_path != root_path:
+        return mount_path[len(root_path):] + "/{path}"
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """Mide cada petición HTTP: ruta, código, latencia y consultas SQL hechas durante ella."""
+
+    def __init__(self, app: ASGIApp, registry: Metrics = metrics_registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        root_path = scope.get("root_path", "")
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status_code = 500
+        started_at = time.perf_counter()
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_request.reset(token)
+            self.registry.observe_request(
+                scope["method"], route_template(scope, root_path), status_code, time.perf_counter() - started_at, stats
+            )
+
+
+metrics = APIRouter()
+
+
+@metrics.get(
+    "/metrics",
+    summary="Métricas",
+    description="Métricas del worker en formato de texto de Prometheus.",
+    response_class=Response,
+)
+async def get_metrics():
+    return Response(content=metrics_registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,291 @@
+# app/migrations.py
+# Migraciones de esquema versionadas. Cada migración corre una sola vez por base de datos
+# y queda registrada en la tabla `schema_migrations`.
+#
+# Uso:
+#   python -m app.migrations            # aplica las migraciones pendientes
+#   python -m app.migrations current    # muestra la versión actual
+#   python -m app.migrations check      # EXPLAIN de las consultas frecuentes (solo SQLite)
+#
+# Las migraciones son idempotentes: la 1 crea con `create_all` las tablas que falten
+# (ya con los índices de los modelos) y las siguientes solo agregan lo que no exista,
+# así sirven igual para una base nueva que para una creada antes de este módulo.
+import os
+import re
+import sys
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import (
+    Column, DateTime, Integer, MetaData, String, Table, false, func, inspect, select, text,
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import AddConstraint, CreateColumn
+
+from . import models
+
+Migration = Tuple[int, str, Callable[[Connection], None]]
+
+MIGRATIONS: List[Migration] = []
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(255), nullable=False),
+    Column("applied_at", DateTime, server_default=func.now()),
+)
+
+
+def migration(version: int, name: str):
+    def register(fn: Callable[[Connection], None]):
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+# --- Utilidades idempotentes ---
+
+def _index_names(conn: Connection, table_name: str) -> set:
+    inspector = inspect(conn)
+    names = {ix["name"] for ix in inspector.get_indexes(table_name)}
+    names |= {uq["name"] for uq in inspector.get_unique_constraints(table_name)}
+    return names
+
+
+def create_missing_indexes(conn: Connection, table: Table):
+    # Los índices declarados en el modelo que la tabla todavía no tiene
+    existing = _index_names(conn, table.name)
+    for index in sorted(table.indexes, key=lambda ix: ix.name):
+        if index.name not in existing:
+            index.create(conn)
+
+
+def add_missing_column(conn: Connection, table: Table, column_name: str):
+    if column_name in {c["name"] for c in inspect(conn).get_columns(table.name)}:
+        return
+    column_ddl = CreateColumn(table.c[column_name]).compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}"))
+
+
+# --- Migraciones ---
+
+@migration(1, "esquema inicial")
+def _initial_schema(conn: Connection):
+    models.Base.metadata.create_all(conn)
+
+
+@migration(2, "carrito único por paleta y clave de idempotencia en pedidos")
+def _cart_upsert_and_idempotency(conn: Connection):
+    cart = models.CartItem.__table__
+    # Antes del índice único se juntan las líneas repetidas (mismo usuario y paleta)
+    duplicates = conn.execute(
+        select(cart.c.user_id, cart.c.paleta_id, func.min(cart.c.id), func.sum(cart.c.quantity))
+        .where(cart.c.paleta_id.isnot(None))
+        .group_by(cart.c.user_id, cart.c.paleta_id)
+        .having(func.count() > 1)
+    ).all()
+    for user_id, paleta_id, keep_id, quantity in duplicates:
+        conn.execute(cart.update().where(cart.c.id == keep_id).values(quantity=quantity))
+        conn.execute(
+            cart.delete().where(cart.c.user_id == user_id, cart.c.paleta_id == paleta_id, cart.c.id != keep_id)
+        )
+    add_missing_column(conn, models.Order.__table__, "idempotency_key")
+    create_missing_indexes(conn, cart)
+
+
+@migration(3, "índices de las consultas frecuentes, nombre único y llave foránea del carrito")
+def _hot_query_indexes(conn: Connection):
+    paletas = models.Paleta.__table__
+    repeated = conn.execute(
+        select(paletas.c.nombre).group_by(paletas.c.nombre).having(func.count() > 1)
+    ).scalars().all()
+    if repeated:
+        raise RuntimeError(
+            "No se puede crear el índice único de paletas.nombre; nombres repetidos: "
+            + ", ".join(repeated)
+        )
+
+    for model in (models.Paleta, models.Order, models.OrderItem):
+        create_missing_indexes(conn, model.__table__)
+
+    # SQLite no permite agregar llaves foráneas a una tabla existente (y no las aplica
+    # sin PRAGMA foreign_keys); las bases nuevas ya la traen desde create_all
+    cart = models.CartItem.__table__
+    if conn.dialect.name == "sqlite":
+        return
+    if any(fk["name"] == "fk_cart_items_user_id" for fk in inspect(conn).get_foreign_keys(cart.name)):
+        return
+    users = models.User.__table__
+    conn.execute(cart.delete().where(cart.c.user_id.not_in(select(users.c.id))))
+    constraint = next(c for c in cart.foreign_key_constraints if c.name == "fk_cart_items_user_id")
+    conn.execute(AddConstraint(constraint))
+
+
+@migration(4, "acumulados diarios de ventas y pedidos")
+def _sales_rollups(conn: Connection):
+    from .analytics import backfill
+
+    models.Base.metadata.create_all(
+        conn, tables=[models.SalesDaily.__table__, models.OrdersDaily.__table__], checkfirst=True
+    )
+    backfill(conn)
+
+
+@migration(5, "versión del catálogo para las cachés de los workers")
+def _catalog_version(conn: Connection):
+    # La fila se crea con la primera escritura del catálogo (ver bump_catalog_version)
+    models.Base.metadata.create_all(conn, tables=[models.CatalogVersion.__table__], checkfirst=True)
+
+
+# --- Ejecución ---
+
+def current_version(conn: Connection) -> int:
+    if not inspect(conn).has_table(schema_migrations.name):
+        return 0
+    return conn.execute(select(func.max(schema_migrations.c.version))).scalar() or 0
+
+
+# Nombre del bloqueo que serializa `upgrade` entre procesos (MySQL/PostgreSQL)
+MIGRATION_LOCK_NAME = "paletas_schema_migrations"
+MIGRATION_LOCK_KEY = 7_301_120_513  # pg_advisory_lock recibe un entero
+# Segundos que un worker espera a que otro termine de migrar
+MIGRATION_LOCK_TIMEOUT = int(os.getenv("MIGRATION_LOCK_TIMEOUT", "600"))
+
+
+@contextmanager
+def migration_lock(conn: Connection):
+    """
+    Bloqueo de sesión que serializa `upgrade` cuando arrancan varios workers a la vez:
+    GET_LOCK en MySQL y pg_advisory_lock en PostgreSQL. En SQLite cada migración se
+    serializa con BEGIN IMMEDIATE (ver `_begin_locked`).
+    """
+    dialect = conn.dialect.name
+    if dialect == "mysql":
+        acquired = conn.scalar(
+            text("SELECT GET_LOCK(:name, :timeout)"), {"name": MIGRATION_LOCK_NAME, "timeout": MIGRATION_LOCK_TIMEOUT}
+        )
+        conn.commit()
+        if acquired != 1:
+            raise RuntimeError(f"No se obtuvo el bloqueo de migraciones en {MIGRATION_LOCK_TIMEOUT} s.")
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": MIGRATION_LOCK_NAME})
+            conn.commit()
+    elif dialect == "postgresql":
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        conn.commit()
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            conn.commit()
+    else:
+        yield
+
+
+def _begin_locked(conn: Connection):
+    # En SQLite, BEGIN IMMEDIATE toma el bloqueo de escritura de la base antes de leer la versión
+    if conn.dialect.name == "sqlite":
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def upgrade(engine: Engine, target: Optional[int] = None) -> List[int]:
+    """
+    Aplica en orden las migraciones pendientes hasta `target` (por defecto, la última).
+    Cada una corre en su propia transacción junto con su registro en `schema_migrations`.
+    Es seguro llamarla desde varios procesos a la vez: con el bloqueo tomado se vuelve a
+    leer la versión, y lo que ya aplicó otro worker se salta. Devuelve las versiones aplicadas.
+    """
+    applied = []
+    with engine.connect() as conn, migration_lock(conn):
+        with conn.begin():
+            _begin_locked(conn)
+            schema_migrations.create(conn, checkfirst=True)
+
+        for number, name, fn in MIGRATIONS:
+            if target is not None and number > target:
+                break
+            with conn.begin():
+                _begin_locked(conn)
+                if number <= current_version(conn):
+                    continue
+                fn(conn)
+                conn.execute(schema_migrations.insert().values(version=number, name=name))
+            applied.append(number)
+    return applied
+
+
+# --- Revisión de planes de consulta ---
+
+def hot_queries() -> List[Tuple[str, object]]:
+    """
+    Las consultas con WHERE de los endpoints, con la misma forma que en main.py/cart.py.
+    Los listados completos (catálogo, /orders/all sin filtros, exportación) recorren la
+    tabla a propósito y no están aquí.
+    """
+    Order, OrderItem, CartItem, Paleta = models.Order, models.OrderItem, models.CartItem, models.Paleta
+    return [
+        ("carrito de un usuario", select(CartItem).where(CartItem.user_id == 1)),
+        ("línea del carrito", select(CartItem).where(CartItem.user_id == 1, CartItem.paleta_id == 1)),
+        ("paleta por nombre", select(Paleta).where(Paleta.nombre == "x").limit(1)),
+        ("pedidos de un usuario",
+         select(Order).where(Order.user_id == 1, Order.id > 0).order_by(Order.id).limit(101)),
+        ("pedidos por estado",
+         select(Order).where(Order.attended == false(), Order.id > 0).order_by(Order.id).limit(101)),
+        # Con solo `since` (rango abierto) SQLite elige entre el índice y la llave primaria
+        # según las estadísticas de ANALYZE; el rango acotado siempre debe usar el índice
+        ("pedidos por fecha",
+         select(Order).where(Order.created_at >= "2024-01-01", Order.created_at < "2024-02-01")
+         .order_by(Order.id).limit(101)),
+        ("pedido por clave de idempotencia",
+         select(Order).where(Order.user_id == 1, Order.idempotency_key == "k")),
+        ("ítems de los pedidos", select(OrderItem).where(OrderItem.order_id.in_([1, 2, 3]))),
+    ]
+
+
+# En EXPLAIN QUERY PLAN de SQLite, "SCAN tabla" sin índice es un recorrido completo
+_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def full_table_scans(conn: Connection) -> List[str]:
+    """Devuelve las consultas frecuentes cuyo plan recorre una tabla completa (solo SQLite)."""
+    if conn.dialect.name != "sqlite":
+        raise NotImplementedError("La revisión de planes solo está implementada para SQLite")
+    problems = []
+    for label, stmt in hot_queries():
+        sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+        for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}"):
+            detail = row[-1]
+            if _FULL_SCAN.match(detail):
+                problems.append(f"{label}: {detail}")
+    return problems
+
+
+def main(argv: List[str]) -> int:
+    from .database import get_engine
+
+    engine = get_engine()
+    command = argv[0] if argv else "upgrade"
+    if command == "upgrade":
+        applied = upgrade(engine)
+        print(f"Migraciones aplicadas: {applied}" if applied else "El esquema ya está al día.")
+    elif command == "current":
+        with engine.connect() as conn:
+            print(current_version(conn))
+    elif command == "check":
+        with engine.connect() as conn:
+            problems = full_table_scans(conn)
+        for problem in problems:
+            print(problem)
+        return 1 if problems else 0
+    else:
+        print(f"Comando desconocido: {command}. Usa upgrade, current o check.")
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,11 +1,13 @@
 # app/models.py (Actualizado para el carrito preliminar)
-from sqlalchemy import Column, Integer, String, DECIMAL, Boolean, Text, TIMESTAMP, ForeignKey, DateTime, Float
+from sqlalchemy import Column, Integer, String, DECIMAL, Boolean, Text, TIMESTAMP, ForeignKey, Date, DateTime, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
 
 class Paleta(Base):
     __tablename__ = "paletas"
+    # create_paleta busca por nombre antes de insertar; el índice único además evita duplicados
+    __table_args__ = (Index("uq_paletas_nombre", "nombre", unique=True),)
 
     id = Column(Integer, primary_key=True, index=True)
     nombre = Column(String(255), nullable=False)
@@ -26,9 +28,12 @@ class Paleta(Base):
 
 class CartItem(Base):
     __tablename__ = "cart_items"
+    # Una línea por (usuario, paleta): permite el upsert atómico de /cart/add.
+    # Las personalizadas (paleta_id NULL) no chocan entre sí. También sirve para WHERE user_id = ?
+    __table_args__ = (Index("uq_cart_items_user_paleta", "user_id", "paleta_id", unique=True),)
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", name="fk_cart_items_user_id", ondelete="CASCADE"), nullable=False)
     paleta_id = Column(Integer, nullable=True)  # Puede ser null para personalizadas
     quantity = Column(Integer, nullable=False)
     added_at = Column(TIMESTAMP, server_default=func.now())
@@ -63,6 +68,21 @@ class Order(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     attended = Column(Boolean, default=False)  # <-- campo para marcar atendido
+    # Clave opcional enviada por el cliente para que reintentar el checkout no duplique el pedido
+    idempotency_key = Column(String(64), nullable=True)
+
+    # Índices para los WHERE de /orders (todos paginan por id). Los cambios de índices
+    # en modelos existentes van acompañados de una migración en app/migrations.py
+    __table_args__ = (
+        # Parcial donde el motor lo permite: la mayoría de los pedidos no trae clave
+        Index(
+            "uq_orders_user_idempotency_key", "user_id", "idempotency_key", unique=True,
+            sqlite_where=idempotency_key.isnot(None), postgresql_where=idempotency_key.isnot(None),
+        ),
+        Index("ix_orders_user_id_id", "user_id", "id"),
+        Index("ix_orders_attended_id", "attended", "id"),
+        Index("ix_orders_created_at", "created_at"),
+    )
 
     user = relationship("User", back_populates="orders")
     # Opcional: relacionar con detalles del pedido (items)
@@ -72,7 +92,7 @@ class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
     paleta_id = Column(Integer, nullable=True)  # puede ser NULL si es paleta personalizada
     quantity = Column(Integer, nullable=False)
     nombre = Column(String(255), nullable=False)
@@ -82,3 +102,37 @@ class OrderItem(Base):
     imagen_url = Column(String(255), nullable=True)
 
     order = relationship("Order", back_populates="items")
+
+
+# --- Acumulados de ventas (app/analytics.py) ---
+# Se actualizan en la misma transacción que create_order / marcar atendido y se
+# recalculan con `python -m app.analytics backfill`. El día es el de `orders.created_at`.
+
+class SalesDaily(Base):
+    __tablename__ = "sales_daily"
+
+    day = Column(Date, primary_key=True)
+    # 0 agrupa las paletas personalizadas (paleta_id NULL en order_items)
+    paleta_id = Column(Integer, primary_key=True, autoincrement=False)
+    nombre = Column(String(255), nullable=True)
+    units = Column(Integer, nullable=False, default=0)
+    revenue = Column(DECIMAL(14, 2), nullable=False, default=0)
+
+
+class OrdersDaily(Base):
+    __tablename__ = "orders_daily"
+
+    day = Column(Date, primary_key=True)
+    orders = Column(Integer, nullable=False, default=0)
+    attended = Column(Integer, nullable=False, default=0)
+
+
+# --- Versión del catálogo (app/main.py) ---
+# Una sola fila que cada escritura de `paletas` incrementa en su misma transacción; los
+# workers la comparan con la que tienen en memoria para saber si su caché sigue vigente.
+
+class CatalogVersion(Base):
+    __tablename__ = "catalog_version"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,83 @@
+# app/pagination.py
+# Paginación por cursor (keyset sobre `id`) y selección de campos (`fields=`)
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException, Query, Request
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .serialization import FastJSONResponse
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+# Se agrega a la descripción de los listados paginados
+PAGINATION_DOC = (
+    f"Paginado por cursor: sin `limit` devuelve los primeros {DEFAULT_PAGE_SIZE}; si hay más, el cursor "
+    "de la siguiente página llega en `X-Next-Cursor` y su URL en `Link: rel=\"next\"`."
+)
+
+
+class PageParams:
+    """
+    Parámetros comunes de los listados: `after` es el último `id` recibido
+    (cursor), `limit` el tamaño de página y `fields` una lista separada por comas.
+    Sin `limit` la página es de DEFAULT_PAGE_SIZE: los listados nunca salen completos y,
+    si quedan más registros, `X-Next-Cursor` y `Link: rel="next"` llevan a la siguiente.
+    """
+
+    def __init__(
+        self,
+        after: Optional[int] = Query(None, ge=0, description="Devuelve registros con id mayor a este cursor."),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description=f"Tamaño máximo de la página ({DEFAULT_PAGE_SIZE} si no se indica)."),
+        fields: Optional[str] = Query(None, description="Campos a devolver, separados por comas (p. ej. id,nombre)."),
+    ):
+        self.after = after
+        self.limit = limit
+        self.fields = fields
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    if fields is None:
+        return None
+    allowed = list(allowed)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Campos no válidos: {', '.join(unknown) or fields}. Permitidos: {', '.join(allowed)}."
+        )
+    # `id` siempre se incluye: es el cursor de la siguiente página
+    if "id" in allowed and "id" not in requested:
+        requested.insert(0, "id")
+    return requested
+
+
+async def keyset_page(db: AsyncSession, stmt: Select, id_column, after: Optional[int], limit: int, scalars: bool = True) -> Tuple[list, Optional[int]]:
+    """
+    Ejecuta `stmt` ordenada por `id_column` a partir del cursor `after`.
+    Se pide una fila extra para saber si hay otra página sin hacer un COUNT.
+    Con `scalars=False` se devuelven filas (para consultas de columnas sueltas).
+    """
+    if after is not None:
+        stmt = stmt.where(id_column > after)
+    result = await db.execute(stmt.order_by(id_column).limit(limit + 1))
+    rows = result.scalars().all() if scalars else result.all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+    return rows, next_cursor
+
+
+def cursor_headers(request: Request, next_cursor: Optional[int]) -> Dict[str, str]:
+    if next_cursor is None:
+        return {}
+    next_url = request.url.include_query_params(after=next_cursor)
+    return {"X-Next-Cursor": str(next_cursor), "Link": f'<{next_url}>; rel="next"'}
+
+
+def sparse_response(rows: List[Any], headers: Dict[str, str]) -> FastJSONResponse:
+    # Las filas ya traen solo las columnas pedidas (Row de SQLAlchemy o dict)
+    content = [row._asdict() if hasattr(row, "_asdict") else row for row in rows]
+    return FastJSONResponse(content=content, headers=headers)
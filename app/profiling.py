@@ -0,0 +1,308 @@
+# app/profiling.py
+# Diagnóstico de peticiones lentas en producción:
+#
+# - Perfil de una petición (cProfile + las sentencias SQL que emitió, con su tiempo y
+#   la línea de la app que las originó). Se activa con el encabezado `X-Profile: 1` en
+#   una petición de un administrador (token con is_admin) o al azar con PROFILE_SAMPLE_RATE.
+# - Registro de peticiones y consultas lentas (umbrales configurables).
+#
+# Todo se escribe como JSON por línea en SLOW_LOG_PATH mediante un QueueHandler: el event
+# loop solo encola el registro y un hilo aparte lo serializa y lo escribe en disco.
+import cProfile
+import datetime
+import json
+import logging
+import os
+import pstats
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from typing import List, Optional
+
+import greenlet
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .auth import admin_for_token
+from .database import get_async_db
+from .metrics import current_request, route_template
+
+# Archivo JSONL; vacío desactiva el registro
+SLOW_LOG_PATH = os.getenv("SLOW_LOG_PATH", "logs/slow.jsonl")
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "1.0"))
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.25"))
+# Fracción de peticiones que se perfilan sin pedirlo (0 = solo con el encabezado)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_HEADER = "x-profile"
+# Funciones del perfil que se guardan (por tiempo acumulado)
+PROFILE_TOP_FUNCTIONS = int(os.getenv("PROFILE_TOP_FUNCTIONS", "40"))
+# Las sentencias SQL largas se recortan en el registro
+SQL_MAX_CHARS = 2000
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_PROJECT_DIR = os.path.dirname(_APP_DIR)
+# Módulos de instrumentación: no son el origen de una consulta
+_SKIP_FILES = {os.path.join(_APP_DIR, name) for name in ("profiling.py", "metrics.py", "database.py")}
+
+
+class RequestTrace:
+    # Identifica la petición en curso; `statements` es una lista solo si se está perfilando
+    __slots__ = ("request_id", "method", "path", "statements")
+
+    def __init__(self, method: str, path: str):
+        self.request_id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.statements: Optional[List[dict]] = None
+
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+
+# --- Registro JSONL ---
+
+class _RecordQueueHandler(QueueHandler):
+    # QueueHandler formatea el registro antes de encolarlo; aquí se encola tal cual
+    # y el formato (json.dumps) ocurre en el hilo del QueueListener
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        timestamp = datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat()
+        return json.dumps({"ts": timestamp, **record.msg}, ensure_ascii=False, default=str)
+
+
+class SlowLog:
+    """
+    Registro de peticiones/consultas lentas y perfiles. El hilo que escribe se arranca
+    con la primera entrada; `stop()` vacía la cola y cierra el archivo.
+    """
+
+    def __init__(self, path: str = SLOW_LOG_PATH):
+        self.path = path
+        self.logger = logging.getLogger("app.slow")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self._lock = threading.Lock()
+        self._handler: Optional[QueueHandler] = None
+        self._listener: Optional[QueueListener] = None
+
+    def start(self):
+        with self._lock:
+            if self._listener is not None or not self.path:
+                return
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            file_handler = logging.FileHandler(self.path, encoding="utf-8")
+            file_handler.setFormatter(JsonLinesFormatter())
+            records: queue.SimpleQueue = queue.SimpleQueue()
+            self._handler = _RecordQueueHandler(records)
+            self._listener = QueueListener(records, file_handler)
+            self._listener.start()
+            self.logger.addHandler(self._handler)
+
+    def write(self, entry: dict):
+        if not self.path:
+            return
+        if self._listener is None:
+            self.start()
+        self.logger.info(entry)
+
+    def stop(self):
+        with self._lock:
+            listener, self._listener = self._listener, None
+            if listener is None:
+                return
+            self.logger.removeHandler(self._handler)
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+slow_log = SlowLog()
+
+
+# --- Consultas SQL ---
+
+def call_site(limit: int = 5) -> List[str]:
+    """
+    Líneas de la app (fuera de la instrumentación) en la pila de la consulta, de la más
+    interna a la más externa: p. ej. el helper de paginación y luego el endpoint.
+    Con AsyncSession la consulta corre en un greenlet hijo: la pila sigue en el greenlet
+    padre, donde está el `await` del endpoint.
+    """
+    sites: List[str] = []
+    frame = sys._getframe(1)
+    current = greenlet.getcurrent()
+    while len(sites) < limit:
+        while frame is not None and len(sites) < limit:
+            filename = frame.f_code.co_filename
+            if filename.startswith(_APP_DIR) and filename not in _SKIP_FILES:
+                sites.append(f"{os.path.relpath(filename, _PROJECT_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}")
+            frame = frame.f_back
+        current = current.parent
+        if current is None:
+            break
+        frame = current.gr_frame
+    return sites
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._profiling_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = getattr(context, "_profiling_started_at", None)
+    if started_at is None:
+        return
+    elapsed = time.perf_counter() - started_at
+    trace = current_trace.get()
+    profiling = trace is not None and trace.statements is not None
+    if not profiling and elapsed < SLOW_QUERY_SECONDS:
+        return
+    # La pila solo se recorre al perfilar o para una consulta lenta
+    entry = {"sql": statement[:SQL_MAX_CHARS], "seconds": round(elapsed, 6), "call_site": call_site()}
+    if profiling:
+        trace.statements.append(entry)
+    if elapsed >= SLOW_QUERY_SECONDS:
+        context_fields = {"request_id": trace.request_id, "method": trace.method, "path": trace.path} if trace else {}
+        slow_log.write({"type": "slow_query", **context_fields, **entry})
+
+
+def instrument_slow_queries():
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# --- Peticiones ---
+
+async def _is_admin_request(scope: Scope, headers: Headers) -> bool:
+    # El usuario se resuelve como en verify_admin (caché de principales o BD), no solo el claim:
+    # alguien que dejó de ser admin no puede volcar SQL al registro
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    # La sesión sale de la misma dependencia que usan los endpoints (respeta dependency_overrides)
+    app = scope.get("app")
+    overrides = getattr(app, "dependency_overrides", {})
+    session_dependency = asynccontextmanager(overrides.get(get_async_db, get_async_db))
+    async with session_dependency() as db:
+        return await admin_for_token(token, db) is not None
+
+
+def profile_summary(profiler: cProfile.Profile, limit: int = PROFILE_TOP_FUNCTIONS) -> List[dict]:
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            "function": f"{os.path.relpath(filename, _PROJECT_DIR) if filename.startswith(_PROJECT_DIR) else filename}:{line}({name})",
+            "calls": calls,
+            "tottime": round(tottime, 6),
+            "cumtime": round(cumtime, 6),
+        })
+    rows.sort(key=lambda row: row["cumtime"], reverse=True)
+    return rows[:limit]
+
+
+# cProfile perfila el hilo completo: una petición perfilada a la vez por worker
+_profiler_lock = threading.Lock()
+
+
+class ProfilingMiddleware:
+    """
+    Perfila las peticiones pedidas (encabezado de administrador o muestreo) y registra las
+    lentas. La respuesta perfilada lleva `X-Profile-Id` con el `request_id` de la entrada
+    en el registro.
+
+    Mientras se perfila, las demás corrutinas que avanzan en el mismo event loop también
+    aparecen en el perfil; el trabajo en otros hilos (threadpool, bcrypt) no.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(scope["method"], scope["path"])
+        token = current_trace.set(trace)
+        root_path = scope.get("root_path", "")
+        headers = Headers(scope=scope)
+        trigger = None
+        if headers.get(PROFILE_HEADER) == "1" and await _is_admin_request(scope, headers):
+            trigger = "header"
+        elif PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            trigger = "sample"
+
+        profiler = None
+        if trigger is not None and _profiler_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Otro profiler ya está activo en este hilo
+                profiler = None
+                _profiler_lock.release()
+            else:
+                trace.statements = []
+
+        status_code = 500
+
+        async def send_with_profile_id(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if profiler is not None:
+                    response_headers = MutableHeaders(raw=list(message["headers"]))
+                    response_headers["X-Profile-Id"] = trace.request_id
+                    message = {**message, "headers": response_headers.raw}
+            await send(message)
+
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            if profiler is not None:
+                profiler.disable()
+                _profiler_lock.release()
+            current_trace.reset(token)
+            self._record(scope, root_path, trace, status_code, elapsed, profiler, trigger)
+
+    def _record(self, scope, root_path, trace, status_code, elapsed, profiler, trigger):
+        if profiler is None and elapsed < SLOW_REQUEST_SECONDS:
+            return
+        entry = {
+            "request_id": trace.request_id,
+            "method": trace.method,
+            "path": trace.path,
+            "route": route_template(scope, root_path),
+            "status": status_code,
+            "seconds": round(elapsed, 6),
+        }
+        stats = current_request.get()
+        if stats is not None:
+            entry.update(db_queries=stats.queries, db_seconds=round(stats.db_seconds, 6))
+        if elapsed >= SLOW_REQUEST_SECONDS:
+            slow_log.write({"type": "slow_request", **entry})
+        if profiler is not None:
+            slow_log.write({
+                "type": "profile",
+                "trigger": trigger,
+                **entry,
+                "statements": trace.statements,
+                "functions": profile_summary(profiler),
+            })
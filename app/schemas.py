@@ -1,8 +1,10 @@
 # app/schemas.py (Actualizado para el carrito preliminar)
-from pydantic import BaseModel, Field, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, Field, EmailStr, model_validator
+from typing import Optional, List, Literal
 import datetime
 
+from .images import image_pipeline
+
 class PaletaBase(BaseModel):
     nombre: str = Field(..., example="Paleta Fresa Delicia")
     descripcion: Optional[str] = Field(None, example="Una refrescante paleta de fresa natural.")
@@ -24,10 +26,22 @@ class PaletaInDB(PaletaBase):
     id: int = Field(..., example=1)
     fecha_creacion: Optional[datetime.datetime] = None
     fecha_actualizacion: Optional[datetime.datetime] = None
+    imagen_srcset: Optional[str] = Field(
+        None, example="/images/fresa.3f2a9c1d0b7e.png?w=320 320w, /images/fresa.3f2a9c1d0b7e.png 640w"
+    )
 
     class Config:
         orm_mode = True
 
+    @model_validator(mode="after")
+    def usar_imagen_optimizada(self):
+        # Las imágenes de /static/images se sirven por /images/ con hash y variantes
+        source = image_pipeline.source_for_url(self.imagen_url)
+        if source is not None:
+            self.imagen_url = image_pipeline.public_url(source)
+            self.imagen_srcset = image_pipeline.srcset(source)
+        return self
+
 
 # --- Esquema para la respuesta del carrito de un usuario ---
 class CartItemBase(BaseModel):
@@ -81,6 +95,21 @@ class CartItemInDB(BaseModel):
         orm_mode = True
 
 
+# --- Esquemas para sincronizar el carrito en lote ---
+class CartOperation(BaseModel):
+    op: Literal["add", "set", "decrease", "remove"] = Field(..., example="add", description="add/decrease suman o restan, set fija la cantidad, remove quita la línea.")
+    paleta_id: int = Field(..., example=1)
+    quantity: int = Field(1, ge=0, example=2, description="Unidades a sumar/restar, o cantidad final con set (0 quita la línea).")
+
+class CartBatchRequest(BaseModel):
+    operations: List[CartOperation] = Field(..., max_length=500)
+
+class CartBatchResponse(BaseModel):
+    items: List[CartItemInDB]
+    total_items: int = Field(..., example=3, description="Suma de cantidades del carrito.")
+    total: float = Field(..., example=75.0, description="Suma de subtotales del carrito.")
+
+
 class UserBase(BaseModel):
     username: str = Field(..., min_length=3, max_length=50, example="usuario123")
     email: EmailStr
@@ -130,4 +159,50 @@ class OrderInDB(OrderBase):
     model_config = {
         "arbitrary_types_allowed": True,
         "from_attributes": True  # equivalente a orm_mode = True
-    }
\ No newline at end of file
+    }
+
+class OrderAttendRequest(BaseModel):
+    ids: Optional[List[int]] = Field(None, max_length=1000, example=[12, 13, 15], description="Pedidos a atender.")
+    before: Optional[datetime.datetime] = Field(
+        None, example="2025-05-01T14:00:00", description="Todos los pendientes creados antes de este momento."
+    )
+
+    @model_validator(mode="after")
+    def exigir_un_filtro(self):
+        # Sin filtro se atenderían todos los pedidos
+        if self.ids is None and self.before is None:
+            raise ValueError("Indica `ids`, `before` o ambos.")
+        return self
+
+class OrderAttendResult(BaseModel):
+    ids: List[int] = Field(..., description="Pedidos que pasaron a atendidos (los que ya lo estaban no se incluyen).")
+    count: int
+
+
+# --- Analítica de ventas (solo desde los acumulados) ---
+class SalesDay(BaseModel):
+    day: datetime.date
+    paleta_id: Optional[int] = Field(..., description="None para las paletas personalizadas.")
+    nombre: Optional[str]
+    units: int
+    revenue: float
+
+class TopSeller(BaseModel):
+    paleta_id: Optional[int]
+    nombre: Optional[str]
+    units: int
+    revenue: float
+
+class OrderCounts(BaseModel):
+    orders: int
+    attended: int
+    pending: int
+
+class SalesReport(BaseModel):
+    since: Optional[datetime.date]
+    until: Optional[datetime.date]
+    daily: List[SalesDay]
+    top_sellers: List[TopSeller]
+    orders: OrderCounts
+    revenue: float
+    units: int
@@ -0,0 +1,199 @@
+# app/search.py
+# Índice de búsqueda en memoria del catálogo: índice invertido + trie de prefijos
+import re
+import threading
+import unicodedata
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from . import schemas
+
+# Peso de cada campo al puntuar: coincidir en el nombre vale más que en la descripción
+FIELD_WEIGHTS = {"nombre": 3.0, "ingredientes": 2.0, "descripcion": 1.0}
+# Una coincidencia por prefijo ("lim" -> "limon") puntúa menos que la palabra exacta
+PREFIX_FACTOR = 0.5
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    # "Limón" -> "limon", "Piña" -> "pina"
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return _TOKEN_RE.findall(normalize(text))
+
+
+class _TrieNode:
+    __slots__ = ("children", "terms")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        # Todos los términos que empiezan con el prefijo de este nodo
+        self.terms: Set[str] = set()
+
+
+class SearchIndex:
+    """
+    Índice de búsqueda de paletas sobre `nombre`, `descripcion` e `ingredientes`,
+    insensible a mayúsculas y acentos.
+
+    `version` es la versión de `CatalogCache` que refleja el índice. Las escrituras
+    del catálogo lo actualizan de forma incremental con `upsert`/`remove`; si se
+    saltó alguna versión, el índice se descarta y se reconstruye en la siguiente
+    búsqueda.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version: Optional[int] = None
+        self._docs: Dict[int, schemas.PaletaInDB] = {}
+        self._doc_terms: Dict[int, Dict[str, float]] = {}
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._display: Dict[str, str] = {}
+        self._trie = _TrieNode()
+
+    # --- Mantenimiento ---
+
+    def rebuild(self, paletas: Iterable[schemas.PaletaInDB], version: int):
+        with self._lock:
+            self._docs.clear()
+            self._doc_terms.clear()
+            self._postings.clear()
+            self._display.clear()
+            self._trie = _TrieNode()
+            for paleta in paletas:
+                self._add(paleta)
+            self.version = version
+
+    def upsert(self, paleta: schemas.PaletaInDB, version: int):
+        with self._lock:
+            if not self._can_apply(version):
+                return
+            self._remove(paleta.id)
+            self._add(paleta)
+            self.version = version
+
+    def remove(self, paleta_id: int, version: int):
+        with self._lock:
+            if not self._can_apply(version):
+                return
+            self._remove(paleta_id)
+            self.version = version
+
+    def _can_apply(self, version: int) -> bool:
+        # Solo se aplica un cambio incremental sobre la versión inmediatamente anterior
+        if self.version is not None and self.version == version - 1:
+            return True
+        self.version = None
+        return False
+
+    def _add(self, paleta: schemas.PaletaInDB):
+        weights: Dict[str, float] = {}
+        for field, field_weight in FIELD_WEIGHTS.items():
+            text = getattr(paleta, field)
+            for raw in re.findall(r"\w+", (text or "").lower()):
+                for term in tokenize(raw):
+                    weights[term] = weights.get(term, 0.0) + field_weight
+                    self._display.setdefault(term, raw)
+        self._docs[paleta.id] = paleta
+        self._doc_terms[paleta.id] = weights
+        for term, weight in weights.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                self._trie_insert(term)
+            postings[paleta.id] = weight
+
+    def _remove(self, paleta_id: int):
+        self._docs.pop(paleta_id, None)
+        for term in self._doc_terms.pop(paleta_id, {}):
+            postings = self._postings[term]
+            postings.pop(paleta_id, None)
+            if not postings:
+                del self._postings[term]
+                self._display.pop(term, None)
+                self._trie_delete(term)
+
+    def _trie_insert(self, term: str):
+        node = self._trie
+        node.terms.add(term)
+        for char in term:
+            node = node.children.setdefault(char, _TrieNode())
+            node.terms.add(term)
+
+    def _trie_delete(self, term: str):
+        node = self._trie
+        node.terms.discard(term)
+        for char in term:
+            child = node.children.get(char)
+            if child is None:
+                return
+            child.terms.discard(term)
+            if not child.terms:
+                del node.children[char]
+                return
+            node = child
+
+    def _prefix_terms(self, prefix: str) -> Set[str]:
+        node = self._trie
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return node.terms
+
+    # --- Consultas ---
+
+    def search(self, query: str, limit: int = 20) -> List[schemas.PaletaInDB]:
+        """
+        Devuelve las paletas que contienen todas las palabras de `query`
+        (cada una como palabra completa o prefijo), ordenadas por puntuación.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self._lock:
+            scores: Optional[Dict[int, float]] = None
+            for token in tokens:
+                token_scores: Dict[int, float] = {}
+                for term in self._prefix_terms(token):
+                    factor = 1.0 if term == token else PREFIX_FACTOR
+                    for doc_id, weight in self._postings[term].items():
+                        score = weight * factor
+                        if score > token_scores.get(doc_id, 0.0):
+                            token_scores[doc_id] = score
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {d: s + token_scores[d] for d, s in scores.items() if d in token_scores}
+                if not scores:
+                    return []
+            ranked: List[Tuple[int, float]] = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+            return [self._docs[doc_id] for doc_id, _ in ranked[:limit]]
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[str]:
+        """
+        Autocompletado: palabras del catálogo que empiezan con `prefix`, primero las
+        que aparecen en más paletas (y con más peso), con su forma original (con acentos).
+        """
+        tokens = tokenize(prefix)
+        if not tokens:
+            return []
+        with self._lock:
+            terms = self._prefix_terms(tokens[-1])
+            ranked = sorted(terms, key=lambda t: (-len(self._postings[t]), -sum(self._postings[t].values()), t))
+            return [self._display[t] for t in ranked[:limit]]
+
+
+search_index = SearchIndex()
+
+
+async def ensure_index(current_version: int, loader: Callable[[], Awaitable[List[schemas.PaletaInDB]]]) -> SearchIndex:
+    # Reconstruye el índice si no refleja la versión actual del catálogo
+    if search_index.version != current_version:
+        search_index.rebuild(await loader(), current_version)
+    return search_index
@@ -0,0 +1,70 @@
+# app/serialization.py
+# Respuestas JSON directas a bytes. El camino por defecto de FastAPI valida lo que
+# devuelve el endpoint contra `response_model`, lo convierte a objetos de Python y
+# luego lo codifica con `json`; aquí se valida una vez y se serializa en Rust
+# (pydantic-core) u orjson.
+import decimal
+import functools
+from typing import Any, Dict, Iterable, Optional
+
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, TypeAdapter
+from pydantic_core import to_json
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: pydantic-core cubre el mismo caso
+    orjson = None
+
+
+def _orjson_default(value: Any):
+    # Tipos que orjson no codifica por sí mismo
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if hasattr(value, "_asdict"):
+        return value._asdict()
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+def dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=_orjson_default)
+    return to_json(value)
+
+
+class FastJSONResponse(JSONResponse):
+    """Respuesta por defecto de la app: igual que JSONResponse pero codificada con orjson."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+@functools.lru_cache(maxsize=None)
+def adapter(tp) -> TypeAdapter:
+    # Un TypeAdapter por tipo (construirlo compila el esquema de validación)
+    return TypeAdapter(tp)
+
+
+def encode(tp, data: Any) -> bytes:
+    """
+    Valida `data` (objetos ORM o dicts) contra `tp` y lo serializa a JSON en un solo paso.
+    Las fechas, decimales, etc. se codifican igual que en las respuestas de FastAPI.
+    """
+    ta = adapter(tp)
+    return ta.dump_json(ta.validate_python(data, from_attributes=True))
+
+
+def raw_json_response(body: bytes, headers: Optional[Dict[str, str]] = None, status_code: int = 200) -> Response:
+    # Para cuerpos ya codificados (cachés, `encode`): no se vuelven a validar ni a codificar
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+def model_response(tp, data: Any, headers: Optional[Dict[str, str]] = None, status_code: int = 200) -> Response:
+    return raw_json_response(encode(tp, data), headers=headers, status_code=status_code)
+
+
+def join_json_array(items: Iterable[bytes]) -> bytes:
+    # Arma una lista JSON con elementos ya codificados
+    return b"[" + b",".join(items) + b"]"
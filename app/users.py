@@ -1,60 +1,81 @@
-from fastapi import APIRouter, Depends, HTTPException
-from .auth import get_current_active_user, get_password_hash
-from .database import engine, get_db
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from .auth import get_current_active_user, invalidate_user
+from .database import get_async_db, get_read_db, read_router
+from .hashing import hash_password_async
+from .serialization import model_response
+from .pagination import PageParams, cursor_headers, keyset_page, parse_fields, sparse_response
 from . import models, schemas
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 #users = APIRouter(dependencies=[Depends(get_current_active_user)])
 users = APIRouter()
 
 @users.get("/", response_model=list[schemas.UserResponse])
-def read_users(db: Session = Depends(get_db), current_user: schemas.UserResponse = Depends(get_current_active_user)):
+async def read_users(
+    request: Request,
+    is_admin: Optional[bool] = Query(None),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: schemas.UserResponse = Depends(get_current_active_user),
+):
     """
-    Endpoint para obtener la información de los usuarios.
+    Endpoint para obtener la información de los usuarios, paginada por cursor
+    (`after`, `limit`; DEFAULT_PAGE_SIZE por página si no se indica). El siguiente cursor se
+    devuelve en `X-Next-Cursor` y en `Link`.
     """
-    users = db.query(models.User).all()
-    if not users:
-        return []
-    return users
+    stmt = select(models.User)
+    if is_admin is not None:
+        stmt = stmt.where(models.User.is_admin == is_admin)
+
+    selected = parse_fields(page.fields, schemas.UserResponse.model_fields)
+    if selected:
+        stmt = stmt.with_only_columns(*[getattr(models.User, f) for f in selected])
+        rows, next_cursor = await keyset_page(db, stmt, models.User.id, page.after, page.limit, scalars=False)
+        return sparse_response(rows, cursor_headers(request, next_cursor))
+
+    users, next_cursor = await keyset_page(db, stmt, models.User.id, page.after, page.limit)
+    return model_response(list[schemas.UserResponse], users, headers=cursor_headers(request, next_cursor))
 
 @users.get("/{user_id}", response_model=schemas.UserResponse)
-def read_user(user_id: int, db: Session = Depends(get_db), current_user: schemas.UserResponse = Depends(get_current_active_user)):
+async def read_user(user_id: int, db: AsyncSession = Depends(get_read_db), current_user: schemas.UserResponse = Depends(get_current_active_user)):
     """
     Endpoint para obtener la información de un usuario específico por ID.
     """
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = await db.get(models.User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     return user
 
 @users.post("/", response_model=schemas.UserResponse)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Endpoint para crear un nuevo usuario.
     """
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
+    db_user = await db.scalar(select(models.User).where(models.User.email == user.email).limit(1))
     if db_user:
         raise HTTPException(status_code=400, detail="Email ya registrado")
     
     new_user = models.User(
         email=user.email,
-        password= get_password_hash(user.password),  # Asegúrate de hashear la contraseña antes de guardarla
+        password= await hash_password_async(user.password),  # Asegúrate de hashear la contraseña antes de guardarla
         is_admin=user.is_admin,
         username=user.username
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     return new_user
 
 @users.put("/{user_id}", response_model=schemas.UserResponse)
-def update_user(user_id: int, user_update: schemas.UserCreate, db: Session = Depends(get_db), current_user: schemas.UserResponse = Depends(get_current_active_user)):
+async def update_user(user_id: int, user_update: schemas.UserCreate, db: AsyncSession = Depends(get_async_db), current_user: schemas.UserResponse = Depends(get_current_active_user)):
     """
     Endpoint para actualizar la información de un usuario específico por ID.
     """
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    db_user = await db.get(models.User, user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
@@ -62,22 +83,26 @@ def update_user(user_id: int, user_update: schemas.UserCreate, db: Session = Dep
     db_user.username = user_update.username
     db_user.email = user_update.email
     if user_update.password:
-        db_user.password = get_password_hash(user_update.password)  # Actualizar la contraseña
-    db.commit()
-    db.refresh(db_user)
+        db_user.password = await hash_password_async(user_update.password)  # Actualizar la contraseña
+    await db.commit()
+    await db.refresh(db_user)
+    invalidate_user(user_id)
+    read_router.mark_write(user_id)
     
     return db_user
 
 @users.delete("/{user_id}", response_model=schemas.UserResponse)
-def delete_user(user_id: int, db: Session = Depends(get_db), current_user: schemas.UserResponse = Depends(get_current_active_user)):
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_async_db), current_user: schemas.UserResponse = Depends(get_current_active_user)):
     """
     Endpoint para eliminar un usuario específico por ID.
     """
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    db_user = await db.get(models.User, user_id)
     if not db_user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
-    db.delete(db_user)
-    db.commit()
+    await db.delete(db_user)
+    await db.commit()
+    invalidate_user(user_id)
+    read_router.mark_write(user_id)
     
     return db_user
\ No newline at end of file
@@ -0,0 +1,97 @@
+# benchmarks/bench_serialization.py
+# Costo de serializar el catálogo y las listas de pedidos: camino por defecto de FastAPI
+# (validar contra response_model, convertir a objetos Python, json.dumps) contra
+# app.serialization (validar una vez y serializar en Rust) y bytes ya cacheados.
+#
+#   python -m benchmarks.bench_serialization [--paletas 1000] [--pedidos 500] [--items 5]
+import argparse
+import datetime
+import json
+import os
+import statistics
+import time
+from typing import Callable, List
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from pydantic import TypeAdapter  # noqa: E402
+
+from app import models, schemas  # noqa: E402
+from app.serialization import encode, join_json_array  # noqa: E402
+
+
+def crear_paletas(n: int) -> List[models.Paleta]:
+    ahora = datetime.datetime(2025, 1, 1)
+    return [
+        models.Paleta(
+            id=i, nombre=f"Paleta {i}", descripcion="Paleta artesanal de fruta natural " * 3,
+            ingredientes="Fruta, agua, azúcar", precio=25.5, imagen_url=f"/static/x/{i}.jpg",
+            tiene_oferta=i % 3 == 0, texto_oferta="2 x 1" if i % 3 == 0 else None,
+            fecha_creacion=ahora, fecha_actualizacion=ahora,
+        )
+        for i in range(1, n + 1)
+    ]
+
+
+def crear_pedidos(n: int, items: int) -> List[models.Order]:
+    pedidos = []
+    for i in range(1, n + 1):
+        order = models.Order(id=i, user_id=i % 50, created_at=datetime.datetime(2025, 1, 1), attended=bool(i % 2))
+        order.items = [
+            models.OrderItem(
+                id=i * items + j, order_id=i, paleta_id=j, quantity=j + 1, nombre=f"Paleta {j}",
+                descripcion="Fresa", ingredientes="Fresa, agua", precio=20.0, imagen_url=None,
+            )
+            for j in range(items)
+        ]
+        pedidos.append(order)
+    return pedidos
+
+
+def fastapi_por_defecto(tp, data) -> bytes:
+    # Lo que hace FastAPI con `response_model` y JSONResponse
+    ta = TypeAdapter(tp)
+    validated = ta.validate_python(data, from_attributes=True)
+    return json.dumps(ta.dump_python(validated, mode="json"), ensure_ascii=False).encode("utf-8")
+
+
+def medir(func: Callable[[], bytes], repeticiones: int) -> float:
+    func()  # calentamiento (compila esquemas, llena cachés)
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        func()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--paletas", type=int, default=1000)
+    parser.add_argument("--pedidos", type=int, default=500)
+    parser.add_argument("--items", type=int, default=5)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    paletas = crear_paletas(args.paletas)
+    pedidos = crear_pedidos(args.pedidos, args.items)
+    validadas = TypeAdapter(List[schemas.PaletaInDB]).validate_python(paletas, from_attributes=True)
+    codificadas = {p.id: p.model_dump_json().encode() for p in validadas}
+
+    casos = [
+        ("catálogo", "FastAPI por defecto", lambda: fastapi_por_defecto(List[schemas.PaletaInDB], paletas)),
+        ("catálogo", "encode (pydantic-core)", lambda: encode(List[schemas.PaletaInDB], paletas)),
+        ("catálogo", "bytes cacheados", lambda: join_json_array(codificadas.values())),
+        ("pedidos", "FastAPI por defecto", lambda: fastapi_por_defecto(List[schemas.OrderInDB], pedidos)),
+        ("pedidos", "encode (pydantic-core)", lambda: encode(List[schemas.OrderInDB], pedidos)),
+    ]
+    base = {}
+    print(f"{'lista':<10} {'camino':<24} {'mediana ms':>11} {'vs. defecto':>12}")
+    for lista, camino, func in casos:
+        segundos = medir(func, args.repeticiones)
+        base.setdefault(lista, segundos)
+        print(f"{lista:<10} {camino:<24} {segundos * 1000:>11.2f} {base[lista] / segundos:>11.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+# benchmarks/load.py
+# Prueba de carga reproducible de la API, en el mismo proceso (sin red ni servidor aparte):
+#
+# 1. Siembra un archivo SQLite con paletas, usuarios, pedidos e ítems (tamaños configurables;
+#    el archivo se reutiliza mientras no cambien los tamaños).
+# 2. Arranca la app con su `lifespan` y la maneja con httpx.AsyncClient sobre ASGITransport.
+# 3. N usuarios virtuales mezclan catálogo, búsqueda, carrito, checkout, login y pedidos
+#    durante `--duration` segundos. Cada usuario virtual usa su propio generador con semilla:
+#    la secuencia de operaciones es la misma en cada corrida.
+# 4. Reporta RPS y p50/p95/p99 por ruta, guarda el resultado en JSON y lo compara con una
+#    línea base (código de salida 1 si hay regresiones).
+#
+#   python -m benchmarks.load --paletas 1000 --users 100000 --order-items 1000000
+#   python -m benchmarks.load --duration 30 --concurrency 64 --output resultados.json
+#   python -m benchmarks.load --baseline benchmarks/baseline.json          # compara
+#   python -m benchmarks.load --save-baseline benchmarks/baseline.json     # actualiza la base
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import create_engine, func, insert, select, text
+
+BENCH_PASSWORD = "benchmark"
+DATA_DIR = Path(__file__).parent / ".data"
+RESULTS_DIR = Path(__file__).parent / "results"
+# Una regresión: p95 más de `tolerance` por encima de la base o RPS más de `tolerance` por debajo
+DEFAULT_TOLERANCE = 0.15
+# Rutas con menos muestras no se comparan (sus percentiles no son estables)
+MIN_SAMPLES = 20
+INSERT_CHUNK = 20_000
+
+WORDS = ["fresa", "mango", "limón", "chamoy", "uva", "coco", "nuez", "vainilla", "tamarindo", "pepino", "sandía", "café"]
+
+
+# --- Datos ---
+
+def seed(url: str, paletas: int, users: int, order_items: int, items_per_order: int = 4, seed_value: int = 42):
+    """Crea el esquema (migraciones) y carga datos deterministas con inserciones por lotes."""
+    from app import models
+    from app.hashing import pwd_context
+    from app.migrations import upgrade
+
+    engine = create_engine(url)
+    upgrade(engine)
+    rng = random.Random(seed_value)
+    password = pwd_context.hash(BENCH_PASSWORD)  # un solo hash de bcrypt para todos
+    started = datetime.datetime(2024, 1, 1)
+
+    def chunks(rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= INSERT_CHUNK:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    with engine.begin() as conn:
+        for batch in chunks(
+            {
+                "id": i,
+                "nombre": f"Paleta {rng.choice(WORDS)} {i}",
+                "descripcion": f"Paleta de {rng.choice(WORDS)} con {rng.choice(WORDS)}",
+                "ingredientes": ", ".join(rng.sample(WORDS, 3)),
+                "precio": round(rng.uniform(15, 60), 2),
+                "imagen_url": None,
+                "tiene_oferta": rng.random() < 0.2,
+                "texto_oferta": None,
+            }
+            for i in range(1, paletas + 1)
+        ):
+            conn.execute(insert(models.Paleta), batch)
+
+        for batch in chunks(
+            {"id": i, "email": f"user{i}@bench.local", "username": f"user{i}", "password": password, "is_admin": i == 1}
+            for i in range(1, users + 1)
+        ):
+            conn.execute(insert(models.User), batch)
+
+        orders = order_items // items_per_order
+        for batch in chunks(
+            {
+                "id": i,
+                "user_id": rng.randint(1, users),
+                "created_at": started + datetime.timedelta(minutes=i),
+                "attended": rng.random() < 0.7,
+            }
+            for i in range(1, orders + 1)
+        ):
+            conn.execute(insert(models.Order), batch)
+
+        for batch in chunks(
+            {
+                "order_id": (i // items_per_order) + 1,
+                "paleta_id": (i % paletas) + 1,
+                "quantity": rng.randint(1, 5),
+                "nombre": f"Paleta {(i % paletas) + 1}",
+                "descripcion": None,
+                "ingredientes": None,
+                "precio": 25.0,
+                "imagen_url": None,
+            }
+            for i in range(orders * items_per_order)
+        ):
+            conn.execute(insert(models.OrderItem), batch)
+        conn.execute(text("ANALYZE"))
+    engine.dispose()
+
+
+def prepare_database(path: Path, paletas: int, users: int, order_items: int, reseed: bool = False) -> str:
+    url = f"sqlite:///{path}"
+    if path.exists() and not reseed:
+        engine = create_engine(url)
+        from app import models
+        with engine.connect() as conn:
+            counts = (
+                conn.scalar(select(func.count()).select_from(models.Paleta)),
+                conn.scalar(select(func.count()).select_from(models.User)),
+            )
+        engine.dispose()
+        if counts == (paletas, users):
+            return url
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        path.unlink()
+    print(f"Sembrando {path} ({paletas} paletas, {users} usuarios, {order_items} ítems de pedido)...")
+    started = time.perf_counter()
+    seed(url, paletas, users, order_items)
+    print(f"  listo en {time.perf_counter() - started:.1f} s")
+    return url
+
+
+# --- Tráfico ---
+
+# (nombre de la ruta, peso en la mezcla)
+TRAFFIC_MIX = [
+    ("GET /paletas/", 25),
+    ("GET /paletas/{paleta_id}", 15),
+    ("GET /paletas/search", 8),
+    ("GET /cart/{user_id}", 12),
+    ("POST /cart/add", 12),
+    ("POST /orders", 4),
+    ("POST /token", 2),
+    ("GET /orders/user/{user_id}", 12),
+    ("GET /orders/all", 10),
+]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, route: str, seconds: float, ok: bool):
+        self.samples.setdefault(route, []).append(seconds)
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+
+async def timed(recorder: Recorder, route: str, request, expected=(200, 201)):
+    started = time.perf_counter()
+    try:
+        response = await request
+        ok = response.status_code in expected
+    except Exception:
+        response, ok = None, False
+    recorder.record(route, time.perf_counter() - started, ok)
+    return response
+
+
+async def login(client, recorder: Recorder, user_id: int) -> Optional[str]:
+    response = await timed(recorder, "POST /token", client.post(
+        "/token", data={"username": f"user{user_id}@bench.local", "password": BENCH_PASSWORD}
+    ))
+    if response is None or response.status_code != 200:
+        return None
+    return response.json()["access_token"]
+
+
+def user_for(index: int, dataset: dict) -> int:
+    # Cada usuario virtual es un usuario sembrado distinto (el 1 es el administrador)
+    return 2 + (index * 7919) % (dataset["users"] - 1)
+
+
+async def virtual_user(client, recorder: Recorder, index: int, dataset: dict, deadline: float, token: str):
+    rng = random.Random(1000 + index)
+    user_id = user_for(index, dataset)
+    headers = {"Authorization": f"Bearer {token}"}
+    routes = [route for route, _ in TRAFFIC_MIX]
+    weights = [weight for _, weight in TRAFFIC_MIX]
+
+    while time.perf_counter() < deadline:
+        route = rng.choices(routes, weights)[0]
+        paleta_id = rng.randint(1, dataset["paletas"])
+        if route == "GET /paletas/":
+            await timed(recorder, route, client.get("/paletas/"))
+        elif route == "GET /paletas/{paleta_id}":
+            await timed(recorder, route, client.get(f"/paletas/{paleta_id}"))
+        elif route == "GET /paletas/search":
+            await timed(recorder, route, client.get("/paletas/search", params={"q": rng.choice(WORDS)[:3]}))
+        elif route == "GET /cart/{user_id}":
+            await timed(recorder, route, client.get(f"/cart/{user_id}", headers=headers))
+        elif route == "POST /cart/add":
+            body = {"user_id": user_id, "paleta_id": paleta_id, "quantity": rng.randint(1, 3)}
+            await timed(recorder, route, client.post("/cart/add", json=body, headers=headers))
+        elif route == "POST /orders":
+            # Checkout: agrega algo al carrito y confirma el pedido
+            body = {"user_id": user_id, "paleta_id": paleta_id, "quantity": 1}
+            await timed(recorder, "POST /cart/add", client.post("/cart/add", json=body, headers=headers))
+            await timed(recorder, route, client.post("/orders", params={"user_id": user_id}, headers=headers))
+        elif route == "POST /token":
+            token = await login(client, recorder, user_id) or token
+            headers = {"Authorization": f"Bearer {token}"}
+        elif route == "GET /orders/user/{user_id}":
+            other = rng.randint(2, dataset["users"])
+            await timed(recorder, route, client.get(f"/orders/user/{other}", params={"limit": 20}, headers=headers))
+        elif route == "GET /orders/all":
+            params = {"limit": 50, "attended": rng.choice(["true", "false"])}
+            await timed(recorder, route, client.get("/orders/all", params=params, headers=headers))
+
+
+async def run_load(app, dataset: dict, concurrency: int, duration: float, warmup: float) -> Tuple[Recorder, float]:
+    import httpx
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            # Un login por usuario virtual antes de medir: si no, la ráfaga inicial de bcrypt
+            # domina los primeros segundos. En la mezcla sigue habiendo logins (POST /token)
+            setup = Recorder()
+            tokens = await asyncio.gather(*[login(client, setup, user_for(i, dataset)) for i in range(concurrency)])
+            if None in tokens:
+                raise RuntimeError("No se pudo iniciar sesión con los usuarios sembrados")
+            if warmup > 0:
+                # Calentamiento (cachés, pool, planes de SQLite) sin registrar resultados
+                deadline = time.perf_counter() + warmup
+                await asyncio.gather(*[
+                    virtual_user(client, Recorder(), i, dataset, deadline, tokens[i]) for i in range(concurrency)
+                ])
+            recorder = Recorder()
+            started = time.perf_counter()
+            deadline = started + duration
+            await asyncio.gather(*[
+                virtual_user(client, recorder, i, dataset, deadline, tokens[i]) for i in range(concurrency)
+            ])
+            elapsed = time.perf_counter() - started
+    return recorder, elapsed
+
+
+# --- Resultados ---
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    # Rango más cercano: el menor valor con al menos p% de las muestras por debajo o igual
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(samples: List[float], errors: int, elapsed: float) -> dict:
+    values = sorted(samples)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(1000 * sum(values) / len(values), 3) if values else 0.0,
+        "p50_ms": round(1000 * percentile(values, 50), 3),
+        "p95_ms": round(1000 * percentile(values, 95), 3),
+        "p99_ms": round(1000 * percentile(values, 99), 3),
+    }
+
+
+def build_results(recorder: Recorder, elapsed: float, meta: dict) -> dict:
+    routes = {
+        route: summarize(samples, recorder.errors.get(route, 0), elapsed)
+        for route, samples in sorted(recorder.samples.items())
+    }
+    every = [s for samples in recorder.samples.values() for s in samples]
+    return {
+        "meta": meta,
+        "routes": routes,
+        "total": summarize(every, sum(recorder.errors.values()), elapsed),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Regresiones por ruta frente a la línea base (p95 más alto o RPS más bajo que la tolerancia)."""
+    regressions = []
+    for route, current in results["routes"].items():
+        base = baseline.get("routes", {}).get(route)
+        if base is None or min(base["requests"], current["requests"]) < MIN_SAMPLES:
+            continue
+        if base["p95_ms"] > 0 and current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {base['p95_ms']} ms -> {current['p95_ms']} ms")
+        if base["rps"] > 0 and current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{route}: RPS {base['rps']} -> {current['rps']}")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{route}: errores {base['errors']} -> {current['errors']}")
+    return regressions
+
+
+def print_table(results: dict):
+    print(f"{'ruta':<30} {'peticiones':>10} {'errores':>8} {'RPS':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, r in list(results["routes"].items()) + [("TOTAL", results["total"])]:
+        print(
+            f"{route:<30} {r['requests']:>10} {r['errors']:>8} {r['rps']:>9.1f} "
+            f"{r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f}"
+        )
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Prueba de carga en proceso contra una BD SQLite sembrada.")
+    parser.add_argument("--paletas", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--order-items", type=int, default=100_000)
+    parser.add_argument("--db", type=Path, default=None, help="archivo SQLite (por defecto uno por tamaño en benchmarks/.data)")
+    parser.add_argument("--reseed", action="store_true", help="vuelve a sembrar aunque el archivo exista")
+    parser.add_argument("--concurrency", type=int, default=32, help="usuarios virtuales")
+    parser.add_argument("--duration", type=float, default=20.0, help="segundos de medición")
+    parser.add_argument("--warmup", type=float, default=3.0, help="segundos de calentamiento sin medir")
+    parser.add_argument("--output", type=Path, default=None, help="JSON de resultados (por defecto en benchmarks/results)")
+    parser.add_argument("--baseline", type=Path, default=None, help="JSON de una corrida anterior para comparar")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--save-baseline", type=Path, default=None, help="guarda esta corrida como línea base")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or DATA_DIR / f"bench-{args.paletas}-{args.users}-{args.order_items}.sqlite3"
+    url = prepare_database(db_path, args.paletas, args.users, args.order_items, args.reseed)
+
+    # La configuración de la app se lee al importarla
+    os.environ["DATABASE_URL"] = url
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ.setdefault("SLOW_LOG_PATH", "")
+    from app.main import app
+
+    dataset = {"paletas": args.paletas, "users": args.users, "order_items": args.order_items}
+    recorder, elapsed = asyncio.run(run_load(app, dataset, args.concurrency, args.duration, args.warmup))
+    meta = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "dataset": dataset,
+        "concurrency": args.concurrency,
+        "duration_seconds": round(elapsed, 3),
+    }
+    results = build_results(recorder, elapsed, meta)
+    print_table(results)
+
+    output = args.output or RESULTS_DIR / f"load-{meta['timestamp'].replace(':', '')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nResultados en {output}")
+    if args.save_baseline:
+        args.save_baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.save_baseline.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Línea base guardada en {args.save_baseline}")
+
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        if regressions:
+            print(f"\nRegresiones frente a {args.baseline} (tolerancia {args.tolerance:.0%}):")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+        print(f"\nSin regresiones frente a {args.baseline}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
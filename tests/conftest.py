@@ -1,34 +1,41 @@
 # tests/conftest.py
 import os
-os.environ["TESTING_ENV"] = "True"
-
-# Intento de limpieza explícita de MetaData (mantener por ahora)
-try:
-    from app.database import Base as AppBaseForClearing
-    AppBaseForClearing.metadata.clear()
-    print("DEBUG (conftest.py pre-import): app.database.Base.metadata cleared.")
-except Exception as e:
-    print(f"DEBUG (conftest.py pre-import): Could not clear metadata: {e}")
-
+import atexit
+import tempfile
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine, inspect # <--- AÑADE 'inspect'
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session as SQLAlchemySession
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 
 from app.main import app
-from app.database import Base, get_db
+from app.database import Base, get_async_db, get_catalog_read_db, get_read_db
+from app.auth import get_current_active_user, principal_cache, token_cache
+from app.cache import catalog_cache
+
+# Archivo SQLite temporal: lo comparten el motor síncrono (fixtures) y el asíncrono (la app),
+# cosa que una BD ":memory:" no permite entre drivers distintos.
+_db_fd, TEST_DB_PATH = tempfile.mkstemp(suffix=".sqlite3")
+os.close(_db_fd)
+atexit.register(lambda: os.path.exists(TEST_DB_PATH) and os.remove(TEST_DB_PATH))
 
-SQLALCHEMY_DATABASE_URL_TEST = "sqlite:///:memory:"
+SQLALCHEMY_DATABASE_URL_TEST = f"sqlite:///{TEST_DB_PATH}"
+# Los motores propios de la app (p. ej. los que crea `lifespan`) también apuntan a la BD de pruebas
+os.environ["DATABASE_URL"] = SQLALCHEMY_DATABASE_URL_TEST
+os.environ.pop("ASYNC_DATABASE_URL", None)
 
 engine_test = create_engine(
     SQLALCHEMY_DATABASE_URL_TEST,
     connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
 )
 
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine_test)
 
+# TestClient usa un event loop por petición: NullPool evita reutilizar conexiones entre loops
+async_engine_test = create_async_engine(f"sqlite+aiosqlite:///{TEST_DB_PATH}", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine_test, autoflush=False, expire_on_commit=False)
+
 @pytest.fixture(scope="session", autouse=True)
 def setup_test_database():
     print("\nDEBUG (setup_test_database): Starting session-scoped database setup.")
@@ -67,29 +74,23 @@ def setup_test_database():
         raise # Vuelve a lanzar la excepción para que pytest la vea claramente
 
     # ----- Configuración de override de dependencia -----
-    # (El código para override_get_db_test y app.dependency_overrides sigue igual)
-    print(f"DEBUG (setup_test_database): Is get_db callable before override? {callable(get_db)}")
-    
-    def _override_get_db_for_test():
-        try:
-            db_test_session = TestingSessionLocal()
+    async def _override_get_async_db_for_test():
+        async with TestingAsyncSessionLocal() as db_test_session:
             yield db_test_session
-        finally:
-            db_test_session.close()
 
-    original_dependency = app.dependency_overrides.get(get_db)
-    app.dependency_overrides[get_db] = _override_get_db_for_test
-    print("DEBUG (setup_test_database): get_db dependency overridden for test session.")
+    app.dependency_overrides[get_async_db] = _override_get_async_db_for_test
+    # Sin réplicas en las pruebas: las lecturas usan la misma BD
+    app.dependency_overrides[get_read_db] = _override_get_async_db_for_test
+    app.dependency_overrides[get_catalog_read_db] = _override_get_async_db_for_test
+    print("DEBUG (setup_test_database): get_async_db dependency overridden for test session.")
     
     yield # Las pruebas de la sesión se ejecutan aquí
     
-    print("DEBUG (setup_test_database): Test session finished. Restoring/clearing get_db override.")
-    if original_dependency:
-        app.dependency_overrides[get_db] = original_dependency
-    else:
-        if get_db in app.dependency_overrides and app.dependency_overrides[get_db] == _override_get_db_for_test:
-            del app.dependency_overrides[get_db]
-    print("DEBUG (setup_test_database): get_db dependency restored/cleared.")
+    print("DEBUG (setup_test_database): Test session finished. Clearing dependency overrides.")
+    app.dependency_overrides.pop(get_async_db, None)
+    app.dependency_overrides.pop(get_read_db, None)
+    app.dependency_overrides.pop(get_catalog_read_db, None)
+    print("DEBUG (setup_test_database): dependency overrides cleared.")
 
 
 # tests/conftest.py
@@ -114,6 +115,11 @@ def db_session(setup_test_database) -> SQLAlchemySession: # Sigue dependiendo de
             db.execute(table_obj.delete()) # Genera "DELETE FROM <nombre_tabla>"
         db.commit()
         db.close()
+        # Los DELETE directos no pasan por los endpoints: invalidar cachés y ETags
+        catalog_cache.bump()
+        catalog_cache.recheck()
+        principal_cache.clear()
+        token_cache.clear()
         # print("DEBUG (db_session): DB session closed for a test function.")    # print("DEBUG (db_session): DB session closed for a test function.")
 
 @pytest.fixture(scope="function")
@@ -136,5 +142,14 @@ def create_paleta_fixture(db_session):
         db_session.add(paleta)
         db_session.commit()
         db_session.refresh(paleta)
+        catalog_cache.bump()
         return paleta
-    return _create_paleta
\ No newline at end of file
+    return _create_paleta
+
+@pytest.fixture(scope="function")
+def admin_client(client):
+    from app import models
+    admin = models.User(id=1, email="admin@test.com", username="admin", password="x", is_admin=True)
+    app.dependency_overrides[get_current_active_user] = lambda: admin
+    yield client
+    app.dependency_overrides.pop(get_current_active_user, None)
\ No newline at end of file
@@ -0,0 +1,69 @@
+# tests/test_analytics.py
+import datetime
+
+from sqlalchemy import func, select
+
+from app import models
+from app.analytics import backfill
+from tests.conftest import engine_test
+
+USER_ID = 1
+
+
+def comprar(client, paleta_id: int, quantity: int) -> dict:
+    client.post("/cart/add", json={"user_id": USER_ID, "paleta_id": paleta_id, "quantity": quantity})
+    response = client.post(f"/orders?user_id={USER_ID}")
+    assert response.status_code == 200
+    return response.json()
+
+
+def reporte(client, **params) -> dict:
+    response = client.get("/analytics/sales", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_acumulados_al_crear_y_atender_pedidos(admin_client, create_paleta_fixture):
+    fresa = create_paleta_fixture(nombre="Paleta Fresa Ventas", precio=10.0)
+    mango = create_paleta_fixture(nombre="Paleta Mango Ventas", precio=15.0)
+    primero = comprar(admin_client, fresa.id, 3)
+    comprar(admin_client, mango.id, 1)
+    comprar(admin_client, fresa.id, 2)
+
+    data = reporte(admin_client)
+    assert data["units"] == 6
+    assert data["revenue"] == 65.0
+    assert data["top_sellers"][0] == {"paleta_id": fresa.id, "nombre": "Paleta Fresa Ventas", "units": 5, "revenue": 50.0}
+    assert data["orders"] == {"orders": 3, "attended": 0, "pending": 3}
+
+    # Atender dos veces el mismo pedido cuenta una sola vez
+    for _ in range(2):
+        response = admin_client.patch(f"/orders/{primero['id']}/attend")
+        assert response.status_code == 200
+        assert response.json()["attended"] is True
+    assert reporte(admin_client)["orders"] == {"orders": 3, "attended": 1, "pending": 2}
+
+
+def test_rango_de_fechas(admin_client, create_paleta_fixture):
+    paleta = create_paleta_fixture(nombre="Paleta Rango", precio=10.0)
+    comprar(admin_client, paleta.id, 1)
+    ayer = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=1)).date()
+    data = reporte(admin_client, since="2000-01-01", until=ayer.isoformat())
+    assert data["daily"] == [] and data["units"] == 0
+    assert data["orders"] == {"orders": 0, "attended": 0, "pending": 0}
+
+
+def test_backfill_coincide_con_los_incrementales(admin_client, create_paleta_fixture, db_session):
+    paleta = create_paleta_fixture(nombre="Paleta Backfill", precio=12.5)
+    comprar(admin_client, paleta.id, 2)
+    comprar(admin_client, paleta.id, 1)
+    antes = reporte(admin_client)
+
+    with engine_test.begin() as conn:
+        backfill(conn)
+        assert conn.scalar(select(func.count()).select_from(models.OrdersDaily)) == 1
+    assert reporte(admin_client) == antes
+
+
+def test_solo_administradores(client):
+    assert client.get("/analytics/sales").status_code == 401
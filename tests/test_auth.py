@@ -0,0 +1,93 @@
+# tests/test_auth.py
+import time
+from fastapi import status
+from sqlalchemy import event
+from app import models
+from app.auth import get_password_hash, principal_cache
+from tests.conftest import async_engine_test
+
+
+def crear_usuario(db_session, email="cliente@test.com", password="secreto123", is_admin=False):
+    user = models.User(email=email, password=get_password_hash(password), username="cliente", is_admin=is_admin)
+    db_session.add(user)
+    db_session.commit()
+    db_session.refresh(user)
+    return user
+
+
+def login(client, email="cliente@test.com", password="secreto123"):
+    response = client.post("/token", data={"username": email, "password": password})
+    assert response.status_code == status.HTTP_200_OK
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def contar_consultas():
+    statements = []
+
+    def listener(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    # La app consulta a través del motor asíncrono
+    event.listen(async_engine_test.sync_engine, "before_cursor_execute", listener)
+    return statements, lambda: event.remove(async_engine_test.sync_engine, "before_cursor_execute", listener)
+
+
+def test_token_con_claims_resuelve_sin_sql(client, db_session):
+    user = crear_usuario(db_session)
+    headers = login(client)
+
+    statements, stop = contar_consultas()
+    try:
+        response = client.get("/users/me/", headers=headers)
+    finally:
+        stop()
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["id"] == user.id
+    assert statements == []
+
+
+def test_verify_admin_con_token(client, db_session):
+    crear_usuario(db_session)
+    headers = login(client)
+    response = client.post("/paletas/", json={"nombre": "Paleta Sin Permiso", "precio": 10.0}, headers=headers)
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_cache_de_usuario_se_invalida_al_eliminar(client, db_session):
+    crear_usuario(db_session, email="admin@test.com", is_admin=True)
+    victima = crear_usuario(db_session, email="victima@test.com")
+    admin_headers = login(client, email="admin@test.com")
+    victima_headers = login(client, email="victima@test.com")
+    assert principal_cache.get(victima.id) is not None
+
+    assert client.delete(f"/{victima.id}", headers=admin_headers).status_code == status.HTTP_200_OK
+    assert principal_cache.get(victima.id) is None
+    assert client.get("/users/me/", headers=victima_headers).status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_login_responde_503_si_el_pool_de_bcrypt_esta_lleno(client, db_session, monkeypatch):
+    from app.hashing import hash_pool
+    crear_usuario(db_session)
+    monkeypatch.setattr(hash_pool, "max_pending", 0)
+    response = client.post("/token", data={"username": "cliente@test.com", "password": "secreto123"})
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "1"
+    assert hash_pool.stats()["rejected"] >= 1
+
+
+def test_hash_pool_cuenta_la_cola():
+    import threading
+    from app.hashing import HashPool
+    pool = HashPool(kind="thread", workers=1, max_pending=1)
+    liberar = threading.Event()
+    future = pool._submit(liberar.wait)
+    assert pool.stats()["pending"] == 1
+    liberar.set()
+    future.result()
+    # El contador se actualiza en el callback del future, justo después de resolverse
+    deadline = time.monotonic() + 1
+    while pool.stats()["pending"] and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert pool.stats()["pending"] == 0
+    assert pool.stats()["completed"] == 1
+    pool.shutdown()
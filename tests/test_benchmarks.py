@@ -0,0 +1,54 @@
+# tests/test_benchmarks.py
+from sqlalchemy import create_engine, func, select
+
+from app import models
+from benchmarks.load import Recorder, build_results, compare, percentile, prepare_database
+
+
+def test_percentiles_por_rango_mas_cercano():
+    values = [i / 100 for i in range(1, 101)]
+    assert percentile(values, 50) == 0.5
+    assert percentile(values, 95) == 0.95
+    assert percentile(values, 99) == 0.99
+    assert percentile([0.3], 99) == 0.3
+    assert percentile([], 50) == 0.0
+
+
+def resultados(segundos: float, cantidad: int = 50, duracion: float = 10.0) -> dict:
+    recorder = Recorder()
+    for _ in range(cantidad):
+        recorder.record("GET /paletas/", segundos, ok=True)
+    return build_results(recorder, duracion, meta={})
+
+
+def test_regresiones_contra_la_linea_base():
+    base = resultados(0.010)
+    assert compare(resultados(0.011), base) == []
+    # p95 un 50% más alto
+    assert compare(resultados(0.015), base) == ["GET /paletas/: p95 10.0 ms -> 15.0 ms"]
+    # La mitad de RPS
+    assert compare(resultados(0.010, duracion=20.0), base) == ["GET /paletas/: RPS 5.0 -> 2.5"]
+    # Muy pocas muestras: no se compara
+    assert compare(resultados(0.050, cantidad=5), resultados(0.010, cantidad=5)) == []
+
+
+def test_siembra_reproducible(tmp_path):
+    path = tmp_path / "bench.sqlite3"
+    url = prepare_database(path, paletas=10, users=20, order_items=40)
+    engine = create_engine(url)
+    with engine.connect() as conn:
+        assert conn.scalar(select(func.count()).select_from(models.Paleta)) == 10
+        assert conn.scalar(select(func.count()).select_from(models.User)) == 20
+        assert conn.scalar(select(func.count()).select_from(models.Order)) == 10
+        assert conn.scalar(select(func.count()).select_from(models.OrderItem)) == 40
+        primera = conn.execute(select(models.Order.user_id).order_by(models.Order.id)).scalars().all()
+    engine.dispose()
+    # Con los mismos tamaños el archivo se reutiliza; al volver a sembrar, mismos datos
+    mtime = path.stat().st_mtime_ns
+    assert prepare_database(path, paletas=10, users=20, order_items=40) == url
+    assert path.stat().st_mtime_ns == mtime
+    prepare_database(path, paletas=10, users=20, order_items=40, reseed=True)
+    engine = create_engine(url)
+    with engine.connect() as conn:
+        assert conn.execute(select(models.Order.user_id).order_by(models.Order.id)).scalars().all() == primera
+    engine.dispose()
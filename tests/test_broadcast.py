@@ -0,0 +1,117 @@
+# tests/test_broadcast.py
+import asyncio
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app import models
+from app.auth import create_access_token, invalidate_user
+from app.broadcast import BroadcastHub, SQLiteRelay, message
+from tests.test_orders_endpoints import crear_pedidos
+
+USER_ID = 1
+
+
+def token(is_admin: bool) -> str:
+    return create_access_token({"sub": "admin@test.com", "uid": USER_ID, "is_admin": is_admin})
+
+
+def crear_usuario(db_session, is_admin: bool) -> models.User:
+    user = models.User(id=USER_ID, email="admin@test.com", username="admin", password="x", is_admin=is_admin)
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def rechazado(client, url: str) -> int:
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect(url) as ws:
+            ws.receive_json()
+    return exc.value.code
+
+
+def test_stream_solo_para_administradores(client, db_session):
+    for url in ("/orders/stream", f"/orders/stream?token={token(False)}"):
+        assert rechazado(client, url) == 1008
+    # Un token con is_admin de alguien que ya no es admin (o ya no existe) tampoco sirve
+    assert rechazado(client, f"/orders/stream?token={token(True)}") == 1008
+    crear_usuario(db_session, is_admin=False)
+    assert rechazado(client, f"/orders/stream?token={token(True)}") == 1008
+
+
+def test_stream_se_cierra_al_quitar_el_admin(client, db_session, monkeypatch):
+    from app import main
+    monkeypatch.setattr(main, "ORDER_STREAM_REAUTH_SECONDS", 0.05)
+    user = crear_usuario(db_session, is_admin=True)
+
+    with client.websocket_connect(f"/orders/stream?token={token(True)}") as ws:
+        assert ws.receive_json()["type"] == "snapshot"
+        user.is_admin = False
+        db_session.commit()
+        invalidate_user(USER_ID)
+        with pytest.raises(WebSocketDisconnect) as exc:
+            ws.receive_json()
+        assert exc.value.code == 1008
+
+
+def test_stream_foto_y_cambios(admin_client, db_session, create_paleta_fixture):
+    crear_usuario(db_session, is_admin=True)
+    [atendido] = crear_pedidos(db_session, 1, attended=True)
+    [pendiente] = crear_pedidos(db_session, 1)
+    paleta = create_paleta_fixture(nombre="Paleta Stream", precio=12.0)
+
+    with admin_client.websocket_connect(f"/orders/stream?token={token(True)}") as ws:
+        foto = ws.receive_json()
+        assert foto["type"] == "snapshot"
+        assert [o["id"] for o in foto["orders"]] == [pendiente.id]
+        assert foto["orders"][0]["items"][0]["nombre"] == "Paleta 0"
+
+        admin_client.post("/cart/add", json={"user_id": USER_ID, "paleta_id": paleta.id, "quantity": 2})
+        response = admin_client.post(f"/orders?user_id={USER_ID}")
+        assert response.status_code == 200
+        creado = ws.receive_json()
+        assert creado == {"type": "order_created", "order": response.json()}
+
+        # Solo se publica lo que cambió: atender otra vez o uno ya atendido no manda nada
+        for order_id in (pendiente.id, pendiente.id, atendido.id):
+            admin_client.patch(f"/orders/{order_id}/attend")
+        admin_client.patch("/orders/attend", json={"ids": [pendiente.id, response.json()["id"]]})
+        assert ws.receive_json() == {"type": "orders_attended", "ids": [pendiente.id]}
+        assert ws.receive_json() == {"type": "orders_attended", "ids": [response.json()["id"]]}
+
+
+def test_relay_entre_workers(tmp_path):
+    async def escenario():
+        path = str(tmp_path / "events.sqlite3")
+        worker_a = BroadcastHub(SQLiteRelay(path), poll_seconds=0.01)
+        worker_b = BroadcastHub(SQLiteRelay(path), poll_seconds=0.01)
+        await worker_a.publish(message("orders_attended", ids=[1]))  # antes de suscribirse: no llega
+
+        local, remota = worker_a.subscribe(), worker_b.subscribe()
+        worker_a.subscribe()  # el relay de A también lee: no debe reenviarse lo propio
+        await worker_a.publish(message("orders_attended", ids=[2]))
+        await worker_b.publish(message("orders_attended", ids=[3]))
+
+        recibidos_b = [await asyncio.wait_for(remota.get(), 1) for _ in range(2)]
+        recibidos_a = [await asyncio.wait_for(local.get(), 1) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert local.queue.empty() and remota.queue.empty()
+        for worker in (worker_a, worker_b):
+            await worker.close()
+        return recibidos_a, recibidos_b
+
+    recibidos_a, recibidos_b = asyncio.run(escenario())
+    esperado = ['{"type":"orders_attended","ids":[2]}', '{"type":"orders_attended","ids":[3]}']
+    assert recibidos_a == esperado
+    assert recibidos_b == esperado[::-1]
+
+
+def test_suscripcion_atrasada():
+    async def escenario():
+        hub = BroadcastHub(queue_size=2)
+        subscription = hub.subscribe()
+        for i in range(5):
+            await hub.publish(message("orders_attended", ids=[i]))
+        return await subscription.get(), subscription.queue.empty()
+
+    assert asyncio.run(escenario()) == (None, True)
@@ -105,4 +105,150 @@ def test_decrease_from_cart_item_no_existente(client, create_paleta_fixture):
 
     response = client.patch(f"/cart/decrease?user_id={USER_ID_TEST}&paleta_id={paleta_no_en_carrito_id}")
     assert response.status_code == status.HTTP_404_NOT_FOUND
-    assert response.json()["detail"] == "Ítem no encontrado en el carrito."
\ No newline at end of file
+    assert response.json()["detail"] == "Ítem no encontrado en el carrito."
+
+def test_get_user_cart_etag_304(admin_client, create_paleta_fixture):
+    paleta = create_paleta_fixture(nombre="Paleta ETag Carrito", precio=10.0)
+    etag = admin_client.get(f"/cart/{USER_ID_TEST}").headers["ETag"]
+
+    response = admin_client.get(f"/cart/{USER_ID_TEST}", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    admin_client.post("/cart/add", json={"user_id": USER_ID_TEST, "paleta_id": paleta.id, "quantity": 1})
+    response = admin_client.get(f"/cart/{USER_ID_TEST}", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 1
+    assert response.headers["ETag"] != etag
+
+
+def test_get_user_cart_etag_ve_escrituras_de_otro_worker(admin_client, db_session, create_paleta_fixture):
+    from app import models
+    fresa = create_paleta_fixture(nombre="Paleta ETag Fresa", precio=10.0)
+    mango = create_paleta_fixture(nombre="Paleta ETag Mango", precio=10.0)
+    for paleta in (fresa, mango):
+        admin_client.post("/cart/add", json={"user_id": USER_ID_TEST, "paleta_id": paleta.id, "quantity": 2})
+    etag = admin_client.get(f"/cart/{USER_ID_TEST}").headers["ETag"]
+
+    # Escritura directa en la BD (como la de otro worker): mismas líneas y mismas unidades
+    items = db_session.query(models.CartItem).order_by(models.CartItem.id).all()
+    items[0].quantity, items[1].quantity = 3, 1
+    db_session.commit()
+    response = admin_client.get(f"/cart/{USER_ID_TEST}", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert [item["quantity"] for item in response.json()] == [3, 1]
+
+
+def test_get_user_cart_etag_cambia_con_totales_iguales(admin_client, db_session, create_paleta_fixture):
+    from app import models
+    paletas = [create_paleta_fixture(nombre=f"Paleta Totales {i}", precio=10.0) for i in range(3)]
+    for paleta, quantity in zip(paletas, (1, 3, 1)):
+        admin_client.post("/cart/add", json={"user_id": USER_ID_TEST, "paleta_id": paleta.id, "quantity": quantity})
+    etag = admin_client.get(f"/cart/{USER_ID_TEST}").headers["ETag"]
+
+    # Mismas líneas, mismas unidades y misma suma ponderada por id: solo cambia el contenido
+    items = db_session.query(models.CartItem).order_by(models.CartItem.id).all()
+    for item, quantity in zip(items, (2, 1, 2)):
+        item.quantity = quantity
+    db_session.commit()
+    response = admin_client.get(f"/cart/{USER_ID_TEST}", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert [item["quantity"] for item in response.json()] == [2, 1, 2]
+    etag = response.headers["ETag"]
+
+    # Un `set` con la misma cantidad refresca el precio copiado de la paleta
+    db_session.get(models.Paleta, paletas[0].id).precio = 12.0
+    db_session.commit()
+    admin_client.post(f"/cart/{USER_ID_TEST}/batch", json={"operations": [
+        {"op": "set", "paleta_id": paletas[0].id, "quantity": 2},
+    ]})
+    response = admin_client.get(f"/cart/{USER_ID_TEST}", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()[0]["precio"] == 12.0
+
+
+def test_add_to_cart_upsert_una_sola_sentencia(admin_client, create_paleta_fixture):
+    from sqlalchemy import event
+    from tests.conftest import async_engine_test
+    paleta = create_paleta_fixture(nombre="Paleta Upsert", precio=8.0)
+    admin_client.post("/cart/add", json={"user_id": USER_ID_TEST, "paleta_id": paleta.id, "quantity": 1})
+
+    statements = []
+    def listener(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(async_engine_test.sync_engine, "before_cursor_execute", listener)
+    try:
+        response = admin_client.post("/cart/add", json={"user_id": USER_ID_TEST, "paleta_id": paleta.id, "quantity": 2})
+    finally:
+        event.remove(async_engine_test.sync_engine, "before_cursor_execute", listener)
+
+    assert response.json()["quantity"] == 3
+    assert response.json()["subtotal"] == 24.0
+    assert len(statements) == 1
+    assert statements[0].startswith("INSERT INTO cart_items")
+
+
+def test_add_to_cart_concurrente_no_duplica_filas(db_session, create_paleta_fixture):
+    import asyncio
+    from app import models
+    from app.cart import upsert_cart_item
+    from tests.conftest import TestingAsyncSessionLocal
+    paleta = create_paleta_fixture(nombre="Paleta Concurrente", precio=5.0)
+
+    async def agregar():
+        async with TestingAsyncSessionLocal() as db:
+            await upsert_cart_item(db, USER_ID_TEST, paleta.id, 1)
+            await db.commit()
+
+    async def agregar_muchas():
+        await asyncio.gather(*[agregar() for _ in range(10)])
+
+    asyncio.run(agregar_muchas())
+    filas = db_session.query(models.CartItem).filter(models.CartItem.user_id == USER_ID_TEST).all()
+    assert len(filas) == 1
+    assert filas[0].quantity == 10
+
+
+def test_add_to_cart_paleta_personalizada(admin_client):
+    response = admin_client.post("/cart/add", json={
+        "user_id": USER_ID_TEST, "quantity": 2, "nombre": "Mi Paleta", "precio": 30.0, "ingredientes": "Mango, chile"
+    })
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["paleta_id"] is None
+    assert response.json()["subtotal"] == 60.0
+
+
+def test_batch_update_cart(admin_client, create_paleta_fixture):
+    fresa = create_paleta_fixture(nombre="Paleta Fresa Lote", precio=10.0)
+    mango = create_paleta_fixture(nombre="Paleta Mango Lote", precio=20.0)
+    coco = create_paleta_fixture(nombre="Paleta Coco Lote", precio=5.0)
+    admin_client.post("/cart/add", json={"user_id": USER_ID_TEST, "paleta_id": coco.id, "quantity": 4})
+    admin_client.post("/cart/add", json={"user_id": USER_ID_TEST, "paleta_id": mango.id, "quantity": 1})
+
+    response = admin_client.post(f"/cart/{USER_ID_TEST}/batch", json={"operations": [
+        {"op": "add", "paleta_id": fresa.id, "quantity": 2},
+        {"op": "add", "paleta_id": fresa.id, "quantity": 1},
+        {"op": "set", "paleta_id": mango.id, "quantity": 5},
+        {"op": "decrease", "paleta_id": mango.id, "quantity": 2},
+        {"op": "decrease", "paleta_id": coco.id, "quantity": 4},
+    ]})
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    cantidades = {item["paleta_id"]: item["quantity"] for item in data["items"]}
+    assert cantidades == {mango.id: 3, fresa.id: 3}
+    assert data["total_items"] == 6
+    assert data["total"] == 90.0
+
+    response = admin_client.post(f"/cart/{USER_ID_TEST}/batch", json={"operations": [
+        {"op": "remove", "paleta_id": fresa.id},
+    ]})
+    assert [item["paleta_id"] for item in response.json()["items"]] == [mango.id]
+
+
+def test_batch_update_cart_paleta_inexistente_no_escribe(admin_client, create_paleta_fixture):
+    paleta = create_paleta_fixture(nombre="Paleta Lote Valida", precio=10.0)
+    response = admin_client.post(f"/cart/{USER_ID_TEST}/batch", json={"operations": [
+        {"op": "add", "paleta_id": paleta.id, "quantity": 1},
+        {"op": "add", "paleta_id": 9999, "quantity": 1},
+    ]})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert admin_client.get(f"/cart/{USER_ID_TEST}").json() == []
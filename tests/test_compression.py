@@ -0,0 +1,146 @@
+# tests/test_compression.py
+import json
+import zlib
+
+from fastapi import FastAPI
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app import compression
+from app.compression import CODECS, Codec, CompressionMiddleware, compressed_bodies, negotiate
+
+
+def test_negociacion_de_codificacion():
+    disponibles = ["zstd", "br", "gzip"]
+    assert negotiate("gzip, deflate", disponibles) == "gzip"
+    assert negotiate("gzip, br", disponibles) == "br"
+    assert negotiate("gzip;q=1.0, br;q=0.5", disponibles) == "gzip"
+    assert negotiate("br;q=0, gzip;q=0.1", disponibles) == "gzip"
+    assert negotiate("*", disponibles) == "zstd"
+    assert negotiate("*, zstd;q=0", disponibles) == "br"
+    assert negotiate("identity", disponibles) is None
+    assert negotiate("", disponibles) is None
+
+
+def contar_compresiones(monkeypatch):
+    llamadas = []
+    original = CODECS["gzip"]
+
+    def compress(data):
+        llamadas.append(len(data))
+        return original.compress(data)
+
+    monkeypatch.setitem(CODECS, "gzip", Codec(compress, original.stream))
+    return llamadas
+
+
+def test_catalogo_comprimido_se_reutiliza(client, create_paleta_fixture, monkeypatch):
+    for i in range(10):
+        create_paleta_fixture(nombre=f"Paleta Comprimida {i}", descripcion="Fresa con crema " * 5)
+    compressed_bodies.clear()
+    llamadas = contar_compresiones(monkeypatch)
+
+    response = client.get("/paletas/", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert len(response.json()) == 10
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+
+    # El segundo cliente recibe los mismos bytes sin volver a comprimir
+    again = client.get("/paletas/", headers={"Accept-Encoding": "gzip"})
+    assert again.content == response.content
+    assert len(llamadas) == 1
+
+    # El ETag débil sigue sirviendo para revalidar
+    not_modified = client.get("/paletas/", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert not_modified.status_code == 304
+
+
+def test_respuestas_chicas_o_sin_accept_encoding_no_se_comprimen(client, create_paleta_fixture):
+    create_paleta_fixture(nombre="Paleta Chica")
+    response = client.get("/healthz", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+    response = client.get("/paletas/", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.json()[0]["nombre"] == "Paleta Chica"
+
+
+def mini_app(**rutas) -> TestClient:
+    app = FastAPI()
+    for path, endpoint in rutas.items():
+        app.get("/" + path)(endpoint)
+    app.add_middleware(CompressionMiddleware)
+    return TestClient(app)
+
+
+def test_streaming_se_comprime_por_partes():
+    async def lineas():
+        for i in range(500):
+            yield json.dumps({"id": i, "nombre": "Paleta"}).encode() + b"\n"
+
+    client = mini_app(export=lambda: StreamingResponse(lineas(), media_type="application/x-ndjson"))
+    with client.stream("GET", "/export", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        crudo = b"".join(response.iter_raw())
+    lineas_recibidas = zlib.decompress(crudo, 16 + zlib.MAX_WBITS).splitlines()
+    assert len(lineas_recibidas) == 500
+
+
+def test_archivo_se_comprime_una_vez(tmp_path, monkeypatch):
+    path = tmp_path / "app.js"
+    path.write_bytes(b"console.log('paletas');\n" * 10000)
+    compressed_bodies.clear()
+    llamadas = contar_compresiones(monkeypatch)
+
+    client = mini_app(js=lambda: FileResponse(path, media_type="application/javascript"))
+    for _ in range(2):
+        response = client.get("/js", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.content == path.read_bytes()
+    assert len(llamadas) == 1
+
+
+def test_archivos_con_igual_fecha_y_tamano_no_comparten_cache(tmp_path):
+    import os
+    # El ETag de FileResponse/StaticFiles es md5(mtime-tamaño): estos dos coinciden
+    rutas = [tmp_path / "a.js", tmp_path / "b.js"]
+    for path, texto in zip(rutas, (b"console.log('fresa');\n", b"console.log('mango');\n")):
+        path.write_bytes(texto * 1000)
+        os.utime(path, (1_700_000_000, 1_700_000_000))
+    compressed_bodies.clear()
+
+    client = mini_app(
+        a=lambda: FileResponse(rutas[0], media_type="application/javascript"),
+        b=lambda: FileResponse(rutas[1], media_type="application/javascript"),
+    )
+    respuestas = [client.get(url, headers={"Accept-Encoding": "gzip"}) for url in ("/a", "/b")]
+    assert respuestas[0].headers["etag"] == respuestas[1].headers["etag"]
+    assert [r.content for r in respuestas] == [p.read_bytes() for p in rutas]
+
+
+def test_cuerpos_grandes_se_comprimen_fuera_del_event_loop(monkeypatch):
+    en_threadpool = []
+
+    async def run_in_threadpool(func, *args):
+        en_threadpool.append(func)
+        return func(*args)
+
+    monkeypatch.setattr(compression, "run_in_threadpool", run_in_threadpool)
+    monkeypatch.setattr(compression, "COMPRESSION_THREAD_MIN_SIZE", 10_000)
+    body = json.dumps([{"id": i} for i in range(5000)]).encode()
+
+    client = mini_app(
+        grande=lambda: Response(body, media_type="application/json"),
+        mediana=lambda: Response(body[:5000], media_type="application/json"),
+    )
+    response = client.get("/mediana", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert en_threadpool == []
+
+    response = client.get("/grande", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == body
+    assert len(en_threadpool) == 1
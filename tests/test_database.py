@@ -0,0 +1,152 @@
+# tests/test_database.py
+import threading
+
+import pytest
+from sqlalchemy import create_engine, event, exc
+
+from app import database
+from app.database import InstrumentedQueuePool, PoolStats, engine_options, instrument_pool
+from tests.conftest import async_engine_test
+
+
+@pytest.fixture
+def sqlite_url(tmp_path):
+    return f"sqlite:///{tmp_path / 'pool.sqlite3'}"
+
+
+def test_opciones_del_pool_desde_la_configuracion(sqlite_url, monkeypatch):
+    monkeypatch.setattr(database, "DB_POOL_SIZE", 3)
+    monkeypatch.setattr(database, "DB_MAX_OVERFLOW", 1)
+    monkeypatch.setattr(database, "DB_POOL_TIMEOUT", 2.5)
+    monkeypatch.setattr(database, "DB_POOL_RECYCLE", 60)
+    engine = create_engine(sqlite_url, **engine_options(sqlite_url))
+    try:
+        assert isinstance(engine.pool, InstrumentedQueuePool)
+        assert engine.pool.size() == 3
+        assert engine.pool._max_overflow == 1
+        assert engine.pool._timeout == 2.5
+        assert engine.pool._recycle == 60
+        assert engine.pool._pre_ping is True
+    finally:
+        engine.dispose()
+
+    # SQLite en memoria conserva su pool propio
+    assert "pool_size" not in engine_options("sqlite://")
+
+
+def test_medidores_del_pool(sqlite_url, monkeypatch):
+    monkeypatch.setattr(database, "DB_POOL_SIZE", 1)
+    monkeypatch.setattr(database, "DB_MAX_OVERFLOW", 0)
+    monkeypatch.setattr(database, "DB_POOL_TIMEOUT", 0.2)
+    engine = create_engine(sqlite_url, **engine_options(sqlite_url))
+    stats = PoolStats()
+    instrument_pool(engine, stats)
+    try:
+        conn = engine.connect()
+        snapshot = stats.snapshot()
+        assert (snapshot["in_use"], snapshot["checkouts"], snapshot["connects"]) == (1, 1, 1)
+        assert snapshot["checked_in"] == 0
+
+        # Con el pool agotado la segunda petición espera y agota el timeout
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+        snapshot = stats.snapshot()
+        assert snapshot["timeouts"] == 1
+        assert snapshot["max_wait_seconds"] >= 0.2
+
+        conn.close()
+        assert stats.snapshot()["in_use"] == 0
+
+        # Tras dispose() el pool nuevo sigue midiendo
+        engine.dispose()
+        with engine.connect():
+            assert stats.snapshot()["in_use"] == 1
+        assert stats.snapshot()["checkouts"] == 2
+    finally:
+        engine.dispose()
+
+
+def test_respuestas_en_cache_no_toman_conexion(client, create_paleta_fixture):
+    paleta = create_paleta_fixture(nombre="Paleta Sin Conexion", precio=10.0)
+    # Primeras lecturas: llenan la caché
+    assert client.get("/paletas/").status_code == 200
+    assert client.get(f"/paletas/{paleta.id}").status_code == 200
+
+    checkouts = []
+    listener = lambda *args: checkouts.append(threading.get_ident())
+    event.listen(async_engine_test.sync_engine, "checkout", listener)
+    try:
+        assert client.get("/paletas/").status_code == 200
+        assert client.get(f"/paletas/{paleta.id}").status_code == 200
+    finally:
+        event.remove(async_engine_test.sync_engine, "checkout", listener)
+    assert checkouts == []
+
+
+def crear_bd(path, valor):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE origen (valor TEXT)")
+        conn.exec_driver_sql(f"INSERT INTO origen VALUES ('{valor}')")
+    engine.dispose()
+    return f"sqlite:///{path}"
+
+
+async def leer(engine):
+    async with engine.connect() as conn:
+        return (await conn.exec_driver_sql("SELECT valor FROM origen")).scalar()
+
+
+def test_read_router_reparte_y_respeta_escrituras_recientes(tmp_path):
+    import asyncio
+    import time
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from app.database import ReadRouter, to_async_url
+
+    primary = create_async_engine(to_async_url(crear_bd(tmp_path / "primario.sqlite3", "primario")))
+    replicas = [crear_bd(tmp_path / f"r{i}.sqlite3", f"replica{i}") for i in (1, 2)]
+    router = ReadRouter(lambda: primary, replicas, sticky_seconds=0.2, retry_seconds=30)
+
+    async def run():
+        try:
+            assert [await leer(router.engine_for()) for _ in range(4)] == ["replica1", "replica2"] * 2
+            router.mark_write(7)
+            # La clave llega como texto desde la ruta
+            assert await leer(router.engine_for("7")) == "primario"
+            assert await leer(router.engine_for("8")) in ("replica1", "replica2")
+            time.sleep(0.25)
+            assert await leer(router.engine_for("7")) in ("replica1", "replica2")
+        finally:
+            await router.dispose()
+            await primary.dispose()
+
+    asyncio.run(run())
+
+
+def test_read_router_usa_el_primario_si_la_replica_no_responde(tmp_path):
+    import asyncio
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from app.database import ReadRouter, to_async_url
+
+    primary = create_async_engine(to_async_url(crear_bd(tmp_path / "primario.sqlite3", "primario")))
+    caida = f"sqlite:///{tmp_path / 'no-existe' / 'replica.sqlite3'}"
+    router = ReadRouter(lambda: primary, [caida], retry_seconds=30)
+
+    async def run():
+        try:
+            # La petición no falla: la conexión se abre contra el primario
+            assert await leer(router.engine_for()) == "primario"
+            assert not router.is_up(0)
+            assert router.engine_for() is primary
+
+            # La réplica vuelve: la conexión de respaldo del pool se descarta al reutilizarla
+            (tmp_path / "no-existe").mkdir()
+            crear_bd(tmp_path / "no-existe" / "replica.sqlite3", "replica")
+            router.retry_seconds = 0
+            router.mark_down(0)
+            assert await leer(router.engine_for()) == "replica"
+        finally:
+            await router.dispose()
+            await primary.dispose()
+
+    asyncio.run(run())
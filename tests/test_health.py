@@ -0,0 +1,48 @@
+# tests/test_health.py
+import subprocess
+import sys
+
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from app.cache import catalog_cache
+from app.hashing import hash_pool
+from app.health import readiness
+from app.main import app
+
+
+def test_importar_la_app_no_conecta_a_la_bd():
+    # DATABASE_URL apunta a un servidor que no existe: importar no debe intentar conectar
+    code = (
+        "import app.main, app.database as d; "
+        "assert d._engine is None and d._async_engine is None; "
+        "assert not app.main.readiness.ready"
+    )
+    env = {"DATABASE_URL": "mysql+pymysql://nadie:x@127.0.0.1:1/inexistente", "PATH": ""}
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+
+
+def test_healthz_y_readyz_antes_del_arranque(client):
+    assert client.get("/healthz").json() == {"status": "ok"}
+    response = client.get("/readyz")
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.json()["status"] == "starting"
+
+
+def test_readyz_tras_el_arranque(db_session, create_paleta_fixture, monkeypatch):
+    warm_ups = []
+    monkeypatch.setattr(hash_pool, "warm_up", lambda: warm_ups.append(True))
+    create_paleta_fixture(nombre="Paleta Arranque", precio=10.0)
+
+    with TestClient(app) as client:
+        response = client.get("/readyz")
+        assert response.status_code == status.HTTP_200_OK
+        body = response.json()
+        assert body["status"] == "ready"
+        assert list(body["steps"]) == ["engine", "schema", "pool", "images", "catalog", "hashing"]
+        # El catálogo quedó en caché durante el arranque
+        assert catalog_cache._lista is not None
+        assert warm_ups == [True]
+
+    assert not readiness.ready
@@ -0,0 +1,77 @@
+# tests/test_images.py
+import pytest
+from fastapi import status
+
+from app.images import IMMUTABLE_CACHE_CONTROL, image_pipeline
+
+
+def url_de(nombre):
+    return image_pipeline.public_url(image_pipeline.manifest()[nombre])
+
+
+def test_imagen_con_hash_se_cachea_para_siempre(client):
+    url = url_de("uva.jpg")
+    response = client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.headers["vary"] == "Accept"
+    etag = response.headers["etag"]
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+
+
+def test_imagen_con_rango(client):
+    url = url_de("chamoy.jpg")
+    completa = client.get(url, headers={"Accept": "image/jpeg"}).content
+    response = client.get(url, headers={"Accept": "image/jpeg", "Range": "bytes=0-99"})
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert response.content == completa[:100]
+
+
+def test_hash_desconocido_es_404(client):
+    assert client.get("/images/uva.000000000000.jpg").status_code == status.HTTP_404_NOT_FOUND
+    assert client.get("/images/uva.jpg").status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_paletas_exponen_la_url_con_hash(client, create_paleta_fixture):
+    create_paleta_fixture(nombre="Paleta de Uva Imagen", imagen_url="/static/images/uva.jpg")
+    create_paleta_fixture(nombre="Paleta Externa", imagen_url="https://cdn.example.com/x.jpg")
+    data = {p["nombre"]: p for p in client.get("/paletas/").json()}
+    assert data["Paleta de Uva Imagen"]["imagen_url"] == url_de("uva.jpg")
+    # Las URLs que no son de static/images no cambian
+    assert data["Paleta Externa"]["imagen_url"] == "https://cdn.example.com/x.jpg"
+    assert data["Paleta Externa"]["imagen_srcset"] is None
+
+
+def test_variantes_webp_y_miniaturas(client, tmp_path, monkeypatch):
+    pytest.importorskip("PIL")
+    from PIL import Image
+    import io
+    monkeypatch.setattr(image_pipeline, "cache_dir", tmp_path)
+    source = image_pipeline.manifest()["paleta_generica.png"]
+    url = url_de("paleta_generica.png")
+
+    response = client.get(f"{url}?w=300", headers={"Accept": "image/webp,image/*"})
+    assert response.headers["content-type"] == "image/webp"
+    assert Image.open(io.BytesIO(response.content)).width == 320
+    assert len(response.content) < source.path.stat().st_size
+
+    response = client.get(f"{url}?w=300", headers={"Accept": "image/png"})
+    assert response.headers["content-type"] == "image/png"
+    assert Image.open(io.BytesIO(response.content)).width == 320
+    assert f"{url}?w=320 320w" in image_pipeline.srcset(source)
+
+
+def test_variante_generada_a_la_vez_por_varios_hilos(tmp_path, monkeypatch):
+    pytest.importorskip("PIL")
+    from concurrent.futures import ThreadPoolExecutor
+    monkeypatch.setattr(image_pipeline, "cache_dir", tmp_path)
+    source = image_pipeline.manifest()["paleta_generica.png"]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        paths = list(pool.map(lambda _: image_pipeline._render(source, 160, "webp", tmp_path / "v.webp"), range(8)))
+    assert paths == [None] * 8
+    # Sin temporales huérfanos
+    assert [p.name for p in tmp_path.iterdir()] == ["v.webp"]
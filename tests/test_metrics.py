@@ -0,0 +1,58 @@
+# tests/test_metrics.py
+from app.metrics import Histogram, metrics_registry
+
+
+def muestras(client) -> dict:
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    data = {}
+    for line in response.text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            data[name] = float(value)
+    return data
+
+
+def test_histograma_acumulado():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    assert histogram.cumulative() == [("0.1", 2), ("1", 3), ("+Inf", 4)]
+    assert histogram.count == 4
+
+
+def test_rutas_por_plantilla(admin_client):
+    metrics_registry.reset()
+    admin_client.get("/cart/1")
+    admin_client.get("/cart/2")
+    admin_client.get("/no/existe")
+
+    data = muestras(admin_client)
+    assert data['http_requests_total{method="GET",route="/cart/{user_id}",status="200"}'] == 2
+    assert data['http_requests_total{method="GET",route="<unmatched>",status="404"}'] == 1
+    assert data['http_request_duration_seconds_count{method="GET",route="/cart/{user_id}"}'] == 2
+    assert data['http_request_duration_seconds_bucket{method="GET",route="/cart/{user_id}",le="+Inf"}'] == 2
+    assert not any("/cart/1" in name for name in data)
+
+
+def test_consultas_sql_por_peticion(admin_client):
+    metrics_registry.reset()
+    admin_client.get("/orders/all")
+
+    data = muestras(admin_client)
+    assert data['http_request_db_queries_count{method="GET",route="/orders/all"}'] == 1
+    assert data['http_request_db_queries_sum{method="GET",route="/orders/all"}'] >= 1
+    assert data['http_request_db_seconds_sum{method="GET",route="/orders/all"}'] > 0
+    assert data["db_queries_total"] >= 1
+    # /healthz no toca la BD
+    admin_client.get("/healthz")
+    data = muestras(admin_client)
+    assert data['http_request_db_queries_bucket{method="GET",route="/healthz",le="0"}'] == 1
+
+
+def test_pools_y_bcrypt(client):
+    data = muestras(client)
+    assert "bcrypt_pending" in data
+    assert "bcrypt_queue_wait_seconds_total" in data
+    assert any(name.startswith("db_pool_checkouts_total{") for name in data)
@@ -0,0 +1,150 @@
+# tests/test_migrations.py
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from app.migrations import MIGRATIONS, current_version, full_table_scans, upgrade
+
+# Esquema como lo dejaba create_all antes de las migraciones: sin índices de consulta,
+# sin índice único en el carrito y sin la columna idempotency_key
+LEGACY_SCHEMA = [
+    """CREATE TABLE users (id INTEGER PRIMARY KEY, email VARCHAR(200) NOT NULL UNIQUE,
+       password VARCHAR(255) NOT NULL, is_admin BOOLEAN, username VARCHAR(255))""",
+    """CREATE TABLE paletas (id INTEGER PRIMARY KEY, nombre VARCHAR(255) NOT NULL, descripcion TEXT,
+       ingredientes TEXT, precio DECIMAL(10, 2) NOT NULL, imagen_url VARCHAR(255), tiene_oferta BOOLEAN,
+       texto_oferta VARCHAR(100), fecha_creacion TIMESTAMP, fecha_actualizacion TIMESTAMP)""",
+    """CREATE TABLE cart_items (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, paleta_id INTEGER,
+       quantity INTEGER NOT NULL, added_at TIMESTAMP, nombre VARCHAR(255) NOT NULL, descripcion TEXT,
+       ingredientes TEXT, precio DECIMAL(10, 2) NOT NULL, imagen_url VARCHAR(255), tiene_oferta BOOLEAN,
+       texto_oferta VARCHAR(100))""",
+    """CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES users (id),
+       created_at DATETIME, attended BOOLEAN)""",
+    """CREATE TABLE order_items (id INTEGER PRIMARY KEY, order_id INTEGER NOT NULL REFERENCES orders (id),
+       paleta_id INTEGER, quantity INTEGER NOT NULL, nombre VARCHAR(255) NOT NULL, descripcion VARCHAR(255),
+       ingredientes VARCHAR(255), precio FLOAT NOT NULL, imagen_url VARCHAR(255))""",
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migraciones.sqlite3'}")
+    yield engine
+    engine.dispose()
+
+
+def index_names(engine, table):
+    return {ix["name"] for ix in inspect(engine).get_indexes(table)}
+
+
+def test_upgrade_base_nueva_es_idempotente(engine):
+    assert upgrade(engine) == [m[0] for m in MIGRATIONS]
+    assert upgrade(engine) == []
+    with engine.connect() as conn:
+        assert current_version(conn) == LATEST
+        assert full_table_scans(conn) == []
+
+
+def test_upgrade_base_existente(engine):
+    with engine.begin() as conn:
+        for ddl in LEGACY_SCHEMA:
+            conn.exec_driver_sql(ddl)
+        conn.exec_driver_sql(
+            "INSERT INTO cart_items (user_id, paleta_id, quantity, nombre, precio) VALUES "
+            "(1, 5, 2, 'Fresa', 10), (1, 5, 3, 'Fresa', 10), (1, NULL, 1, 'Personalizada', 20), "
+            "(1, NULL, 1, 'Personalizada', 20)"
+        )
+
+    assert upgrade(engine, target=2) == [1, 2]
+    with engine.connect() as conn:
+        # Sin los índices de la migración 3 los pedidos se recorren completos
+        assert any(problem.endswith("SCAN orders") for problem in full_table_scans(conn))
+
+    assert upgrade(engine, target=3) == [3]
+
+    with engine.connect() as conn:
+        assert full_table_scans(conn) == []
+        rows = conn.execute(text("SELECT paleta_id, quantity FROM cart_items ORDER BY id")).all()
+    # Las líneas repetidas se juntan; las personalizadas no
+    assert rows == [(5, 5), (None, 1), (None, 1)]
+    assert "idempotency_key" in {c["name"] for c in inspect(engine).get_columns("orders")}
+    assert {"ix_orders_user_id_id", "ix_orders_attended_id", "ix_orders_created_at",
+            "uq_orders_user_idempotency_key"} <= index_names(engine, "orders")
+    assert "ix_order_items_order_id" in index_names(engine, "order_items")
+    assert "uq_paletas_nombre" in index_names(engine, "paletas")
+
+
+def test_upgrade_falla_con_nombres_de_paleta_repetidos(engine):
+    with engine.begin() as conn:
+        for ddl in LEGACY_SCHEMA:
+            conn.exec_driver_sql(ddl)
+        conn.exec_driver_sql(
+            "INSERT INTO paletas (nombre, precio) VALUES ('Mango', 10), ('Mango', 12)"
+        )
+    with pytest.raises(RuntimeError, match="Mango"):
+        upgrade(engine)
+    # Las migraciones anteriores quedan aplicadas; la que falló se revierte
+    with engine.connect() as conn:
+        assert current_version(conn) == 2
+
+
+def test_upgrade_calcula_los_acumulados_de_ventas(engine):
+    with engine.begin() as conn:
+        for ddl in LEGACY_SCHEMA:
+            conn.exec_driver_sql(ddl)
+        conn.exec_driver_sql(
+            "INSERT INTO orders (id, user_id, created_at, attended) VALUES "
+            "(1, 1, '2024-05-01 10:00:00', 1), (2, 2, '2024-05-01 18:30:00', 0), (3, 1, '2024-05-02 09:00:00', 0)"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO order_items (order_id, paleta_id, quantity, nombre, precio) VALUES "
+            "(1, 5, 2, 'Fresa', 10), (2, 5, 1, 'Fresa', 10), (2, NULL, 1, 'Personalizada', 30), (3, 7, 4, 'Mango', 12)"
+        )
+
+    assert upgrade(engine)[-1] == LATEST
+    with engine.connect() as conn:
+        sales = conn.execute(text(
+            "SELECT day, paleta_id, units, revenue FROM sales_daily ORDER BY day, paleta_id"
+        )).all()
+        orders = conn.execute(text("SELECT day, orders, attended FROM orders_daily ORDER BY day")).all()
+    assert [tuple(r) for r in sales] == [
+        ("2024-05-01", 0, 1, 30), ("2024-05-01", 5, 3, 30), ("2024-05-02", 7, 4, 48),
+    ]
+    assert [tuple(r) for r in orders] == [("2024-05-01", 2, 1), ("2024-05-02", 1, 0)]
+
+
+def test_upgrade_concurrente_aplica_cada_migracion_una_vez(tmp_path):
+    import threading
+
+    # Un motor por "worker", todos contra la misma base, arrancando a la vez
+    url = f"sqlite:///{tmp_path / 'concurrente.sqlite3'}"
+    engines = [create_engine(url, connect_args={"timeout": 30}) for _ in range(4)]
+    with engines[0].begin() as conn:
+        for ddl in LEGACY_SCHEMA:
+            conn.exec_driver_sql(ddl)
+        conn.exec_driver_sql("INSERT INTO orders (id, user_id, created_at, attended) VALUES (1, 1, '2024-05-01 10:00:00', 1)")
+
+    barrier = threading.Barrier(len(engines))
+    results, errors = [], []
+
+    def worker(engine):
+        barrier.wait()
+        try:
+            results.append(upgrade(engine))
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=worker, args=(e,)) for e in engines]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(v for applied in results for v in applied) == [m[0] for m in MIGRATIONS]
+    with engines[0].connect() as conn:
+        assert current_version(conn) == LATEST
+        # El backfill de los acumulados corrió una sola vez
+        assert conn.execute(text("SELECT orders, attended FROM orders_daily")).all() == [(1, 1)]
+    for engine in engines:
+        engine.dispose()
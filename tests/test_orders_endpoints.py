@@ -0,0 +1,295 @@
+# tests/test_orders_endpoints.py
+import datetime
+
+import pytest
+from fastapi import status
+from app import models
+
+USER_ID_TEST = 1
+
+
+def crear_pedidos(db_session, n, user_id=USER_ID_TEST, attended=False, created_at=None):
+    if db_session.get(models.User, user_id) is None:
+        db_session.add(models.User(id=user_id, email=f"user{user_id}@test.com", password="x", username=f"user{user_id}"))
+    pedidos = []
+    for i in range(n):
+        order = models.Order(user_id=user_id, attended=attended, created_at=created_at)
+        order.items.append(models.OrderItem(paleta_id=None, quantity=i + 1, nombre=f"Paleta {i}", precio=10.0))
+        db_session.add(order)
+        pedidos.append(order)
+    db_session.commit()
+    return pedidos
+
+
+def test_list_orders_paginacion_por_cursor(admin_client, db_session):
+    pedidos = crear_pedidos(db_session, 5)
+    response = admin_client.get("/orders/all?limit=2")
+    assert response.status_code == status.HTTP_200_OK
+    assert [o["id"] for o in response.json()] == [pedidos[0].id, pedidos[1].id]
+
+    ids = [o["id"] for o in response.json()]
+    cursor = response.headers["X-Next-Cursor"]
+    while cursor:
+        response = admin_client.get(f"/orders/all?limit=2&after={cursor}")
+        ids += [o["id"] for o in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+    assert ids == [p.id for p in pedidos]
+
+
+def test_list_orders_sin_parametros_pagina_acotada(admin_client, db_session):
+    from app.pagination import DEFAULT_PAGE_SIZE
+    pedidos = crear_pedidos(db_session, DEFAULT_PAGE_SIZE + 5)
+
+    # Sin parámetros la respuesta no crece con la tabla, pero avisa que hay más
+    response = admin_client.get("/orders/all")
+    assert [o["id"] for o in response.json()] == [p.id for p in pedidos[:DEFAULT_PAGE_SIZE]]
+    cursor = response.headers["X-Next-Cursor"]
+    assert cursor == str(pedidos[DEFAULT_PAGE_SIZE - 1].id)
+    assert response.headers["Link"].endswith('; rel="next"')
+
+    response = admin_client.get(f"/orders/all?after={cursor}")
+    assert [o["id"] for o in response.json()] == [p.id for p in pedidos[DEFAULT_PAGE_SIZE:]]
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_list_orders_filtros(admin_client, db_session):
+    antiguo = datetime.datetime(2024, 1, 1)
+    reciente = datetime.datetime(2025, 1, 1)
+    crear_pedidos(db_session, 2, attended=True, created_at=antiguo)
+    pendientes = crear_pedidos(db_session, 1, attended=False, created_at=reciente)
+
+    response = admin_client.get("/orders/all?attended=false")
+    assert [o["id"] for o in response.json()] == [pendientes[0].id]
+
+    response = admin_client.get("/orders/all?since=2024-06-01T00:00:00")
+    assert [o["id"] for o in response.json()] == [pendientes[0].id]
+
+
+def test_orders_by_user_fields(admin_client, db_session):
+    pedidos = crear_pedidos(db_session, 2)
+    crear_pedidos(db_session, 1, user_id=2)
+
+    response = admin_client.get(f"/orders/user/{USER_ID_TEST}?fields=attended")
+    assert response.json() == [{"id": p.id, "attended": False} for p in pedidos]
+
+    response = admin_client.get(f"/orders/user/{USER_ID_TEST}?fields=id,items&limit=1")
+    data = response.json()
+    assert data == [{"id": pedidos[0].id, "items": data[0]["items"]}]
+    assert data[0]["items"][0]["nombre"] == "Paleta 0"
+
+
+def llenar_carrito(admin_client, create_paleta_fixture, n):
+    for i in range(n):
+        paleta = create_paleta_fixture(nombre=f"Paleta Checkout {n}-{i}", precio=10.0 + i)
+        admin_client.post("/cart/add", json={"user_id": USER_ID_TEST, "paleta_id": paleta.id, "quantity": i + 1})
+
+
+def test_create_order_mueve_el_carrito(admin_client, db_session, create_paleta_fixture):
+    llenar_carrito(admin_client, create_paleta_fixture, 3)
+    response = admin_client.post(f"/orders?user_id={USER_ID_TEST}")
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert data["attended"] is False
+    assert [item["quantity"] for item in data["items"]] == [1, 2, 3]
+    assert {item["order_id"] for item in data["items"]} == {data["id"]}
+    assert admin_client.get(f"/cart/{USER_ID_TEST}").json() == []
+
+
+def test_create_order_carrito_vacio_no_deja_pedido_huerfano(admin_client, db_session):
+    response = admin_client.post(f"/orders?user_id={USER_ID_TEST}")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert db_session.query(models.Order).count() == 0
+
+
+def test_create_order_idempotency_key(admin_client, db_session, create_paleta_fixture):
+    llenar_carrito(admin_client, create_paleta_fixture, 2)
+    headers = {"Idempotency-Key": "checkout-123"}
+    primero = admin_client.post(f"/orders?user_id={USER_ID_TEST}", headers=headers)
+    reintento = admin_client.post(f"/orders?user_id={USER_ID_TEST}", headers=headers)
+    assert reintento.status_code == status.HTTP_200_OK
+    assert reintento.json() == primero.json()
+    assert db_session.query(models.Order).count() == 1
+
+
+def test_create_order_consultas_constantes(admin_client, db_session, create_paleta_fixture):
+    from sqlalchemy import event
+    from tests.conftest import async_engine_test
+
+    def consultas_checkout():
+        statements = []
+        def listener(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(async_engine_test.sync_engine, "before_cursor_execute", listener)
+        try:
+            assert admin_client.post(f"/orders?user_id={USER_ID_TEST}").status_code == status.HTTP_200_OK
+        finally:
+            event.remove(async_engine_test.sync_engine, "before_cursor_execute", listener)
+        return len(statements)
+
+    llenar_carrito(admin_client, create_paleta_fixture, 1)
+    una_linea = consultas_checkout()
+    llenar_carrito(admin_client, create_paleta_fixture, 15)
+    assert consultas_checkout() == una_linea
+
+
+def test_listados_de_pedidos_sin_n_mas_1(admin_client, db_session):
+    from sqlalchemy import event
+    from tests.conftest import async_engine_test
+
+    def contar(url):
+        statements = []
+        def listener(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(async_engine_test.sync_engine, "before_cursor_execute", listener)
+        try:
+            response = admin_client.get(url)
+        finally:
+            event.remove(async_engine_test.sync_engine, "before_cursor_execute", listener)
+        assert response.status_code == status.HTTP_200_OK
+        return len(statements), response.json()
+
+    crear_pedidos(db_session, 1)
+    pocos = {url: contar(url)[0] for url in ("/orders/all", f"/orders/user/{USER_ID_TEST}")}
+
+    crear_pedidos(db_session, 60)
+    for url, consultas in pocos.items():
+        total, data = contar(url)
+        assert len(data) == 61
+        assert all(len(order["items"]) == 1 for order in data)
+        # Una consulta para los pedidos y otra para todos sus ítems
+        assert total == consultas == 2
+
+
+def test_export_orders_ndjson(admin_client, db_session):
+    import json
+    antiguo = crear_pedidos(db_session, 1, created_at=datetime.datetime(2024, 1, 1))
+    pedidos = crear_pedidos(db_session, 3, created_at=datetime.datetime(2025, 1, 1))
+    pedidos[1].items.append(models.OrderItem(paleta_id=7, quantity=1, nombre="Extra", precio=5.0))
+    db_session.commit()
+
+    response = admin_client.get("/orders/export?since=2024-06-01T00:00:00")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lineas = [json.loads(line) for line in response.text.splitlines()]
+    assert [o["id"] for o in lineas] == [p.id for p in pedidos]
+    assert antiguo[0].id not in [o["id"] for o in lineas]
+    assert [len(o["items"]) for o in lineas] == [1, 2, 1]
+    assert lineas[1]["items"][1]["nombre"] == "Extra"
+    assert lineas[1]["items"][1]["order_id"] == pedidos[1].id
+
+
+def test_export_orders_csv(admin_client, db_session):
+    import csv
+    import io
+    pedidos = crear_pedidos(db_session, 2)
+    db_session.add(models.Order(user_id=USER_ID_TEST, attended=True))
+    db_session.commit()
+
+    response = admin_client.get("/orders/export?format=csv")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/csv")
+    filas = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(filas) == 3
+    assert [int(f["order_id"]) for f in filas[:2]] == [p.id for p in pedidos]
+    assert filas[0]["item_nombre"] == "Paleta 0"
+    # Pedido sin ítems: columnas del ítem vacías
+    assert filas[2]["item_id"] == ""
+
+    assert admin_client.get("/orders/export?format=xml").status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+def test_export_orders_solo_admin(client, db_session):
+    from app.auth import get_current_active_user
+    from app.main import app
+    app.dependency_overrides[get_current_active_user] = lambda: models.User(
+        id=2, email="user@test.com", username="user", password="x", is_admin=False
+    )
+    try:
+        assert client.get("/orders/export").status_code == status.HTTP_403_FORBIDDEN
+    finally:
+        app.dependency_overrides.pop(get_current_active_user, None)
+
+
+def test_atender_en_bloque_por_ids(admin_client, db_session):
+    pedidos = crear_pedidos(db_session, 3)
+    [ya_atendido] = crear_pedidos(db_session, 1, attended=True)
+    ids = [pedidos[0].id, pedidos[2].id, ya_atendido.id, 999999]
+
+    response = admin_client.patch("/orders/attend", json={"ids": ids})
+    assert response.status_code == status.HTTP_200_OK
+    # Solo los que cambiaron: ni el ya atendido ni el inexistente
+    assert response.json() == {"ids": [pedidos[0].id, pedidos[2].id], "count": 2}
+
+    db_session.expire_all()
+    assert [p.attended for p in pedidos] == [True, False, True]
+    assert admin_client.patch("/orders/attend", json={"ids": ids}).json() == {"ids": [], "count": 0}
+
+
+def test_atender_en_bloque_pendientes_antes_de(admin_client, db_session):
+    from sqlalchemy import event
+    from tests.conftest import async_engine_test
+
+    antiguos = crear_pedidos(db_session, 30, created_at=datetime.datetime(2025, 1, 1, 12))
+    [reciente] = crear_pedidos(db_session, 1, created_at=datetime.datetime(2025, 1, 1, 15))
+
+    statements = []
+    def listener(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(async_engine_test.sync_engine, "before_cursor_execute", listener)
+    try:
+        response = admin_client.patch("/orders/attend", json={"before": "2025-01-01T14:00:00"})
+    finally:
+        event.remove(async_engine_test.sync_engine, "before_cursor_execute", listener)
+    assert response.json() == {"ids": [p.id for p in antiguos], "count": 30}
+    # UPDATE ... RETURNING de pedidos y UPDATE de acumulados, sin importar cuántos sean
+    assert len(statements) == 2
+    assert sum(s.lstrip().upper().startswith("UPDATE ORDERS ") for s in statements) == 1
+
+    db_session.expire_all()
+    assert db_session.get(models.Order, reciente.id).attended is False
+
+
+@pytest.mark.parametrize("update_returning", [True, False])
+def test_atender_en_bloque_miles_de_pendientes(admin_client, db_session, monkeypatch, update_returning):
+    from sqlalchemy import insert
+    from tests.conftest import async_engine_test
+
+    # Sin RETURNING se toma el camino de MySQL (SELECT ... FOR UPDATE y UPDATE por condición)
+    monkeypatch.setattr(async_engine_test.dialect, "update_returning", update_returning)
+    crear_pedidos(db_session, 0)
+    dias = [datetime.date(2024, 1, 1) + datetime.timedelta(days=i) for i in range(400)]
+    db_session.execute(insert(models.Order), [
+        {"user_id": USER_ID_TEST, "attended": False, "created_at": datetime.datetime.combine(dia, datetime.time(10 + h))}
+        for dia in dias for h in range(3)
+    ])
+    db_session.execute(insert(models.OrdersDaily), [{"day": dia, "orders": 3, "attended": 0} for dia in dias])
+    db_session.commit()
+
+    # 1200 pendientes y 400 días: más de los 999 parámetros de SQLite si se mandaran en un IN
+    response = admin_client.patch("/orders/attend", json={"before": "2026-01-01T00:00:00"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["count"] == 1200
+    assert response.json()["ids"] == sorted(response.json()["ids"])
+
+    db_session.expire_all()
+    assert {d.attended for d in db_session.query(models.OrdersDaily)} == {3}
+    assert admin_client.patch("/orders/attend", json={"before": "2026-01-01T00:00:00"}).json()["count"] == 0
+
+
+def test_atender_en_bloque_solo_administradores(client, db_session):
+    from app.auth import get_current_active_user
+    from app.main import app
+    [pedido] = crear_pedidos(db_session, 1)
+    cliente = models.User(id=USER_ID_TEST, email="user1@test.com", username="user1", password="x", is_admin=False)
+    app.dependency_overrides[get_current_active_user] = lambda: cliente
+    try:
+        for body in ({"before": "2030-01-01T00:00:00"}, {"ids": [pedido.id]}):
+            assert client.patch("/orders/attend", json=body).status_code == status.HTTP_403_FORBIDDEN
+    finally:
+        app.dependency_overrides.pop(get_current_active_user, None)
+    db_session.expire_all()
+    assert db_session.get(models.Order, pedido.id).attended is False
+
+
+def test_atender_en_bloque_exige_filtro(admin_client, db_session):
+    assert admin_client.patch("/orders/attend", json={}).status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
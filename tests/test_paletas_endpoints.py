@@ -63,6 +63,16 @@ def test_read_paleta_no_existente(client):
     assert response.status_code == status.HTTP_404_NOT_FOUND
     assert response.json()["detail"] == "Paleta no encontrada"
 
+def test_update_paleta_nombre_duplicado(admin_client, create_paleta_fixture):
+    create_paleta_fixture(nombre="Paleta Existente", precio=15.0)
+    paleta = create_paleta_fixture(nombre="Paleta A Renombrar", precio=12.0)
+    response = admin_client.put(f"/paletas/{paleta.id}", json={"nombre": "Paleta Existente", "precio": 12.0})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["detail"] == "Ya existe una paleta con este nombre."
+    # Conservar su propio nombre no choca consigo misma
+    response = admin_client.put(f"/paletas/{paleta.id}", json={"nombre": "Paleta A Renombrar", "precio": 13.0})
+    assert response.status_code == status.HTTP_200_OK
+
 # Prueba para validar schema de entrada (ejemplo precio negativo)
 def test_create_paleta_precio_invalido(client):
     response = client.post(
@@ -74,4 +84,190 @@ def test_create_paleta_precio_invalido(client):
             "ingredientes": "Test"
         },
     )
-    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY9
\ No newline at end of file
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY9
+
+# --- Caché del catálogo ---
+def test_read_paletas_servido_desde_cache(client, db_session, create_paleta_fixture, monkeypatch):
+    from app import models
+    from app.cache import catalog_cache
+    monkeypatch.setattr(catalog_cache, "check_seconds", 3600)
+    catalog_cache.recheck()
+    create_paleta_fixture(nombre="Paleta Cacheada", precio=10.0)
+    primera = client.get("/paletas/").json()
+
+    # Una inserción directa (sin pasar por los endpoints) no invalida la caché dentro del intervalo
+    db_session.add(models.Paleta(nombre="Paleta Oculta", precio=11.0))
+    db_session.commit()
+    assert client.get("/paletas/").json() == primera
+
+def escribir_como_otro_worker(db_session, cambio):
+    # Lo que hace un endpoint de otro worker: la escritura y la versión en la misma transacción
+    from app.main import catalog_version_bump
+    cambio()
+    db_session.execute(catalog_version_bump(db_session))
+    db_session.commit()
+
+def test_cache_ve_escrituras_de_otro_worker(client, db_session, create_paleta_fixture, monkeypatch):
+    from app import models
+    from app.cache import catalog_cache
+    monkeypatch.setattr(catalog_cache, "check_seconds", 0)
+    paleta = create_paleta_fixture(nombre="Paleta Worker A", precio=10.0)
+    etag = client.get("/paletas/").headers["ETag"]
+    assert client.get(f"/paletas/{paleta.id}").json()["precio"] == 10.0
+
+    # Escrituras de otro worker: alta y baja
+    escribir_como_otro_worker(db_session, lambda: db_session.add(models.Paleta(nombre="Paleta Worker B", precio=11.0)))
+    response = client.get("/paletas/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert [p["nombre"] for p in response.json()] == ["Paleta Worker A", "Paleta Worker B"]
+    assert client.get("/paletas/search?q=worker").json()
+
+    escribir_como_otro_worker(db_session, lambda: db_session.delete(db_session.get(models.Paleta, paleta.id)))
+    assert client.get(f"/paletas/{paleta.id}").status_code == 404
+
+def test_cache_ve_cambios_que_no_mueven_la_huella(client, db_session, create_paleta_fixture, monkeypatch):
+    from app import models
+    from app.cache import catalog_cache
+    monkeypatch.setattr(catalog_cache, "check_seconds", 0)
+    paleta = create_paleta_fixture(nombre="Paleta Mismo Segundo", precio=10.0)
+    ultima = create_paleta_fixture(nombre="Paleta Ultima", precio=10.0)
+    assert client.get(f"/paletas/{paleta.id}").json()["precio"] == 10.0
+
+    # Dos cambios en el mismo segundo: fecha_actualizacion no se mueve
+    def cambiar_precio():
+        fila = db_session.get(models.Paleta, paleta.id)
+        fila.precio = 12.0
+        fila.fecha_actualizacion = fila.fecha_actualizacion
+    escribir_como_otro_worker(db_session, cambiar_precio)
+    assert client.get(f"/paletas/{paleta.id}").json()["precio"] == 12.0
+
+    # Baja y alta que dejan igual el número de filas y el mayor id
+    def reemplazar():
+        db_session.delete(db_session.get(models.Paleta, ultima.id))
+        db_session.flush()
+        db_session.add(models.Paleta(id=ultima.id, nombre="Paleta Reemplazo", precio=10.0))
+    escribir_como_otro_worker(db_session, reemplazar)
+    assert [p["nombre"] for p in client.get("/paletas/").json()] == ["Paleta Mismo Segundo", "Paleta Reemplazo"]
+
+def test_escritura_propia_no_recarga_el_catalogo(admin_client, create_paleta_fixture, monkeypatch):
+    from app.cache import catalog_cache
+    monkeypatch.setattr(catalog_cache, "check_seconds", 0)
+    admin_client.get("/paletas/")
+    admin_client.post("/paletas/", json={"nombre": "Paleta Propia", "precio": 12.0})
+    version = catalog_cache.version
+    # La versión que dejó la escritura ya es la conocida: leer no descarta la caché otra vez
+    assert [p["nombre"] for p in admin_client.get("/paletas/").json()] == ["Paleta Propia"]
+    assert catalog_cache.version == version
+
+def test_create_paleta_invalida_cache(admin_client):
+    assert admin_client.get("/paletas/").json() == []
+    response = admin_client.post("/paletas/", json={"nombre": "Paleta Nueva", "precio": 12.0})
+    assert response.status_code == status.HTTP_201_CREATED
+    data = admin_client.get("/paletas/").json()
+    assert [p["nombre"] for p in data] == ["Paleta Nueva"]
+
+def test_update_y_delete_paleta_invalidan_cache(admin_client, create_paleta_fixture):
+    paleta = create_paleta_fixture(nombre="Paleta Original", precio=10.0)
+    assert admin_client.get(f"/paletas/{paleta.id}").json()["nombre"] == "Paleta Original"
+
+    admin_client.put(f"/paletas/{paleta.id}", json={"nombre": "Paleta Editada", "precio": 14.0})
+    data = admin_client.get(f"/paletas/{paleta.id}").json()
+    assert data["nombre"] == "Paleta Editada"
+    assert data["precio"] == 14.0
+
+    admin_client.delete(f"/paletas/{paleta.id}")
+    assert admin_client.get(f"/paletas/{paleta.id}").status_code == status.HTTP_404_NOT_FOUND
+    assert admin_client.get("/paletas/").json() == []
+
+# --- ETag / 304 ---
+def test_read_paletas_etag_304(admin_client, create_paleta_fixture):
+    create_paleta_fixture(nombre="Paleta ETag", precio=10.0)
+    response = admin_client.get("/paletas/")
+    etag = response.headers["ETag"]
+
+    not_modified = admin_client.get("/paletas/", headers={"If-None-Match": etag})
+    assert not_modified.status_code == status.HTTP_304_NOT_MODIFIED
+    assert not_modified.content == b""
+
+    admin_client.post("/paletas/", json={"nombre": "Paleta Nueva ETag", "precio": 9.0})
+    changed = admin_client.get("/paletas/", headers={"If-None-Match": etag})
+    assert changed.status_code == status.HTTP_200_OK
+    assert changed.headers["ETag"] != etag
+
+# --- Filtros, paginación y campos ---
+def test_read_paletas_filtros_y_cursor(client, create_paleta_fixture):
+    p1 = create_paleta_fixture(nombre="Paleta Oferta 1", precio=10.0, tiene_oferta=True)
+    create_paleta_fixture(nombre="Paleta Sin Oferta", precio=30.0)
+    p3 = create_paleta_fixture(nombre="Paleta Oferta 2", precio=20.0, tiene_oferta=True)
+
+    response = client.get("/paletas/?tiene_oferta=true&limit=1")
+    assert [p["id"] for p in response.json()] == [p1.id]
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get(f"/paletas/?tiene_oferta=true&limit=1&after={cursor}")
+    assert [p["id"] for p in response.json()] == [p3.id]
+    assert "X-Next-Cursor" not in response.headers
+
+    response = client.get("/paletas/?precio_min=15&precio_max=25")
+    assert [p["nombre"] for p in response.json()] == ["Paleta Oferta 2"]
+
+def test_read_paletas_fields(client, create_paleta_fixture):
+    paleta = create_paleta_fixture(nombre="Paleta Campos", precio=10.0)
+    response = client.get("/paletas/?fields=nombre,precio")
+    assert response.json() == [{"id": paleta.id, "nombre": "Paleta Campos", "precio": 10.0}]
+
+    response = client.get("/paletas/?fields=password")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+# --- Búsqueda ---
+def test_search_paletas_sin_acentos_y_por_relevancia(client, create_paleta_fixture):
+    create_paleta_fixture(nombre="Paleta de Fresa", descripcion="Con un toque de limón", ingredientes="Fresa, azúcar")
+    create_paleta_fixture(nombre="Paleta de Limón", descripcion="Ácida", ingredientes="Limón, agua")
+    create_paleta_fixture(nombre="Paleta de Piña", descripcion="Tropical", ingredientes="Piña, chile")
+
+    response = client.get("/paletas/search?q=LIMON")
+    assert response.status_code == status.HTTP_200_OK
+    assert [p["nombre"] for p in response.json()] == ["Paleta de Limón", "Paleta de Fresa"]
+
+    response = client.get("/paletas/search?q=pin chi")
+    assert [p["nombre"] for p in response.json()] == ["Paleta de Piña"]
+
+    assert client.get("/paletas/search?q=mango").json() == []
+
+def test_autocomplete_paletas(client, create_paleta_fixture):
+    create_paleta_fixture(nombre="Paleta de Limón", ingredientes="Limón, lima")
+    response = client.get("/paletas/autocomplete?q=lim")
+    assert response.json() == ["limón", "lima"]
+
+def test_search_index_se_actualiza_con_escrituras(admin_client, create_paleta_fixture):
+    paleta = create_paleta_fixture(nombre="Paleta de Uva")
+    assert len(admin_client.get("/paletas/search?q=uva").json()) == 1
+
+    admin_client.put(f"/paletas/{paleta.id}", json={"nombre": "Paleta de Tamarindo", "precio": 12.0})
+    assert admin_client.get("/paletas/search?q=uva").json() == []
+    assert [p["id"] for p in admin_client.get("/paletas/search?q=tamarin").json()] == [paleta.id]
+
+    admin_client.post("/paletas/", json={"nombre": "Paleta de Tamarindo Enchilado", "precio": 15.0})
+    assert len(admin_client.get("/paletas/search?q=tamarindo").json()) == 2
+
+    admin_client.delete(f"/paletas/{paleta.id}")
+    assert [p["nombre"] for p in admin_client.get("/paletas/search?q=tamarindo").json()] == ["Paleta de Tamarindo Enchilado"]
+
+def test_search_con_escritura_entre_indice_y_cuerpos(client, db_session, create_paleta_fixture, monkeypatch):
+    from app import models
+    from app.cache import catalog_cache
+    fresa = create_paleta_fixture(nombre="Paleta de Fresa")
+    borrada = create_paleta_fixture(nombre="Paleta de Fresa Silvestre")
+    original = catalog_cache.get_codificadas
+
+    async def escritura_a_mitad(loader):
+        # Otra petición borra una paleta después de consultar el índice
+        db_session.delete(db_session.get(models.Paleta, borrada.id))
+        db_session.commit()
+        catalog_cache.bump()
+        return await original(loader)
+
+    monkeypatch.setattr(catalog_cache, "get_codificadas", escritura_a_mitad)
+    response = client.get("/paletas/search?q=fresa")
+    assert response.status_code == status.HTTP_200_OK
+    assert [p["id"] for p in response.json()] == [fresa.id]
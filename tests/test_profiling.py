@@ -0,0 +1,100 @@
+# tests/test_profiling.py
+import json
+
+import pytest
+
+from app import models, profiling
+from app.auth import create_access_token
+from app.profiling import SlowLog
+
+
+@pytest.fixture
+def registro(tmp_path, monkeypatch):
+    log = SlowLog(str(tmp_path / "slow.jsonl"))
+    monkeypatch.setattr(profiling, "slow_log", log)
+
+    def entradas():
+        log.stop()
+        path = tmp_path / "slow.jsonl"
+        if not path.exists():
+            return []
+        return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+    yield entradas
+    log.stop()
+
+
+def token(is_admin: bool) -> str:
+    return create_access_token({"sub": "admin@test.com", "uid": 1, "is_admin": is_admin})
+
+
+@pytest.fixture
+def administrador(db_session):
+    user = models.User(id=1, email="admin@test.com", username="admin", password="x", is_admin=True)
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+def test_perfil_con_encabezado_de_administrador(admin_client, administrador, registro):
+    response = admin_client.get(
+        "/orders/all", headers={"X-Profile": "1", "Authorization": f"Bearer {token(True)}"}
+    )
+    assert response.status_code == 200
+    profile_id = response.headers["X-Profile-Id"]
+
+    [entrada] = [e for e in registro() if e["type"] == "profile"]
+    assert entrada["request_id"] == profile_id
+    assert entrada["route"] == "/orders/all"
+    assert entrada["trigger"] == "header"
+    assert entrada["functions"]
+    # Cada sentencia con su tiempo y la línea del endpoint que la originó
+    assert entrada["statements"]
+    statement = entrada["statements"][0]
+    assert "FROM orders" in statement["sql"]
+    assert statement["call_site"][0].startswith("app/pagination.py")
+    assert any("in list_orders" in site for site in statement["call_site"])
+    assert statement["seconds"] >= 0
+
+
+def test_encabezado_sin_token_de_administrador_no_perfila(admin_client, registro):
+    for headers in ({"X-Profile": "1"}, {"X-Profile": "1", "Authorization": f"Bearer {token(False)}"}):
+        response = admin_client.get("/orders/all", headers=headers)
+        assert "X-Profile-Id" not in response.headers
+    assert registro() == []
+
+
+def test_administrador_degradado_no_perfila(admin_client, administrador, db_session, registro):
+    # El token aún dice is_admin, pero el usuario ya no lo es (o ya no existe)
+    headers = {"X-Profile": "1", "Authorization": f"Bearer {token(True)}"}
+    administrador.is_admin = False
+    db_session.commit()
+    assert "X-Profile-Id" not in admin_client.get("/orders/all", headers=headers).headers
+    db_session.delete(administrador)
+    db_session.commit()
+    assert "X-Profile-Id" not in admin_client.get("/orders/all", headers=headers).headers
+    assert registro() == []
+
+
+def test_muestreo(client, registro, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 1.0)
+    response = client.get("/healthz")
+    assert "X-Profile-Id" in response.headers
+    [entrada] = registro()
+    assert entrada["trigger"] == "sample"
+    assert entrada["statements"] == []
+
+
+def test_peticiones_y_consultas_lentas(admin_client, registro, monkeypatch):
+    monkeypatch.setattr(profiling, "SLOW_REQUEST_SECONDS", 0.0)
+    monkeypatch.setattr(profiling, "SLOW_QUERY_SECONDS", 0.0)
+    admin_client.get("/cart/7")
+
+    entradas = registro()
+    [lenta] = [e for e in entradas if e["type"] == "slow_request"]
+    assert lenta["route"] == "/cart/{user_id}"
+    assert lenta["path"] == "/cart/7"
+    assert lenta["db_queries"] >= 1
+    consultas = [e for e in entradas if e["type"] == "slow_query"]
+    assert consultas and all(c["request_id"] == lenta["request_id"] for c in consultas)
+    assert any("cart_items" in c["sql"] for c in consultas)
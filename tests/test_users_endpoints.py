@@ -0,0 +1,21 @@
+# tests/test_users_endpoints.py
+from fastapi import status
+from app import models
+
+
+def test_read_users_paginacion_y_campos(admin_client, db_session):
+    for i in range(3):
+        db_session.add(models.User(email=f"u{i}@test.com", password="hashed-password", username=f"usuario{i}", is_admin=(i == 0)))
+    db_session.commit()
+
+    response = admin_client.get("/?limit=2&fields=email")
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert [u["email"] for u in data] == ["u0@test.com", "u1@test.com"]
+    assert set(data[0]) == {"id", "email"}
+
+    response = admin_client.get(f"/?after={response.headers['X-Next-Cursor']}")
+    assert [u["username"] for u in response.json()] == ["usuario2"]
+
+    response = admin_client.get("/?is_admin=true")
+    assert [u["email"] for u in response.json()] == ["u0@test.com"]